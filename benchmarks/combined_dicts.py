@@ -0,0 +1,60 @@
+# coding: utf-8
+"""
+    benchmarks.combined_dicts
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares lookups, membership tests and :func:`len` of an indexed
+    :class:`brownie.datastructures.CombinedDict` with those of a plain one.
+
+    Run with ``python benchmarks/combined_dicts.py`` from the repository root.
+
+    :copyright: 2010-2011 by Daniel Neuhäuser
+    :license: BSD, see LICENSE.rst for details
+"""
+import os
+import sys
+from timeit import Timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from brownie.datastructures import CombinedDict
+
+
+DICTS = 5
+SIZE = 5000
+NUMBER = 100000
+
+
+def make_dicts():
+    return [
+        dict((i * SIZE + j, j) for j in xrange(SIZE)) for i in xrange(DICTS)
+    ]
+
+
+def measure(d, statement):
+    """Returns the time `statement` takes per execution in microseconds."""
+    timer = Timer(statement, 'from __main__ import d, key, missing')
+    namespace = sys.modules['__main__'].__dict__
+    namespace.update(d=d, key=(DICTS - 1) * SIZE, missing=-1)
+    number = NUMBER if statement != 'len(d)' else 100
+    return min(timer.repeat(3, number)) / number * 1e6
+
+
+def main():
+    dicts = make_dicts()
+    combined_dicts = [
+        ('plain', CombinedDict(dicts)),
+        ('indexed', CombinedDict(dicts, indexed=True))
+    ]
+    print '%d dicts, %d keys each' % (DICTS, SIZE)
+    print '%-16s %s' % ('workload', ''.join(
+        '%20s' % name for name, _ in combined_dicts
+    ))
+    for statement in ['d[key]', 'key in d', 'missing in d', 'len(d)']:
+        print '%-16s %s' % (statement, ''.join(
+            '%18.3fus' % measure(d, statement) for _, d in combined_dicts
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# coding: utf-8
+"""
+    benchmarks.counters
+    ~~~~~~~~~~~~~~~~~~~
+
+    Measures :class:`brownie.datastructures.Counter` updates and arithmetic
+    on inputs with millions of elements, compared to
+    :class:`collections.Counter` if available.
+
+    Run with ``python benchmarks/counters.py`` from the repository root.
+
+    :copyright: 2010-2011 by Daniel Neuhäuser
+    :license: BSD, see LICENSE.rst for details
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from brownie.datastructures import Counter
+
+
+SIZE = 3000000
+DISTINCT = 1000000
+
+
+def make_elements(size=SIZE):
+    random.seed(0)
+    return [random.randrange(DISTINCT) for _ in xrange(size)]
+
+
+def update_elements(counter_class, elements):
+    start = time.time()
+    counter_class(elements)
+    return time.time() - start
+
+
+def update_mapping(counter_class, elements):
+    counter = counter_class(elements)
+    start = time.time()
+    counter.update(counter)
+    return time.time() - start
+
+
+def binary_operation(operator):
+    def workload(counter_class, elements):
+        large = counter_class(elements)
+        small = counter_class(elements[:len(elements) // 100])
+        start = time.time()
+        operator(large, small)
+        operator(small, large)
+        return time.time() - start
+    workload.__name__ = operator.__name__.strip('_')
+    return workload
+
+
+def inplace_operation(operator):
+    def workload(counter_class, elements):
+        large = counter_class(elements)
+        small = counter_class(elements[:len(elements) // 100])
+        start = time.time()
+        operator(large, small)
+        return time.time() - start
+    workload.__name__ = operator.__name__.strip('_')
+    return workload
+
+
+def measure(counter_class, workload, elements, repeat=3):
+    return min(
+        workload(counter_class, elements) for _ in xrange(repeat)
+    )
+
+
+def main():
+    import operator
+    counter_classes = [Counter]
+    try:
+        from collections import Counter as StdlibCounter
+        counter_classes.append(StdlibCounter)
+    except ImportError:
+        pass
+    elements = make_elements()
+    workloads = [update_elements, update_mapping]
+    workloads.extend(map(binary_operation, [
+        operator.add, operator.sub, operator.or_, operator.and_
+    ]))
+    workloads.extend(map(inplace_operation, [
+        operator.iadd, operator.isub, operator.ior
+    ]))
+    print '%d elements, %d distinct' % (SIZE, DISTINCT)
+    print '%-16s %s' % ('workload', ''.join(
+        '%20s' % '%s.%s' % (cls.__module__.split('.')[0], cls.__name__)
+        for cls in counter_classes
+    ))
+    for workload in workloads:
+        print '%-16s %s' % (workload.__name__, ''.join(
+            '%19.3fs' % measure(cls, workload, elements)
+            for cls in counter_classes
+        ))
+
+
+if __name__ == '__main__':
+    main()
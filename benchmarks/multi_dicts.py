@@ -0,0 +1,58 @@
+# coding: utf-8
+"""
+    benchmarks.multi_dicts
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the speed of comparing :class:`brownie.datastructures.MultiDict`
+    and :class:`brownie.datastructures.FlatMultiDict` instances with that of
+    comparing plain dicts.
+
+    Run with ``python benchmarks/multi_dicts.py`` from the repository root.
+
+    :copyright: 2010-2011 by Daniel Neuhäuser
+    :license: BSD, see LICENSE.rst for details
+"""
+import os
+import sys
+from timeit import Timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from brownie.datastructures import MultiDict, FlatMultiDict
+
+
+NUMBER = 100000
+
+
+def make_items(size):
+    return [(key, key) for key in xrange(size)] + [(0, 1)]
+
+
+def measure(a, b):
+    """Returns the time ``a == b`` takes in microseconds."""
+    timer = Timer('a == b', 'from __main__ import a, b')
+    sys.modules['__main__'].__dict__.update(a=a, b=b)
+    return min(timer.repeat(3, NUMBER)) / NUMBER * 1e6
+
+
+def main():
+    sizes = [1, 10, 100]
+    print '%-28s %s' % ('comparison', ''.join(
+        '%12s' % ('%d keys' % size) for size in sizes
+    ))
+    comparisons = [
+        ('dict == dict', dict, dict),
+        ('MultiDict == MultiDict', MultiDict, MultiDict),
+        ('MultiDict == FlatMultiDict', MultiDict, FlatMultiDict),
+        ('FlatMultiDict == MultiDict', FlatMultiDict, MultiDict)
+    ]
+    for name, left, right in comparisons:
+        print '%-28s %s' % (name, ''.join(
+            '%10.3fus' % measure(
+                left(make_items(size)), right(make_items(size))
+            ) for size in sizes
+        ))
+
+
+if __name__ == '__main__':
+    main()
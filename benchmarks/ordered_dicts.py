@@ -0,0 +1,107 @@
+# coding: utf-8
+"""
+    benchmarks.ordered_dicts
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares memory usage and speed of
+    :class:`brownie.datastructures.CompactOrderedDict` with
+    :class:`brownie.datastructures.OrderedDict`.
+
+    Run with ``python benchmarks/ordered_dicts.py`` from the repository root.
+
+    :copyright: 2010-2011 by Daniel Neuhäuser
+    :license: BSD, see LICENSE.rst for details
+"""
+import os
+import gc
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from brownie.datastructures import OrderedDict, CompactOrderedDict
+
+
+SIZE = 100000
+
+
+def memory_usage(d):
+    """
+    Returns the number of bytes used by `d`, not counting the keys and values
+    themselves.
+    """
+    excluded = set(map(id, d.keys() + d.values()))
+    seen = set()
+    size = 0
+    pending = [d]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or id(obj) in excluded or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        pending.extend(gc.get_referents(obj))
+    return size
+
+
+def build(dict_class):
+    d = dict_class()
+    for key in xrange(SIZE):
+        d[key] = key
+    return d
+
+
+def iterate(dict_class):
+    d = build(dict_class)
+    start = time.time()
+    for _ in d.iteritems():
+        pass
+    return time.time() - start
+
+
+def move_to_end(dict_class):
+    """Moves every item to the end, like an LRU cache hit does."""
+    d = build(dict_class)
+    start = time.time()
+    for key in xrange(SIZE):
+        d.move_to_end(key)
+    return time.time() - start
+
+
+def popitem(dict_class):
+    """Pops every item from the beginning, like an LRU cache eviction does."""
+    d = build(dict_class)
+    start = time.time()
+    while d:
+        d.popitem(last=False)
+    return time.time() - start
+
+
+def construction(dict_class):
+    start = time.time()
+    build(dict_class)
+    return time.time() - start
+
+
+def measure(dict_class, workload, repeat=3):
+    return min(workload(dict_class) for _ in xrange(repeat))
+
+
+def main():
+    dict_classes = [OrderedDict, CompactOrderedDict]
+    print '%-16s %s' % ('workload', ''.join(
+        '%20s' % dict_class.__name__ for dict_class in dict_classes
+    ))
+    print '%-16s %s' % ('memory', ''.join(
+        '%18.1fMB' % (memory_usage(build(dict_class)) / 1024.0 ** 2)
+        for dict_class in dict_classes
+    ))
+    for workload in [construction, iterate, move_to_end, popitem]:
+        print '%-16s %s' % (workload.__name__, ''.join(
+            '%19.3fs' % measure(dict_class, workload)
+            for dict_class in dict_classes
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# coding: utf-8
+"""
+    benchmarks.parallel_pools
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares :class:`brownie.parallel.WorkStealingPool` with the shared queue
+    of :class:`brownie.parallel.ThreadPool`.
+
+    Run with ``python benchmarks/parallel_pools.py`` from the repository root.
+
+    :copyright: 2010-2011 by Daniel Neuhäuser
+    :license: BSD, see LICENSE.rst for details
+"""
+from __future__ import with_statement
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from brownie.parallel import ThreadPool, WorkStealingPool
+
+
+WORKERS = 8
+
+
+def tiny_tasks(pool):
+    """Lots of functions which do next to nothing."""
+    results = [pool.submit(int) for _ in xrange(20000)]
+    for result in results:
+        result.get()
+
+
+def skewed_tasks(pool):
+    """
+    Functions whose durations follow a heavy-tailed distribution, most take
+    no time at all while a few block for a while.
+    """
+    generator = random.Random(42)
+    durations = [
+        0.02 if generator.random() < 0.02 else 0
+        for _ in xrange(5000)
+    ]
+    results = [pool.submit(time.sleep, duration) for duration in durations]
+    for result in results:
+        result.get()
+
+
+def nested_tasks(pool):
+    """A tree of functions, each submitting its children to the pool."""
+    def node(depth):
+        if depth == 0:
+            time.sleep(0.001)
+            return 1
+        children = [pool.submit(node, depth - 1) for _ in xrange(4)]
+        return children
+
+    def count(value):
+        if isinstance(value, list):
+            return sum(count(result.get()) for result in value)
+        return value
+
+    count(pool.submit(node, 5).get())
+
+
+def measure(pool_class, workload, repeat=3):
+    timings = []
+    for _ in xrange(repeat):
+        with pool_class(WORKERS) as pool:
+            start = time.time()
+            workload(pool)
+            timings.append(time.time() - start)
+    return min(timings)
+
+
+def main():
+    pool_classes = [ThreadPool, WorkStealingPool]
+    print '%-16s %s' % ('workload', ''.join(
+        '%20s' % pool_class.__name__ for pool_class in pool_classes
+    ))
+    for workload in [tiny_tasks, skewed_tasks, nested_tasks]:
+        print '%-16s %s' % (workload.__name__, ''.join(
+            '%19.3fs' % measure(pool_class, workload)
+            for pool_class in pool_classes
+        ))
+
+
+if __name__ == '__main__':
+    main()
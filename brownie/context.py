@@ -11,34 +11,33 @@
     :license: BSD, see LICENSE.rst for details
 """
 from __future__ import with_statement
-import thread
 import threading
-from operator import itemgetter
+from functools import wraps
 from itertools import count
 
-from brownie.caching import LFUCache
 
-
-def _make_stack_methods(name, lockname, stackname):
+def _make_stack_methods(name, stackname, lockname=None):
     def push(self, obj):
         """
         Pushes the given object onto the %s stack.
         """
-        with getattr(self, lockname):
-            self._add_object(getattr(self, stackname), obj)
-            self._cache.clear()
+        context = getattr(self, stackname)
+        self._add_object(context, obj)
+        self._invalidate(context)
 
     def pop(self):
         """
         Pops and returns an object from the %s stack.
         """
-        with getattr(self, lockname):
-            stack = self._get_objects(getattr(self, stackname))
-            if stack is None:
-                raise RuntimeError('no objects on stack')
-            self._cache.clear()
-            return stack.pop()[1]
-
+        context = getattr(self, stackname)
+        stack = self._get_objects(context)
+        if not stack:
+            raise RuntimeError('no objects on stack')
+        self._invalidate(context)
+        return stack.pop()[1]
+
+    if lockname is not None:
+        push, pop = _locked(push, lockname), _locked(pop, lockname)
     push.__name__ = 'push_' + name
     push.__doc__ = push.__doc__ % name
     pop.__name__ = 'pop_' + name
@@ -46,6 +45,14 @@ def _make_stack_methods(name, lockname, stackname):
     return push, pop
 
 
+def _locked(method, lockname):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with getattr(self, lockname):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class ContextStackManagerBase(object):
     """
     Helper which manages context dependant stacks.
@@ -84,15 +91,25 @@ class ContextStackManagerBase(object):
 
     - :class:`ContextStackManagerThreadMixin`
     - :class:`ContextStackManagerEventletMixin`
+    - :class:`ContextStackManagerGeventMixin`
+    - :class:`ContextStackManagerContextVarMixin`
+
+    Mixins for other kinds of contexts can be created with
+    :func:`make_context_mixin`.
     """
-    def __init__(self, _object_cache_maxsize=256):
+    def __init__(self):
         self._application_stack = []
-        self._cache = LFUCache(maxsize=_object_cache_maxsize)
-        self._contexts = []
-        self._stackop = count().next
-
-    def _get_ident(self):
-        return ()
+        self._application_objects = []
+        self._application_lock = threading.Lock()
+        counter = count()
+        # contextvars, and with it ContextStackManagerContextVarMixin, are
+        # only available on Python 3
+        self._stackop = getattr(counter, 'next', None) or counter.__next__
+
+    def _invalidate(self, context):
+        # every change of a stack changes the version of the context it
+        # belongs to, which invalidates only the stacks that include it
+        context.version = self._stackop()
 
     def _make_item(self, obj):
         return self._stackop(), obj
@@ -108,57 +125,87 @@ class ContextStackManagerBase(object):
         else:
             objects.append(item)
 
+    def _merge_stack(self, context, base):
+        objects = self._get_objects(context) or ()
+        objects = [obj for _, obj in reversed(objects)]
+        objects.extend(base)
+        return objects
+
+    def _get_local_stack(self, context, base):
+        # the merged stack is stored on the context itself, a new list is
+        # created whenever it changes so that the contexts on top of it
+        # can detect changes by identity. As the stack lives and dies with
+        # the context, there is nothing to clean up once a thread or
+        # coroutine is gone and reused idents cannot see old stacks.
+        cached = getattr(context, 'stack', None)
+        if (
+            cached is None or
+            cached[0] is not base or
+            cached[1] != getattr(context, 'version', None)
+            ):
+            cached = context.stack = (
+                base,
+                getattr(context, 'version', None),
+                self._merge_stack(context, base)
+            )
+        return cached[2]
+
+    def _get_current_stack(self):
+        # mixins extend this by putting the objects of their context on top
+        # of the stack returned by the super class
+        return self._application_objects
+
     def iter_current_stack(self):
         """
         Returns an iterator over the items in the 'current' stack, ordered
         from top to bottom.
         """
-        ident = self._get_ident()
-        objects = self._cache.get(ident)
-        if objects is None:
-            objects = self._application_stack[:]
-            for context in self._contexts:
-                objects.extend(getattr(context, 'objects', ()))
-            objects.reverse()
-            self._cache[ident] = objects = map(itemgetter(1), objects)
-        return iter(objects)
+        return iter(self._get_current_stack())
 
     def push_application(self, obj):
         """
         Pushes the given object onto the application stack.
         """
-        self._application_stack.append(self._make_item(obj))
-        self._cache.clear()
+        # readers use _application_objects without locking, so it is replaced
+        # instead of being modified, writers need to be serialized though
+        with self._application_lock:
+            self._application_stack.append(self._make_item(obj))
+            self._application_objects = [
+                obj for _, obj in reversed(self._application_stack)
+            ]
 
     def pop_application(self):
         """
         Pops and returns an object from the application stack.
         """
-        if not self._application_stack:
-            raise RuntimeError('no objects on application stack')
-        self._cache.clear()
-        return self._application_stack.pop()[1]
+        with self._application_lock:
+            if not self._application_stack:
+                raise RuntimeError('no objects on application stack')
+            obj = self._application_stack.pop()[1]
+            self._application_objects = self._application_objects[1:]
+        return obj
 
 
 class ContextStackManagerThreadMixin(object):
     """
     A :class:`ContextStackManagerBase` mixin providing thread context support.
+
+    Each thread keeps its merged stack in thread local storage, it is only
+    rebuilt if the stack of that thread or the application stack changes.
+    Neither pushing, popping nor iterating over the current stack requires
+    any locking.
     """
     def __init__(self, *args, **kwargs):
         super(ContextStackManagerThreadMixin, self).__init__(*args, **kwargs)
         self._thread_context = threading.local()
-        self._contexts.append(self._thread_context)
-        self._thread_lock = threading.Lock()
 
-    def _get_ident(self):
-        return super(
-            ContextStackManagerThreadMixin,
-            self
-        )._get_ident() + (thread.get_ident(), )
+    def _get_current_stack(self):
+        return self._get_local_stack(
+            self._thread_context,
+            super(ContextStackManagerThreadMixin, self)._get_current_stack()
+        )
 
-    push_thread, pop_thread = _make_stack_methods(
-        'thread', '_thread_lock', '_thread_context'
-    )
+    push_thread, pop_thread = _make_stack_methods('thread', '_thread_context')
 
 
 class ContextStackManagerEventletMixin(object):
@@ -179,22 +226,170 @@ class ContextStackManagerEventletMixin(object):
                 self.__class__.__name__
             )
         self._coroutine_context = local()
-        self._contexts.append(self._coroutine_context)
         self._coroutine_lock = BoundedSemaphore()
 
-    def _get_ident(self):
-        from eventlet.corolocal import get_ident
-        return super(
-            ContextStackManagerEventletMixin,
-            self
-        )._get_ident() + (get_ident(), )
+    def _get_current_stack(self):
+        return self._get_local_stack(
+            self._coroutine_context,
+            super(ContextStackManagerEventletMixin, self)._get_current_stack()
+        )
 
     push_coroutine, pop_coroutine = _make_stack_methods(
-        'coroutine', '_coroutine_lock', '_coroutine_context'
+        'coroutine', '_coroutine_context', '_coroutine_lock'
+    )
+
+
+class ContextStackManagerGeventMixin(object):
+    """
+    A :class:`ContextStackManagerBase` mixin providing greenlet context
+    support using gevent_.
+
+    .. _gevent: http://www.gevent.org
+    """
+    def __init__(self, *args, **kwargs):
+        super(ContextStackManagerGeventMixin, self).__init__(*args, **kwargs)
+        try:
+            from gevent.local import local
+        except ImportError:
+            raise RuntimeError(
+                'the gevent library is required for %s' %
+                self.__class__.__name__
+            )
+        self._greenlet_context = local()
+
+    def _get_current_stack(self):
+        return self._get_local_stack(
+            self._greenlet_context,
+            super(ContextStackManagerGeventMixin, self)._get_current_stack()
+        )
+
+    push_greenlet, pop_greenlet = _make_stack_methods(
+        'greenlet', '_greenlet_context'
+    )
+
+
+def make_context_mixin(name, local, lock=None):
+    """
+    Returns a :class:`ContextStackManagerBase` mixin providing support for
+    an arbitrary kind of execution context, with `push_<name>` and
+    `pop_<name>` methods operating on the stack of the current context.
+
+    :param name:
+        The name of the context, used for the names of the methods.
+
+    :param local:
+        A callable returning an object whose attributes are local to the
+        current context, like :class:`threading.local` for threads.
+
+    :param lock:
+        An optional callable returning a lock which is acquired during
+        pushing and popping. This is only necessary if the object returned
+        by `local` does not already isolate concurrently running contexts.
+
+    ::
+
+        from gevent.local import local
+
+        ContextStackManagerGreenletMixin = make_context_mixin(
+            'greenlet', local
+        )
+
+    .. versionadded:: 0.6
+    """
+    contextname = '_%s_context' % name
+    lockname = None if lock is None else '_%s_lock' % name
+
+    class ContextStackManagerMixin(object):
+        def __init__(self, *args, **kwargs):
+            super(ContextStackManagerMixin, self).__init__(*args, **kwargs)
+            setattr(self, contextname, local())
+            if lock is not None:
+                setattr(self, lockname, lock())
+
+        def _get_current_stack(self):
+            return self._get_local_stack(
+                getattr(self, contextname),
+                super(ContextStackManagerMixin, self)._get_current_stack()
+            )
+
+    push, pop = _make_stack_methods(name, contextname, lockname)
+    setattr(ContextStackManagerMixin, push.__name__, push)
+    setattr(ContextStackManagerMixin, pop.__name__, pop)
+    ContextStackManagerMixin.__name__ = 'ContextStackManager%sMixin' % (
+        name.title().replace('_', '')
     )
+    return ContextStackManagerMixin
+
+
+class _ContextVarStack(object):
+    # immutable, a new stack is created on every change which is why the
+    # merged stack can be stored on it
+    __slots__ = 'objects', 'stack'
+
+    def __init__(self, objects=()):
+        self.objects = objects
+
+
+class ContextStackManagerContextVarMixin(object):
+    """
+    A :class:`ContextStackManagerBase` mixin providing :mod:`contextvars`
+    context support, which makes stacks local to :mod:`asyncio` tasks.
+
+    The stack is stored in a :class:`contextvars.ContextVar` and copied on
+    every change, so a task started by another one sees the objects its
+    parent had pushed at that point but changes of either are invisible to
+    the other. As no stack is ever modified in place, no lock is required.
+
+    Requires Python 3.7 or later.
+    """
+    def __init__(self, *args, **kwargs):
+        super(ContextStackManagerContextVarMixin, self).__init__(
+            *args, **kwargs
+        )
+        try:
+            from contextvars import ContextVar
+        except ImportError:
+            raise RuntimeError(
+                'the contextvars module is required for %s' %
+                self.__class__.__name__
+            )
+        self._context_variable = ContextVar(
+            'brownie.context.%s' % self.__class__.__name__, default=None
+        )
+
+    def _get_current_stack(self):
+        base = super(
+            ContextStackManagerContextVarMixin,
+            self
+        )._get_current_stack()
+        stack = self._context_variable.get()
+        if stack is None:
+            return base
+        return self._get_local_stack(stack, base)
+
+    def push_context(self, obj):
+        """
+        Pushes the given object onto the context stack.
+        """
+        stack = self._context_variable.get()
+        objects = () if stack is None else stack.objects
+        self._context_variable.set(
+            _ContextVarStack(objects + (self._make_item(obj), ))
+        )
+
+    def pop_context(self):
+        """
+        Pops and returns an object from the context stack.
+        """
+        stack = self._context_variable.get()
+        if stack is None or not stack.objects:
+            raise RuntimeError('no objects on stack')
+        self._context_variable.set(_ContextVarStack(stack.objects[:-1]))
+        return stack.objects[-1][1]
 
 
 __all__ = [
     'ContextStackManagerBase', 'ContextStackManagerThreadMixin',
-    'ContextStackManagerEventletMixin'
+    'ContextStackManagerEventletMixin', 'ContextStackManagerGeventMixin',
+    'ContextStackManagerContextVarMixin', 'make_context_mixin'
 ]
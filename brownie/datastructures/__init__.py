@@ -79,7 +79,10 @@ __all__ = [
     'OrderedMultiDict', 'ImmutableDict', 'ImmutableMultiDict',
     'ImmutableOrderedDict', 'ImmutableOrderedMultiDict', 'CombinedDict',
     'CombinedMultiDict', 'LazyList', 'OrderedSet', 'SetQueue', 'namedtuple',
-    'FixedDict', 'PeekableIterator', 'StackedObject'
+    'FixedDict', 'PeekableIterator', 'StackedObject', 'PrefetchingLazyList',
+    'CompactOrderedDict', 'FlatMultiDict', 'LayeredDict',
+    'PersistentDict', 'PersistentDictEvolver', 'HeavyHittersCounter',
+    'CountMinSketch', 'HyperLogLog'
 ]
 
 # circular imports
@@ -6,9 +6,12 @@
     :copyright: 2010-2011 by Daniel Neuhäuser
     :license: BSD, see LICENSE.rst for details
 """
+import math
+from array import array
 from heapq import nlargest
-from operator import itemgetter
-from itertools import izip, repeat, ifilter
+from urllib import unquote_plus
+from operator import itemgetter, add, sub
+from itertools import izip, imap, repeat, count, islice
 
 from brownie.itools import chain, unique, starmap
 from brownie.abstract import AbstractClassMeta
@@ -63,18 +66,64 @@ class ImmutableDictMixin(object):
         return '%s(%s)' % (self.__class__.__name__, content)
 
 
-class ImmutableDict(ImmutableDictMixin, dict):
+class CachedHashMixin(object):
+    """
+    Caches the hash returned by :meth:`_compute_hash` on the instance, which
+    must not change afterwards, and uses it to quickly tell instances of the
+    same class apart on comparison.
+
+    The cached hash is not pickled, as hashes may differ between processes.
+    """
+    _hash = None
+
+    def _compute_hash(self):
+        return hash(frozenset(self.iteritems()))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_hash', None)
+        return state
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = self._compute_hash()
+        return self._hash
+
+    def _has_different_hash(self, other):
+        return (
+            other.__class__ is self.__class__ and
+            self._hash is not None and
+            other._hash is not None and
+            self._hash != other._hash
+        )
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if self._has_different_hash(other):
+            return False
+        return super(CachedHashMixin, self).__eq__(other)
+
+    def __ne__(self, other):
+        if self is other:
+            return False
+        if self._has_different_hash(other):
+            return True
+        return super(CachedHashMixin, self).__ne__(other)
+
+
+class ImmutableDict(ImmutableDictMixin, CachedHashMixin, dict):
     """
     An immutable :class:`dict`.
 
     .. versionadded:: 0.5
        :class:`ImmutableDict` is now hashable, given the content is.
+
+    .. versionchanged:: 0.6
+       The hash is only computed once.
     """
     __metaclass__ = AbstractClassMeta
 
-    def __hash__(self):
-        return hash(tuple(self.items()))
-
 
 class CombinedDictMixin(object):
     @classmethod
@@ -83,23 +132,98 @@ class CombinedDictMixin(object):
             cls.__class__.__name__
         )
 
-    def __init__(self, dicts=None):
+    @classmethod
+    def _from_items(cls, items):
+        raise TypeError('cannot create %r instances from items' %
+            cls.__name__
+        )
+
+    def __init__(self, dicts=None, indexed=False):
         #: The list of combined dictionaries.
         self.dicts = [] if dicts is None else list(dicts)
+        #: ``True`` if lookups use an index of the keys.
+        self.indexed = indexed
+        self.invalidate()
+
+    def _build_index(self, lengths=None):
+        index = {}
+        for d in reversed(self.dicts):
+            index.update(izip(d.iterkeys(), repeat(d)))
+        self._index = index
+        self._keys = list(
+            unique(chain.from_iterable(d.iterkeys() for d in self.dicts))
+        )
+        self._dicts = self.dicts[:]
+        self._lengths = map(len, self.dicts) if lengths is None else lengths
+
+    def _get_index(self):
+        # the index and the cached keys are valid as long as the same dicts
+        # with the same sizes are combined, comparing identical dicts does not
+        # compare their content
+        lengths = map(len, self.dicts)
+        if self.dicts != self._dicts or lengths != self._lengths:
+            self._build_index(lengths)
+        return self._index
+
+    def _lookup(self, key):
+        # returns the dict `key` is taken from or `None`
+        if self.dicts != self._dicts:
+            self._build_index()
+        d = self._index.get(key)
+        if d is not None and key in d:
+            return d
+        # the index missed `key` or is stale, search the dicts directly and
+        # rebuild the index the next time it is used if it turns out to be
+        # stale, so that missing keys do not cause a rebuild
+        for candidate in self.dicts:
+            if key in candidate:
+                self.invalidate()
+                return candidate
+        if d is not None:
+            self.invalidate()
+
+    def invalidate(self):
+        """
+        Discards the index of the keys, use this if you replaced keys in one
+        of the :attr:`dicts` without changing its size or added a key to one
+        of them which is also in a later one.
+
+        .. versionadded:: 0.6
+        """
+        self._index = self._keys = self._dicts = self._lengths = None
 
     def __getitem__(self, key):
+        if self.indexed:
+            # avoids calling _lookup() for keys found by the index
+            if self.dicts == self._dicts:
+                try:
+                    d = self._index[key]
+                    if key in d:
+                        return d[key]
+                except KeyError:
+                    pass
+            d = self._lookup(key)
+            if d is None:
+                raise KeyError(key)
+            return d[key]
         for d in self.dicts:
             if key in d:
                 return d[key]
         raise KeyError(key)
 
     def get(self, key, default=None):
+        if self.indexed:
+            d = self._lookup(key)
+            return default if d is None else d[key]
         try:
             return self[key]
         except KeyError:
             return default
 
     def __iter__(self):
+        if self.indexed:
+            self._get_index()
+            return iter(self._keys)
         return unique(chain.from_iterable(d.iterkeys() for d in self.dicts))
 
     iterkeys = __iter__
@@ -122,9 +246,13 @@ class CombinedDictMixin(object):
         return list(self.iteritems())
 
     def __len__(self):
+        if self.indexed:
+            return len(self._get_index())
         return len(self.keys())
 
     def __contains__(self, key):
+        if self.indexed:
+            return self._lookup(key) is not None
         return any(key in d for d in self.dicts)
 
     has_key = __contains__
@@ -142,8 +270,23 @@ class CombinedDict(CombinedDictMixin, ImmutableDictMixin, dict):
     interfaces as provided by e.g. :class:`MultiDict` or :class:`Counter` are
     not supported, the same goes for additional keyword arguments.
 
+    If `indexed` is ``True`` an index mapping each key to the dict it is
+    taken from is kept together with the keys, which makes looking up keys
+    contained in one of the dicts and :func:`len` independent of the number
+    of dicts and keys, missing keys are still searched for in every dict.
+    The index is rebuilt whenever :attr:`dicts` changes, :func:`len`
+    and iteration also rebuild it if the size of one of the dicts changed.
+    Lookups notice keys added to or removed from the dicts on their own,
+    unless an added key is also in a later dict; call :meth:`invalidate`
+    after such a change or after replacing keys without changing the size
+    of a dict, otherwise lookups may return the value from the later dict
+    and :func:`len` or iteration may be outdated.
+
     .. versionadded:: 0.2
 
+    .. versionadded:: 0.6
+       The `indexed` argument.
+
     .. versionadded:: 0.5
        :class:`CombinedDict` is now hashable, given the content is.
     """
@@ -154,7 +297,201 @@ class CombinedDict(CombinedDictMixin, ImmutableDictMixin, dict):
         return hash(tuple(self.dicts))
 
 
+class LayeredDict(CombinedDictMixin, dict):
+    """
+    A :class:`dict` which combines the given `dicts` into layers, like
+    :class:`CombinedDict`, but which can be changed.
+
+    Any change is made to the first dict, the top layer, while the others
+    are never changed and can therefore be shared. If no `dicts` are given
+    an empty top layer is created.
+
+    This allows you to cheaply override e.g. settings, for each request or
+    task only the overrides have to be stored::
+
+        >>> defaults = ImmutableDict({'debug': False, 'timeout': 10})
+        >>> settings = LayeredDict([{}, defaults])
+        >>> settings['debug'] = True
+        >>> settings['debug'], settings['timeout']
+        (True, 10)
+        >>> defaults['debug']
+        False
+
+    Removing keys which exist only in lower layers is not possible,
+    :meth:`__delitem__`, :meth:`pop` and :meth:`popitem` raise a
+    :exc:`KeyError` for them.
+
+    .. versionadded:: 0.6
+    """
+    __hash__ = None
+
+    def __init__(self, dicts=None, indexed=False):
+        CombinedDictMixin.__init__(self, dicts or [{}], indexed)
+
+    def new_child(self, d=None):
+        """
+        Returns a new :class:`LayeredDict` with `d`, or a new empty dict, as
+        top layer on top of the layers of this one.
+        """
+        return self.__class__(
+            [{} if d is None else d] + self.dicts, self.indexed
+        )
+
+    @property
+    def parents(self):
+        """
+        A new :class:`LayeredDict` with all layers but the top one.
+        """
+        return self.__class__(self.dicts[1:] or None, self.indexed)
+
+    def __setitem__(self, key, value):
+        self.dicts[0][key] = value
+
+    def __delitem__(self, key):
+        try:
+            del self.dicts[0][key]
+        except KeyError:
+            raise KeyError('key not found in the top layer: %r' % (key, ))
+        if self.indexed:
+            self.invalidate()
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def update(self, *args, **kwargs):
+        self.dicts[0].update(*args, **kwargs)
+
+    def pop(self, key, default=missing):
+        try:
+            value = self.dicts[0].pop(key)
+        except KeyError:
+            if default is missing:
+                raise KeyError('key not found in the top layer: %r' % (key, ))
+            return default
+        if self.indexed:
+            self.invalidate()
+        return value
+
+    def popitem(self):
+        try:
+            item = self.dicts[0].popitem()
+        except KeyError:
+            raise KeyError('top layer is empty')
+        if self.indexed:
+            self.invalidate()
+        return item
+
+    def clear(self):
+        """
+        Removes all items from the top layer.
+        """
+        self.dicts[0].clear()
+        if self.indexed:
+            self.invalidate()
+
+    def copy(self):
+        """
+        Returns a copy with a copy of the top layer, the other layers are
+        shared.
+        """
+        return self.__class__(
+            [self.dicts[0].copy()] + self.dicts[1:], self.indexed
+        )
+
+    def __eq__(self, other):
+        if isinstance(other, CombinedDictMixin):
+            other = dict(other.iteritems())
+        return dict(self.iteritems()) == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+def _iter_urlencoded(data, separator, charset, errors):
+    for pair in data.split(separator):
+        if not pair:
+            continue
+        key, _, value = pair.partition('=')
+        # unquoting is comparatively expensive and most keys and values do
+        # not need it
+        if '%' in key or '+' in key:
+            key = unquote_plus(key)
+        if '%' in value or '+' in value:
+            value = unquote_plus(value)
+        if charset is not None:
+            key = key.decode(charset, errors)
+            value = value.decode(charset, errors)
+        yield key, value
+
+
+def _iter_headers(data):
+    name = value = None
+    for line in data.splitlines():
+        if not line:
+            break
+        if line[0] in ' \t':
+            if name is None:
+                raise ValueError('continuation line without header: %r' % line)
+            value += ' ' + line.strip()
+            continue
+        if name is not None:
+            yield name, value
+        name, colon, value = line.partition(':')
+        if not colon:
+            raise ValueError('invalid header line: %r' % line)
+        name = name.strip()
+        value = value.strip()
+    if name is not None:
+        yield name, value
+
+
 class MultiDictMixin(object):
+    @classmethod
+    def from_urlencoded(cls, data, separator='&', charset=None,
+                        errors='strict'):
+        """
+        Returns a dict with the items of the given
+        ``application/x-www-form-urlencoded`` `data`, as found in query
+        strings or form submissions, in the order they appear in.
+
+        If a `charset` is given keys and values are decoded using it,
+        `errors` is passed on to :meth:`str.decode`.
+
+        .. versionadded:: 0.6
+        """
+        return cls._from_items(
+            _iter_urlencoded(data, separator, charset, errors)
+        )
+
+    @classmethod
+    def from_headers(cls, data):
+        """
+        Returns a dict with the headers in the given :rfc:`822` style header
+        block, as used by HTTP and email, in the order they appear in.
+
+        Folded headers are unfolded and parsing stops at the first empty
+        line. Raises :exc:`ValueError` if a line is not a valid header.
+
+        .. versionadded:: 0.6
+        """
+        return cls._from_items(_iter_headers(data))
+
+    @classmethod
+    def _from_items(cls, items):
+        result = cls()
+        storage = super(MultiDictMixin, result)
+        get, setitem = storage.get, storage.__setitem__
+        for key, value in items:
+            values = get(key)
+            if values is None:
+                setitem(key, [value])
+            else:
+                values.append(value)
+        return result
+
     def __init__(self, *args, **kwargs):
         if len(args) > 1:
             raise TypeError(
@@ -352,6 +689,19 @@ class MultiDictMixin(object):
             for key, value in iter_multi_items(mapping):
                 MultiDictMixin.add(self, key, value)
 
+    def __eq__(self, other):
+        # only used by multi dicts comparing in Python anyway, MultiDict
+        # compares in C; a FlatMultiDict stores values differently, so it has
+        # to do the comparison
+        if isinstance(other, FlatMultiDict):
+            return other.__eq__(self)
+        return super(MultiDictMixin, self).__eq__(other)
+
+    def __ne__(self, other):
+        if isinstance(other, FlatMultiDict):
+            return other.__ne__(self)
+        return super(MultiDictMixin, self).__ne__(other)
+
 
 class MultiDict(MultiDictMixin, dict):
     """
@@ -366,12 +716,277 @@ class MultiDict(MultiDictMixin, dict):
     """
     __metaclass__ = AbstractClassMeta
 
+    # compares the lists in C, FlatMultiDict is a subclass so Python lets it
+    # do the comparison if it is the other operand
+    __eq__ = dict.__eq__
+    __ne__ = dict.__ne__
+
     def __repr__(self):
         content = dict.__repr__(self) if self else ''
         return '%s(%s)' % (self.__class__.__name__, content)
 
 
+class _Values(list):
+    # multiple values of a key in a FlatMultiDict, distinguishes them from a
+    # single value which happens to be a list
+    __slots__ = ()
+
+
+class FlatMultiDict(MultiDict):
+    """
+    A :class:`MultiDict` which stores single values directly instead of in a
+    :class:`list`, a list is only created once a second value is added for
+    a key.
+
+    This makes the dictionary considerably cheaper to create and smaller,
+    if most keys have a single value as it is the case for e.g. HTTP headers
+    or form data.
+
+    Unlike with :class:`MultiDict` the lists returned by :meth:`getlist`
+    and :meth:`setlistdefault` are copies, changing them does not change
+    the dictionary.
+
+    .. versionadded:: 0.6
+    """
+    @classmethod
+    def _from_items(cls, items):
+        result = cls()
+        add = result.add
+        for key, value in items:
+            add(key, value)
+        return result
+
+    def __init__(self, *args, **kwargs):
+        if len(args) > 1:
+            raise TypeError(
+                'expected at most 1 argument, got %d' % len(args)
+            )
+        dict.__init__(self)
+        if args:
+            mapping = args[0]
+            if hasattr(mapping, 'iterlists'):
+                for key, values in mapping.iterlists():
+                    FlatMultiDict.setlist(self, key, values)
+            elif hasattr(mapping, 'iteritems'):
+                for key, value in mapping.iteritems():
+                    if isinstance(value, (tuple, list)):
+                        FlatMultiDict.setlist(self, key, value)
+                    else:
+                        dict.__setitem__(self, key, value)
+            else:
+                add = FlatMultiDict.add
+                for key, value in mapping:
+                    add(self, key, value)
+        for key, value in kwargs.iteritems():
+            if isinstance(value, (tuple, list)):
+                FlatMultiDict.setlist(self, key, value)
+            else:
+                dict.__setitem__(self, key, value)
+
+    def __getitem__(self, key):
+        """
+        Returns the first value associated with the given `key`. If no value
+        is found a :exc:`KeyError` is raised.
+        """
+        value = dict.__getitem__(self, key)
+        if value.__class__ is _Values:
+            return value[0]
+        return value
+
+    def __setitem__(self, key, value):
+        """
+        Sets the values associated with the given `key` to ``[value]``.
+        """
+        dict.__setitem__(self, key, value)
+
+    def add(self, key, value):
+        """
+        Adds the `value` for the given `key`.
+        """
+        if key in self:
+            values = dict.__getitem__(self, key)
+            if values.__class__ is _Values:
+                values.append(value)
+            else:
+                dict.__setitem__(self, key, _Values([values, value]))
+        else:
+            dict.__setitem__(self, key, value)
+
+    def getlist(self, key):
+        """
+        Returns the :class:`list` of values for the given `key`. If there are
+        none an empty :class:`list` is returned.
+        """
+        try:
+            value = dict.__getitem__(self, key)
+        except KeyError:
+            return []
+        if value.__class__ is _Values:
+            return list(value)
+        return [value]
+
+    def setlist(self, key, values):
+        """
+        Sets the values associated with the given `key` to the given `values`.
+        """
+        values = _Values(values)
+        if len(values) == 1:
+            dict.__setitem__(self, key, values[0])
+        else:
+            dict.__setitem__(self, key, values)
+
+    def setdefault(self, key, default=None):
+        """
+        Returns the value for the `key` if it is in the dict, otherwise returns
+        `default` and sets that value for the `key`.
+        """
+        if key not in self:
+            dict.__setitem__(self, key, default)
+            return default
+        return FlatMultiDict.__getitem__(self, key)
+
+    def setlistdefault(self, key, default_list=None):
+        """
+        Like :meth:`setdefault` but sets multiple values and returns the list
+        associated with the `key`.
+        """
+        if key not in self:
+            FlatMultiDict.setlist(self, key, default_list or (None, ))
+        return FlatMultiDict.getlist(self, key)
+
+    def iteritems(self, multi=False):
+        """Like :meth:`items` but returns an iterator."""
+        for key, value in dict.iteritems(self):
+            if value.__class__ is _Values:
+                if multi:
+                    for value in value:
+                        yield key, value
+                else:
+                    yield key, value[0]
+            else:
+                yield key, value
+
+    def itervalues(self):
+        """Like :meth:`values` but returns an iterator."""
+        for value in dict.itervalues(self):
+            if value.__class__ is _Values:
+                yield value[0]
+            else:
+                yield value
+
+    def iterlists(self):
+        """Like :meth:`lists` but returns an iterator."""
+        for key, value in dict.iteritems(self):
+            if value.__class__ is _Values:
+                yield key, list(value)
+            else:
+                yield key, [value]
+
+    def iterlistvalues(self):
+        """Like :meth:`listvalues` but returns an iterator."""
+        for value in dict.itervalues(self):
+            if value.__class__ is _Values:
+                yield list(value)
+            else:
+                yield [value]
+
+    def pop(self, key, default=missing):
+        """
+        Returns the first value associated with the given `key` and removes
+        the item.
+        """
+        try:
+            value = dict.pop(self, key)
+        except KeyError:
+            if default is missing:
+                raise
+            return default
+        if value.__class__ is _Values:
+            return value[0]
+        return value
+
+    def popitem(self):
+        """
+        Returns a key and the first associated value. The item is removed.
+        """
+        key, value = dict.popitem(self)
+        if value.__class__ is _Values:
+            return key, value[0]
+        return key, value
+
+    def poplist(self, key):
+        """
+        Returns the :class:`list` of values associated with the given `key`,
+        if the `key` does not exist in the :class:`MultiDict` an empty list is
+        returned.
+        """
+        value = dict.pop(self, key, missing)
+        if value is missing:
+            return []
+        elif value.__class__ is _Values:
+            return list(value)
+        return [value]
+
+    def popitemlist(self):
+        """Like :meth:`popitem` but returns all associated values."""
+        key, value = dict.popitem(self)
+        if value.__class__ is _Values:
+            return key, list(value)
+        return key, [value]
+
+    def update(self, *args, **kwargs):
+        """
+        Extends the dict using the given mapping and/or keyword arguments.
+        """
+        if len(args) > 1:
+            raise TypeError(
+                'expected at most 1 argument, got %d' % len(args)
+            )
+        mappings = [args[0] if args else [], kwargs.iteritems()]
+        for mapping in mappings:
+            if hasattr(mapping, 'iterlists'):
+                mapping = (
+                    (key, value) for key, values in mapping.iterlists()
+                    for value in values
+                )
+            else:
+                mapping = iter_multi_items(mapping)
+            for key, value in mapping:
+                FlatMultiDict.add(self, key, value)
+
+    def copy(self):
+        """
+        Returns a shallow copy of the dict.
+        """
+        return self.__class__(self)
+
+    def __eq__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        if hasattr(other, 'iterlists'):
+            other = dict(other.iterlists())
+        return dict(self.iterlists()) == other
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        content = ', '.join(
+            '%r: %r' % item for item in FlatMultiDict.iterlists(self)
+        )
+        return '%s(%s)' % (
+            self.__class__.__name__, '{%s}' % content if content else ''
+        )
+
+
 class ImmutableMultiDictMixin(ImmutableDictMixin, MultiDictMixin):
+    @classmethod
+    def _from_items(cls, items):
+        return cls(list(items))
+
     def add(self, key, value):
         raise_immutable(self)
 
@@ -388,19 +1003,24 @@ class ImmutableMultiDictMixin(ImmutableDictMixin, MultiDictMixin):
         raise_immutable(self)
 
 
-class ImmutableMultiDict(ImmutableMultiDictMixin, dict):
+class ImmutableMultiDict(ImmutableMultiDictMixin, CachedHashMixin, dict):
     """
     An immutable :class:`MultiDict`.
 
     .. versionadded:: 0.5
        :class:`ImmutableMultiDict` is now hashable, given the content is.
+
+    .. versionchanged:: 0.6
+       The hash is only computed once.
     """
     __metaclass__ = AbstractClassMeta
 
     virtual_superclasses = (MultiDict, ImmutableDict)
 
-    def __hash__(self):
-        return hash(tuple((key, tuple(value)) for key, value in self.lists()))
+    def _compute_hash(self):
+        return hash(frozenset(
+            (key, tuple(values)) for key, values in self.iterlists()
+        ))
 
 
 class CombinedMultiDict(CombinedDictMixin, ImmutableMultiDictMixin, dict):
@@ -408,6 +1028,9 @@ class CombinedMultiDict(CombinedDictMixin, ImmutableMultiDictMixin, dict):
     An :class:`ImmutableMultiDict` which combines the given `dicts` into one.
 
     .. versionadded:: 0.2
+
+    .. versionadded:: 0.6
+       The `indexed` argument, see :class:`CombinedDict`.
     """
     __metaclass__ = AbstractClassMeta
 
@@ -652,14 +1275,279 @@ class OrderedDict(dict):
         return '%s(%s)' % (self.__class__.__name__, content)
 
 
-class ImmutableOrderedDict(ImmutableDictMixin, OrderedDict):
-    """
-    An immutable :class:`OrderedDict`.
+#: Marks the position of a deleted or moved key in
+#: :class:`CompactOrderedDict`.
+_deleted = object()
 
-    .. versionadded:: 0.2
+
+class CompactOrderedDict(dict):
+    """
+    A :class:`dict` which remembers insertion order, like
+    :class:`OrderedDict`, using less memory.
+
+    Instead of a linked list with an object per key, the keys are kept in a
+    list, deleted or moved keys leave a placeholder behind which is removed
+    once there are more placeholders than items. Keys moved to the
+    beginning are kept in a second list, in reverse order.
+
+    Big-O times for every operation are amortized equal to the ones
+    :class:`dict` has, construction and iteration are faster than with
+    :class:`OrderedDict` while :meth:`move_to_end` is slower.
+
+    .. versionadded:: 0.6
+    """
+    @classmethod
+    def fromkeys(cls, iterable, value=None):
+        """
+        Returns a :class:`CompactOrderedDict` with keys from the given
+        `iterable` and `value` as value for each item.
+        """
+        return cls(izip(iterable, repeat(value)))
+
+    def __init__(self, *args, **kwargs):
+        if len(args) > 1:
+            raise TypeError(
+                'expected at most 1 argument, got %d' % len(args)
+            )
+        self._reset()
+        CompactOrderedDict.update(self, *args, **kwargs)
+
+    def _reset(self, keys=None):
+        self._keys = [] if keys is None else keys
+        # keys moved to the beginning, in reversed order
+        self._head = []
+        # maps keys to their position, positions in the head are negative
+        self._positions = dict(izip(self._keys, count()))
+        # number of leading placeholders in the keys
+        self._start = 0
+        self._placeholders = 0
+
+    def _append(self, key):
+        self._positions[key] = len(self._keys)
+        self._keys.append(key)
+
+    def _remove(self, key):
+        position = self._positions.pop(key)
+        if position < 0:
+            self._head[-position - 1] = _deleted
+        else:
+            self._keys[position] = _deleted
+        self._placeholders += 1
+        if self._placeholders > len(self._positions):
+            self._reset(list(CompactOrderedDict.__iter__(self)))
+
+    def _trim(self):
+        # removes the placeholders at the end of the lists and skips those
+        # at the beginning of the keys, which popitem() leaves behind
+        head, keys = self._head, self._keys
+        while head and head[-1] is _deleted:
+            head.pop()
+            self._placeholders -= 1
+        while keys and keys[-1] is _deleted:
+            keys.pop()
+            self._placeholders -= 1
+        self._start = min(self._start, len(keys))
+        while self._start < len(keys) and keys[self._start] is _deleted:
+            self._start += 1
+
+    def __setitem__(self, key, value):
+        """
+        Sets the item with the given `key` to the given `value`.
+        """
+        if key not in self:
+            self._append(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        """
+        Deletes the item with the given `key`.
+        """
+        dict.__delitem__(self, key)
+        self._remove(key)
+
+    def setdefault(self, key, default=None):
+        """
+        Returns the value of the item with the given `key`, if not existant
+        sets creates an item with the `default` value.
+        """
+        if key not in self:
+            CompactOrderedDict.__setitem__(self, key, default)
+        return dict.__getitem__(self, key)
+
+    def pop(self, key, default=missing):
+        """
+        Deletes the item with the given `key` and returns the value. If the
+        item does not exist a :exc:`KeyError` is raised unless `default` is
+        given.
+        """
+        try:
+            value = dict.__getitem__(self, key)
+        except KeyError:
+            if default is missing:
+                raise
+            return default
+        CompactOrderedDict.__delitem__(self, key)
+        return value
+
+    def popitem(self, last=True):
+        """
+        Pops the last or first item from the dict depending on `last`.
+        """
+        if not self:
+            raise KeyError('dict is empty')
+        self._trim()
+        if last:
+            if self._keys:
+                key = self._keys[-1]
+            else:
+                key = CompactOrderedDict.__reversed__(self).next()
+        elif self._head:
+            key = self._head[-1]
+        else:
+            key = self._keys[self._start]
+        value = dict.pop(self, key)
+        self._remove(key)
+        return key, value
+
+    def move_to_end(self, key, last=True):
+        """
+        Moves the item with the given `key` to the end of the dictionary if
+        `last` is ``True`` otherwise to the beginning.
+
+        Raises :exc:`KeyError` if no item with the given `key` exists.
+        """
+        position = self._positions[key]
+        if last and position == len(self._keys) - 1:
+            return
+        self._remove(key)
+        if last:
+            self._append(key)
+        else:
+            self._head.append(key)
+            self._positions[key] = -len(self._head)
+
+    def update(self, *args, **kwargs):
+        """
+        Updates the dictionary with a mapping and/or from keyword arguments.
+        """
+        if len(args) > 1:
+            raise TypeError(
+                'expected at most 1 argument, got %d' % len(args)
+            )
+        mappings = []
+        if args:
+            if hasattr(args[0], 'iteritems'):
+                mappings.append(args[0].iteritems())
+            else:
+                mappings.append(args[0])
+        mappings.append(kwargs.iteritems())
+        for mapping in mappings:
+            for key, value in mapping:
+                CompactOrderedDict.__setitem__(self, key, value)
+
+    def clear(self):
+        """
+        Clears the contents of the dict.
+        """
+        self._reset()
+        dict.clear(self)
+
+    def copy(self):
+        """
+        Returns a shallow copy of the dict.
+        """
+        return self.__class__(CompactOrderedDict.iteritems(self))
+
+    def __eq__(self, other):
+        """
+        Returns ``True`` if this dict is equal to the `other` one. If the
+        other one is a :class:`CompactOrderedDict` as well they are only
+        considered equal if the insertion order is identical.
+        """
+        if isinstance(other, CompactOrderedDict):
+            return len(self) == len(other) and all(
+                i1 == i2 for i1, i2 in izip(self.iteritems(), other.iteritems())
+            )
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __iter__(self):
+        self._trim()
+        for key in reversed(self._head):
+            if key is not _deleted:
+                yield key
+        keys = self._keys
+        for position in xrange(self._start, len(keys)):
+            key = keys[position]
+            if key is not _deleted:
+                yield key
+
+    def __reversed__(self):
+        self._trim()
+        for key in reversed(self._keys):
+            if key is not _deleted:
+                yield key
+        for key in self._head:
+            if key is not _deleted:
+                yield key
+
+    def iterkeys(self):
+        """
+        Returns an iterator over the keys of all items in insertion order.
+        """
+        return CompactOrderedDict.__iter__(self)
+
+    def itervalues(self):
+        """
+        Returns an iterator over the values of all items in insertion order.
+        """
+        return imap(dict.__getitem__, repeat(self), self.iterkeys())
+
+    def iteritems(self):
+        """
+        Returns an iterator over all the items in insertion order.
+        """
+        return ((key, dict.__getitem__(self, key)) for key in self.iterkeys())
+
+    def keys(self):
+        """
+        Returns a :class:`list` over the keys of all items in insertion order.
+        """
+        return list(self.iterkeys())
+
+    def values(self):
+        """
+        Returns a :class:`list` over the values of all items in insertion order.
+        """
+        return list(self.itervalues())
+
+    def items(self):
+        """
+        Returns a :class:`list` over the items in insertion order.
+        """
+        return list(self.iteritems())
+
+    def __reduce__(self):
+        return self.__class__, (self.items(), )
+
+    def __repr__(self):
+        content = repr(self.items()) if self else ''
+        return '%s(%s)' % (self.__class__.__name__, content)
+
+
+class ImmutableOrderedDict(ImmutableDictMixin, CachedHashMixin, OrderedDict):
+    """
+    An immutable :class:`OrderedDict`.
+
+    .. versionadded:: 0.2
 
     .. versionadded:: 0.5
        :class:`ImmutableOrderedDict` is now hashable, given the content is.
+
+    .. versionchanged:: 0.6
+       The hash is only computed once.
     """
     __metaclass__ = AbstractClassMeta
 
@@ -667,7 +1555,7 @@ class ImmutableOrderedDict(ImmutableDictMixin, OrderedDict):
 
     move_to_end = raise_immutable
 
-    def __hash__(self):
+    def _compute_hash(self):
         return hash(tuple(self.iteritems()))
 
     __repr__ = OrderedDict.__repr__
@@ -727,6 +1615,419 @@ class FixedDict(dict):
         )
 
 
+#: Marks a slot of a :class:`_BitmapNode` containing a node instead of a key.
+_subnode = object()
+
+
+def _hash(key):
+    return hash(key) & 0xffffffff
+
+
+def _popcount(n):
+    # n has at most 32 bits
+    n -= (n >> 1) & 0x55555555
+    n = (n & 0x33333333) + ((n >> 2) & 0x33333333)
+    n = (n + (n >> 4)) & 0x0f0f0f0f
+    return ((n * 0x01010101) & 0xffffffff) >> 24
+
+
+def _make_node(shift, key1, value1, hash2, key2, value2, owner):
+    hash1 = _hash(key1)
+    if hash1 == hash2:
+        return _CollisionNode(hash1, [key1, value1, key2, value2], owner)
+    added = [False]
+    return _BitmapNode(0, [], owner).assoc(
+        shift, hash1, key1, value1, owner, added
+    ).assoc(shift, hash2, key2, value2, owner, added)
+
+
+class _BitmapNode(object):
+    # a node of the trie, each of the 32 possible slots corresponding to 5
+    # bits of the hash is either empty, a key and its value or a node with
+    # the keys which share these bits. Only the non-empty slots are stored
+    # in `array`, as pairs, and marked in `bitmap`.
+    __slots__ = 'bitmap', 'array', 'owner'
+
+    def __init__(self, bitmap, array, owner):
+        self.bitmap = bitmap
+        self.array = array
+        # nodes belonging to an evolver are modified in place
+        self.owner = owner
+
+    def _edit(self, owner):
+        if owner is not None and self.owner is owner:
+            return self
+        return _BitmapNode(self.bitmap, self.array[:], owner)
+
+    def find(self, shift, hash, key, default):
+        bit = 1 << ((hash >> shift) & 31)
+        if not self.bitmap & bit:
+            return default
+        index = _popcount(self.bitmap & (bit - 1)) * 2
+        other = self.array[index]
+        if other is _subnode:
+            return self.array[index + 1].find(shift + 5, hash, key, default)
+        elif other is key or other == key:
+            return self.array[index + 1]
+        return default
+
+    def assoc(self, shift, hash, key, value, owner, added):
+        bit = 1 << ((hash >> shift) & 31)
+        index = _popcount(self.bitmap & (bit - 1)) * 2
+        if not self.bitmap & bit:
+            added[0] = True
+            node = self._edit(owner)
+            node.array[index:index] = [key, value]
+            node.bitmap |= bit
+            return node
+        other, current = self.array[index], self.array[index + 1]
+        if other is _subnode:
+            child = current.assoc(shift + 5, hash, key, value, owner, added)
+            if child is current:
+                return self
+            node = self._edit(owner)
+            node.array[index + 1] = child
+        elif other is key or other == key:
+            if current is value:
+                return self
+            node = self._edit(owner)
+            node.array[index + 1] = value
+        else:
+            added[0] = True
+            node = self._edit(owner)
+            node.array[index] = _subnode
+            node.array[index + 1] = _make_node(
+                shift + 5, other, current, hash, key, value, owner
+            )
+        return node
+
+    def without(self, shift, hash, key, owner, removed):
+        bit = 1 << ((hash >> shift) & 31)
+        if not self.bitmap & bit:
+            return self
+        index = _popcount(self.bitmap & (bit - 1)) * 2
+        other, current = self.array[index], self.array[index + 1]
+        if other is _subnode:
+            child = current.without(shift + 5, hash, key, owner, removed)
+            if not removed[0]:
+                return self
+            node = self._edit(owner)
+            if child is None:
+                del node.array[index:index + 2]
+                node.bitmap ^= bit
+            elif len(child.array) == 2 and child.array[0] is not _subnode:
+                # a node with a single key is not needed
+                node.array[index:index + 2] = child.array
+            else:
+                node.array[index + 1] = child
+        elif other is key or other == key:
+            removed[0] = True
+            node = self._edit(owner)
+            del node.array[index:index + 2]
+            node.bitmap ^= bit
+        else:
+            return self
+        return node if node.array else None
+
+    def iteritems(self):
+        array = self.array
+        for index in xrange(0, len(array), 2):
+            if array[index] is _subnode:
+                for item in array[index + 1].iteritems():
+                    yield item
+            else:
+                yield array[index], array[index + 1]
+
+
+class _CollisionNode(object):
+    # contains the keys whose hashes are equal
+    __slots__ = 'hash', 'array', 'owner'
+
+    def __init__(self, hash, array, owner):
+        self.hash = hash
+        self.array = array
+        self.owner = owner
+
+    def _edit(self, owner):
+        if owner is not None and self.owner is owner:
+            return self
+        return _CollisionNode(self.hash, self.array[:], owner)
+
+    def _index(self, key):
+        array = self.array
+        for index in xrange(0, len(array), 2):
+            if array[index] is key or array[index] == key:
+                return index
+        return -1
+
+    def find(self, shift, hash, key, default):
+        index = self._index(key)
+        if index == -1:
+            return default
+        return self.array[index + 1]
+
+    def assoc(self, shift, hash, key, value, owner, added):
+        if hash != self.hash:
+            node = _BitmapNode(
+                1 << ((self.hash >> shift) & 31), [_subnode, self], owner
+            )
+            return node.assoc(shift, hash, key, value, owner, added)
+        index = self._index(key)
+        node = self._edit(owner)
+        if index == -1:
+            added[0] = True
+            node.array.extend([key, value])
+        elif self.array[index + 1] is value:
+            return self
+        else:
+            node.array[index + 1] = value
+        return node
+
+    def without(self, shift, hash, key, owner, removed):
+        index = self._index(key)
+        if index == -1:
+            return self
+        removed[0] = True
+        node = self._edit(owner)
+        del node.array[index:index + 2]
+        return node if node.array else None
+
+    def iteritems(self):
+        array = self.array
+        for index in xrange(0, len(array), 2):
+            yield array[index], array[index + 1]
+
+
+class PersistentDict(object):
+    """
+    An immutable mapping which creates new versions of itself on changes,
+    sharing most of its structure with the previous version.
+
+    It is implemented as a hash array mapped trie, so lookups as well as
+    creating a changed version with :meth:`set` or :meth:`delete` take
+    O(log32 n) time and memory. Use :meth:`evolver` to apply many changes
+    at once, without creating a version for each.
+
+    ::
+
+        >>> a = PersistentDict(foo=1)
+        >>> b = a.set('bar', 2)
+        >>> sorted(a.items()), sorted(b.items())
+        ([('foo', 1)], [('bar', 2), ('foo', 1)])
+
+    :class:`PersistentDict` is hashable, given the content is.
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, *args, **kwargs):
+        if len(args) > 1:
+            raise TypeError(
+                'expected at most 1 argument, got %d' % len(args)
+            )
+        self._root = None
+        self._size = 0
+        self._hash = None
+        if args or kwargs:
+            evolver = self.evolver()
+            evolver.update(*args, **kwargs)
+            self._root, self._size = evolver._root, evolver._size
+
+    @classmethod
+    def _from_root(cls, root, size):
+        result = cls.__new__(cls)
+        result._root, result._size, result._hash = root, size, None
+        return result
+
+    def evolver(self):
+        """
+        Returns a :class:`PersistentDictEvolver` which can be changed like
+        a :class:`dict`, starting with the items of this dict.
+        """
+        return PersistentDictEvolver(self)
+
+    def set(self, key, value):
+        """
+        Returns a version with the `value` for the given `key`.
+        """
+        added = [False]
+        root = self._root or _BitmapNode(0, [], None)
+        root = root.assoc(0, _hash(key), key, value, None, added)
+        if root is self._root:
+            return self
+        return self._from_root(root, self._size + added[0])
+
+    def delete(self, key):
+        """
+        Returns a version without the given `key`, raises a :exc:`KeyError`
+        if there is no such key.
+        """
+        removed = [False]
+        if self._root is not None:
+            root = self._root.without(0, _hash(key), key, None, removed)
+        if not removed[0]:
+            raise KeyError(key)
+        return self._from_root(root, self._size - 1)
+
+    def update(self, *args, **kwargs):
+        """
+        Returns a version with the items of the given mapping and/or the
+        keyword arguments.
+        """
+        evolver = self.evolver()
+        evolver.update(*args, **kwargs)
+        return evolver.persistent()
+
+    def __getitem__(self, key):
+        if self._root is not None:
+            value = self._root.find(0, _hash(key), key, missing)
+            if value is not missing:
+                return value
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if self._root is None:
+            return default
+        return self._root.find(0, _hash(key), key, default)
+
+    def __contains__(self, key):
+        return self.get(key, missing) is not missing
+
+    has_key = __contains__
+
+    def __len__(self):
+        return self._size
+
+    def iteritems(self):
+        if self._root is None:
+            return iter(())
+        return self._root.iteritems()
+
+    def iterkeys(self):
+        return imap(itemgetter(0), self.iteritems())
+
+    __iter__ = iterkeys
+
+    def itervalues(self):
+        return imap(itemgetter(1), self.iteritems())
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not hasattr(other, 'iteritems') or len(self) != len(other):
+            return False
+        if isinstance(other, PersistentDict) and self._hash is not None \
+                and other._hash is not None and self._hash != other._hash:
+            return False
+        for key, value in self.iteritems():
+            if other.get(key, missing) != value:
+                return False
+        return True
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self.iteritems()))
+        return self._hash
+
+    def __reduce__(self):
+        return self.__class__, (self.items(), )
+
+    def __repr__(self):
+        content = repr(dict(self.iteritems())) if self else ''
+        return '%s(%s)' % (self.__class__.__name__, content)
+
+
+class PersistentDictEvolver(object):
+    """
+    A mutable view of a :class:`PersistentDict`, as returned by
+    :meth:`PersistentDict.evolver`, which is changed in place.
+
+    Parts of the trie created by the evolver are modified in place while
+    parts shared with the :class:`PersistentDict` are copied once, making
+    many changes considerably cheaper than using :meth:`PersistentDict.set`
+    and :meth:`PersistentDict.delete` for each. Call :meth:`persistent` to
+    get the result.
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, persistent):
+        self._root = persistent._root
+        self._size = persistent._size
+        self._owner = object()
+
+    def __getitem__(self, key):
+        value = self.get(key, missing)
+        if value is missing:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        if self._root is None:
+            return default
+        return self._root.find(0, _hash(key), key, default)
+
+    def __contains__(self, key):
+        return self.get(key, missing) is not missing
+
+    def __len__(self):
+        return self._size
+
+    def __setitem__(self, key, value):
+        added = [False]
+        root = self._root or _BitmapNode(0, [], self._owner)
+        self._root = root.assoc(0, _hash(key), key, value, self._owner, added)
+        self._size += added[0]
+
+    def __delitem__(self, key):
+        removed = [False]
+        if self._root is not None:
+            self._root = self._root.without(
+                0, _hash(key), key, self._owner, removed
+            )
+        if not removed[0]:
+            raise KeyError(key)
+        self._size -= 1
+
+    def update(self, *args, **kwargs):
+        """
+        Updates the evolver with a mapping and/or from keyword arguments.
+        """
+        if len(args) > 1:
+            raise TypeError(
+                'expected at most 1 argument, got %d' % len(args)
+            )
+        mappings = []
+        if args:
+            if hasattr(args[0], 'iteritems'):
+                mappings.append(args[0].iteritems())
+            else:
+                mappings.append(args[0])
+        mappings.append(kwargs.iteritems())
+        for mapping in mappings:
+            for key, value in mapping:
+                self[key] = value
+
+    def persistent(self):
+        """
+        Returns a :class:`PersistentDict` with the current items, the
+        evolver can still be used afterwards.
+        """
+        # further changes must not modify the nodes we return
+        self._owner = object()
+        return PersistentDict._from_root(self._root, self._size)
+
+
 class Counter(dict):
     """
     :class:`dict` subclass for counting hashable objects. Elements are stored
@@ -755,9 +2056,18 @@ class Counter(dict):
     Furthermore it is possible to multiply the counter with an :class:`int` as
     scalar.
 
+    The in-place operators ``+=``, ``-=``, ``|=`` and ``&=`` update the
+    counter itself instead of copying it, they only apply the counts of the
+    other counter but still check every count of the counter itself for
+    elements without a positive count, which have to be removed. Operations
+    creating a new counter iterate over the smaller one.
+
     Accessing a non-existing element will always result in an element
     count of 0, accordingly :meth:`get` uses 0 and :meth:`setdefault` uses 1 as
     default value.
+
+    .. versionadded:: 0.6
+       The in-place operators.
     """
     def __init__(self, countable=None, **kwargs):
         self.update(countable, **kwargs)
@@ -801,64 +2111,474 @@ class Counter(dict):
         """
         Updates the counter from the given `countable` and `kwargs`.
         """
-        countable = countable or []
-        if hasattr(countable, 'iteritems'):
-            mappings = [countable.iteritems()]
+        get = super(Counter, self).get
+        if countable is None:
+            pass
+        elif isinstance(countable, Counter) or type(countable) is dict:
+            if self:
+                for element, count in countable.iteritems():
+                    self[element] = get(element, 0) + count
+            else:
+                dict.update(self, countable)
+        elif hasattr(countable, 'iteritems'):
+            for element, count in countable.iteritems():
+                self[element] = get(element, 0) + count
         else:
-            mappings = [izip(countable, repeat(1))]
-        mappings.append(kwargs.iteritems())
-        for mapping in mappings:
-            for element, count in mapping:
-                self[element] = self.get(element) + count
+            for element in countable:
+                self[element] = get(element, 0) + 1
+        for element, count in kwargs.iteritems():
+            self[element] = get(element, 0) + count
+
+    def _keep_positive(self):
+        # min() finds out in C whether there is anything to remove at all
+        if self and min(self.itervalues()) <= 0:
+            for element in [e for e, count in self.iteritems() if count <= 0]:
+                del self[element]
+        return self
+
+    def _combine(self, other, function):
+        # applies `function` to the counts of elements in `other` and
+        # updates `self`, which should be the larger counter
+        get = super(Counter, self).get
+        for element, count in other.iteritems():
+            self[element] = function(get(element, 0), count)
+        return self._keep_positive()
 
     def __add__(self, other):
-        if not isinstance(other, self.__class__):
+        if not isinstance(other, Counter):
             return NotImplemented
-        result = Counter()
-        for element in set(self) | set(other):
-            newcount = self[element] + other[element]
-            if newcount > 0:
-                result[element] = newcount
-        return result
+        if len(self) < len(other):
+            self, other = other, self
+        return Counter(self)._combine(other, add)
+
+    def __iadd__(self, other):
+        if not isinstance(other, Counter):
+            return NotImplemented
+        return self._combine(other, add)
 
     def __sub__(self, other):
-        if not isinstance(other, self.__class__):
+        if not isinstance(other, Counter):
             return NotImplemented
+        if len(self) >= len(other):
+            return Counter(self)._combine(other, sub)
         result = Counter()
-        for element in set(self) | set(other):
-            newcount = self[element] - other[element]
+        get = super(Counter, other).get
+        for element, count in self.iteritems():
+            newcount = count - get(element, 0)
             if newcount > 0:
                 result[element] = newcount
+        if other and min(other.itervalues()) < 0:
+            for element, count in other.iteritems():
+                if count < 0 and element not in self:
+                    result[element] = -count
+        return result
+
+    def __isub__(self, other):
+        if not isinstance(other, Counter):
+            return NotImplemented
+        return self._combine(other, sub)
 
     def __mul__(self, other):
         if not isinstance(other, int):
             return NotImplemented
         result = Counter()
-        for element in self:
-            newcount = self[element] * other
+        for element, count in self.iteritems():
+            newcount = count * other
             if newcount > 0:
                 result[element] = newcount
         return result
 
     def __or__(self, other):
-        if not isinstance(other, self.__class__):
+        if not isinstance(other, Counter):
             return NotImplemented
-        result = Counter()
-        for element in set(self) | set(other):
-            newcount = max(self[element], other[element])
-            if newcount > 0:
-                result[element] = newcount
-        return result
+        if len(self) < len(other):
+            self, other = other, self
+        return Counter(self)._combine(other, max)
+
+    def __ior__(self, other):
+        if not isinstance(other, Counter):
+            return NotImplemented
+        return self._combine(other, max)
 
     def __and__(self, other):
-        if not isinstance(other, self.__class__):
+        if not isinstance(other, Counter):
             return NotImplemented
         result = Counter()
         if len(self) < len(other):
             self, other = other, self
-        for element in ifilter(self.__contains__, other):
-            newcount = min(self[element], other[element])
+        get = super(Counter, self).get
+        for element, count in other.iteritems():
+            newcount = min(get(element, 0), count)
             if newcount > 0:
                 result[element] = newcount
         return result
 
+    def __iand__(self, other):
+        if not isinstance(other, Counter):
+            return NotImplemented
+        get = super(Counter, other).get
+        for element, count in self.iteritems():
+            self[element] = min(count, get(element, 0))
+        return self._keep_positive()
+
+
+class _Bucket(object):
+    # elements counted equally often, buckets form a doubly linked list
+    # ordered by count
+    __slots__ = 'count', 'elements', 'lower', 'higher'
+
+    def __init__(self, count, lower, higher):
+        self.count = count
+        self.elements = set()
+        self.lower = lower
+        self.higher = higher
+
+
+class HeavyHittersCounter(object):
+    """
+    Counts the most common elements of a stream, keeping track of at most
+    `capacity` elements using the Space-Saving algorithm.
+
+    :param capacity: The number of elements tracked.
+    :param countable: An iterable of elements to be counted or a
+                      :class:`dict`\-like object mapping elements to their
+                      respective counts.
+
+    Once the counter is full an element which is not tracked yet replaces
+    the least common element and inherits its count, so counts are
+    overestimated by at most :attr:`max_error`, which is never more than
+    ``total / capacity``. Any element occurring more often than that is
+    guaranteed to be tracked. :meth:`bounds` returns the exact range the
+    real count of an element lies in.
+
+    Counting an element takes constant time and the elements are kept in
+    order, so :meth:`most_common` does not have to sort.
+
+    >>> from brownie.datastructures import HeavyHittersCounter
+    >>> counter = HeavyHittersCounter(2, 'abacabad')
+    >>> counter.most_common(1)
+    [('a', 4)]
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, capacity, countable=None, **kwargs):
+        if capacity < 1:
+            raise ValueError('capacity must be positive: %r' % capacity)
+        #: The number of elements tracked.
+        self.capacity = capacity
+        #: The sum of all counts.
+        self.total = 0
+        self._buckets = {}
+        self._errors = {}
+        self._lowest = self._highest = None
+        self.update(countable, **kwargs)
+
+    @property
+    def max_error(self):
+        """
+        The maximum by which a count may be overestimated, elements which are
+        not tracked occurred at most this often.
+        """
+        if len(self._buckets) < self.capacity:
+            return 0
+        return self._lowest.count
+
+    def _place(self, element, start, count):
+        lower, bucket = None, start or self._lowest
+        while bucket is not None and bucket.count < count:
+            lower, bucket = bucket, bucket.higher
+        if bucket is None or bucket.count != count:
+            bucket = _Bucket(count, lower, bucket)
+            if bucket.lower is None:
+                self._lowest = bucket
+            else:
+                bucket.lower.higher = bucket
+            if bucket.higher is None:
+                self._highest = bucket
+            else:
+                bucket.higher.lower = bucket
+        bucket.elements.add(element)
+        self._buckets[element] = bucket
+
+    def _remove_if_empty(self, bucket):
+        if bucket.elements:
+            return
+        if bucket.lower is None:
+            self._lowest = bucket.higher
+        else:
+            bucket.lower.higher = bucket.higher
+        if bucket.higher is None:
+            self._highest = bucket.lower
+        else:
+            bucket.higher.lower = bucket.lower
+
+    def add(self, element, count=1):
+        """
+        Counts the given `element` `count` times.
+        """
+        if count < 1:
+            raise ValueError('count must be positive: %r' % count)
+        self.total += count
+        bucket = self._buckets.get(element)
+        if bucket is not None:
+            count += bucket.count
+            higher = bucket.higher
+            if higher is None or higher.count > count:
+                if len(bucket.elements) == 1:
+                    # the element stays in order on its own
+                    bucket.count = count
+                    return
+            elif higher.count == count:
+                bucket.elements.remove(element)
+                higher.elements.add(element)
+                self._buckets[element] = higher
+                self._remove_if_empty(bucket)
+                return
+            bucket.elements.remove(element)
+            self._place(element, bucket, count)
+        elif len(self._buckets) < self.capacity:
+            self._errors[element] = 0
+            self._place(element, None, count)
+            return
+        else:
+            bucket = self._lowest
+            evicted = bucket.elements.pop()
+            del self._buckets[evicted], self._errors[evicted]
+            self._errors[element] = bucket.count
+            self._place(element, bucket, bucket.count + count)
+        self._remove_if_empty(bucket)
+
+    def update(self, countable=None, **kwargs):
+        """
+        Updates the counter from the given `countable` and `kwargs`.
+        """
+        countable = countable or []
+        if hasattr(countable, 'iteritems'):
+            mappings = [countable.iteritems()]
+        else:
+            mappings = [izip(countable, repeat(1))]
+        mappings.append(kwargs.iteritems())
+        add = self.add
+        for mapping in mappings:
+            for element, count in mapping:
+                add(element, count)
+
+    def __getitem__(self, element):
+        """
+        Returns the estimated count of the given `element`, elements which
+        are not tracked have a count of 0.
+        """
+        bucket = self._buckets.get(element)
+        return 0 if bucket is None else bucket.count
+
+    def bounds(self, element):
+        """
+        Returns a tuple of the minimum and maximum count of the given
+        `element`.
+        """
+        bucket = self._buckets.get(element)
+        if bucket is None:
+            return 0, self.max_error
+        return bucket.count - self._errors[element], bucket.count
+
+    def __contains__(self, element):
+        return element in self._buckets
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def iteritems(self):
+        """
+        Iterator over the tracked elements and their counts, from the most
+        common to the least.
+        """
+        bucket = self._highest
+        while bucket is not None:
+            for element in bucket.elements:
+                yield element, bucket.count
+            bucket = bucket.lower
+
+    def __iter__(self):
+        return imap(itemgetter(0), self.iteritems())
+
+    def most_common(self, n=None, guaranteed=False):
+        """
+        Returns a list of the items of the `n` most common elements, or all
+        tracked elements if `n` is not given, sorted from the most common to
+        the least.
+
+        If `guaranteed` is ``True`` only those items are returned which
+        certainly belong to the `n` most common elements, regardless of the
+        overestimation.
+        """
+        items = self.iteritems()
+        if n is None:
+            return list(items)
+        result = list(islice(items, n))
+        if guaranteed:
+            # elements after the n-th, tracked or not, occurred at most this
+            # often
+            try:
+                threshold = max(items.next()[1], self.max_error)
+            except StopIteration:
+                threshold = self.max_error
+            result = [
+                (element, count) for element, count in result
+                if count - self._errors[element] >= threshold
+            ]
+        return result
+
+    def __repr__(self):
+        return '%s(%d, %r)' % (
+            self.__class__.__name__, self.capacity, dict(self.iteritems())
+        )
+
+
+def _hash64(element):
+    # spreads the bits of `hash(element)`, which is the integer itself for
+    # small integers, over 64 bits using the finalizer of MurmurHash3
+    h = hash(element) & 0xffffffffffffffff
+    h ^= h >> 33
+    h = (h * 0xff51afd7ed558ccd) & 0xffffffffffffffff
+    h ^= h >> 33
+    h = (h * 0xc4ceb9fe1a85ec53) & 0xffffffffffffffff
+    return h ^ (h >> 33)
+
+
+class CountMinSketch(object):
+    """
+    Estimates how often elements occur in a stream using a fixed amount of
+    memory, which does not depend on the number of elements.
+
+    :param width: The number of counters per row, more counters reduce the
+                  overestimation.
+    :param depth: The number of rows, more rows make it less likely that
+                  the overestimation exceeds :attr:`error`.
+    :param countable: An iterable of elements to be counted or a
+                      :class:`dict`\-like object mapping elements to their
+                      respective counts.
+
+    Counts are never underestimated and exceed the real count by at most
+    ``error * total`` with a probability of ``1 - e ** -depth``. Use
+    :meth:`from_error` to choose the dimensions based on these guarantees
+    instead.
+
+    Sketches with the same dimensions can be combined with :meth:`merge`,
+    e.g. to count a stream across several processes. As elements are
+    hashed with :func:`hash`, this requires the same hash values in every
+    process.
+
+    >>> from brownie.datastructures import CountMinSketch
+    >>> sketch = CountMinSketch(1000, 5, 'abacabad')
+    >>> sketch['a'], sketch['e']
+    (4, 0)
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, width, depth, countable=None, **kwargs):
+        if width < 1 or depth < 1:
+            raise ValueError(
+                'width and depth must be positive: %r, %r' % (width, depth)
+            )
+        #: The number of counters per row.
+        self.width = width
+        #: The number of rows.
+        self.depth = depth
+        #: The sum of all counts.
+        self.total = 0
+        self._counters = array('L', repeat(0, width * depth))
+        self.update(countable, **kwargs)
+
+    @classmethod
+    def from_error(cls, error, probability=0.01, countable=None, **kwargs):
+        """
+        Returns a sketch whose counts exceed the real count by more than
+        ``error * total`` only with the given `probability`.
+        """
+        if not 0 < error < 1 or not 0 < probability < 1:
+            raise ValueError(
+                'error and probability must be between 0 and 1: %r, %r' % (
+                    error, probability
+                )
+            )
+        return cls(
+            int(math.ceil(math.e / error)),
+            int(math.ceil(math.log(1 / probability))),
+            countable, **kwargs
+        )
+
+    @property
+    def error(self):
+        """
+        The maximum overestimation relative to :attr:`total`, which holds
+        with a probability of ``1 - e ** -depth``.
+        """
+        return math.e / self.width
+
+    def _indexes(self, element):
+        # derives one counter per row from two 32 bit hashes, see
+        # "Less Hashing, Same Performance" by Kirsch and Mitzenmacher
+        h = _hash64(element)
+        h1, h2 = h & 0xffffffff, h >> 32
+        width = self.width
+        return [
+            row * width + (h1 + row * h2) % width
+            for row in xrange(self.depth)
+        ]
+
+    def add(self, element, count=1):
+        """
+        Counts the given `element` `count` times.
+        """
+        if count < 1:
+            raise ValueError('count must be positive: %r' % count)
+        counters = self._counters
+        for index in self._indexes(element):
+            counters[index] += count
+        self.total += count
+
+    def update(self, countable=None, **kwargs):
+        """
+        Updates the sketch from the given `countable` and `kwargs`.
+        """
+        countable = countable or []
+        if hasattr(countable, 'iteritems'):
+            mappings = [countable.iteritems()]
+        else:
+            mappings = [izip(countable, repeat(1))]
+        mappings.append(kwargs.iteritems())
+        add = self.add
+        for mapping in mappings:
+            for element, count in mapping:
+                add(element, count)
+
+    def __getitem__(self, element):
+        """
+        Returns the estimated count of the given `element`.
+        """
+        counters = self._counters
+        return int(min([counters[index] for index in self._indexes(element)]))
+
+    def merge(self, other):
+        """
+        Adds the counts of the `other` sketch to this one, raises a
+        :exc:`ValueError` if the dimensions differ.
+        """
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError('cannot merge sketches of different dimensions')
+        self._counters = array('L', [
+            a + b for a, b in izip(self._counters, other._counters)
+        ])
+        self.total += other.total
+
+    def copy(self):
+        """
+        Returns a copy of the sketch.
+        """
+        result = self.__class__(self.width, self.depth)
+        result._counters = array('L', self._counters)
+        result.total = self.total
+        return result
+
+    def __repr__(self):
+        return '%s(%d, %d)' % (self.__class__.__name__, self.width, self.depth)
@@ -6,10 +6,12 @@
     :copyright: 2010-2011 by Daniel Neuhäuser
     :license: BSD, see LICENSE.rst for details
 """
+from __future__ import with_statement
 import textwrap
 from keyword import iskeyword
 from functools import wraps
 from itertools import count
+from threading import Condition, RLock, Thread
 
 from brownie.itools import chain
 
@@ -373,6 +375,121 @@ class LazyList(object):
     del exhausting
 
 
+class PrefetchingLazyList(LazyList):
+    """
+    A :class:`LazyList` which takes items from the internal iterator on a
+    background thread, ahead of the items that have been accessed.
+
+    This is useful if taking an item from the iterator is slow, e.g. because
+    it involves I/O, as accessing the list will mostly find the items already
+    available instead of waiting for the iterator each time.
+
+    At most `window` items beyond the highest index accessed so far are
+    taken from the iterator in advance. The background thread only runs while
+    the list is less than `window` items ahead and stops once the window is
+    filled or the iterator is exhausted.
+
+    Exceptions raised by the internal iterator are raised on the next access
+    requiring an item that is not yet available.
+
+    Methods changing the list hold the same lock as the background thread,
+    so they are not interleaved with items being added by it.
+
+    .. versionadded:: 0.6
+    """
+    def locked(method):
+        @wraps(method)
+        def wrap(self, *args, **kwargs):
+            with self._condition:
+                return method(self, *args, **kwargs)
+        return wrap
+
+    def __init__(self, iterable, window=64):
+        LazyList.__init__(self, iterable)
+        #: The number of items which are taken from the iterator in advance.
+        self.window = window
+        # reentrant as the mutators hold it while calling _exhaust()
+        self._condition = Condition(RLock())
+        self._requested = -1
+        self._filling = False
+        self._error = None
+        self._start_filling()
+
+    def _start_filling(self):
+        # expects the condition to be held or no other thread to be running
+        if self._filling or self.exhausted or self._error is not None:
+            return
+        if self.known_length > self._requested + self.window // 2:
+            return
+        self._filling = True
+        thread = Thread(target=self._fill)
+        thread.setDaemon(True)
+        thread.start()
+
+    def _fill(self):
+        while True:
+            with self._condition:
+                if self.known_length > self._requested + self.window:
+                    self._filling = False
+                    return
+                iterator = self._iterator
+            try:
+                item = iterator.next()
+            except StopIteration:
+                with self._condition:
+                    if self._iterator is not iterator:
+                        # the list has been extended in the meantime
+                        continue
+                    self.exhausted = True
+                    self._filling = False
+                    self._condition.notifyAll()
+                return
+            except Exception, exc:
+                with self._condition:
+                    self._error = exc
+                    self._filling = False
+                    self._condition.notifyAll()
+                return
+            with self._condition:
+                self._collected_data.append(item)
+                self._condition.notifyAll()
+
+    def _exhaust(self, i=None):
+        if self.exhausted:
+            return
+        elif i is None or i < 0:
+            index = float('inf')
+        elif isinstance(i, slice):
+            start, stop = i.start, i.stop
+            if start < 0 or stop < 0:
+                index = float('inf')
+            else:
+                index = stop - 1
+        else:
+            index = i
+        with self._condition:
+            self._requested = max(self._requested, index)
+            while self.known_length <= index and not self.exhausted:
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    raise error
+                self._start_filling()
+                self._condition.wait()
+            self._start_filling()
+
+    extend = locked(LazyList.extend)
+    insert = locked(LazyList.insert)
+    pop = locked(LazyList.pop)
+    remove = locked(LazyList.remove)
+    reverse = locked(LazyList.reverse)
+    sort = locked(LazyList.sort)
+    __setitem__ = locked(LazyList.__setitem__)
+    __delitem__ = locked(LazyList.__delitem__)
+    __imul__ = locked(LazyList.__imul__)
+
+    del locked
+
+
 class CombinedSequence(object):
     """
     A sequence combining other sequences.
@@ -695,4 +812,7 @@ def namedtuple(typename, field_names, verbose=False, rename=False, doc=None):
     return result
 
 
-__all__ = ['LazyList', 'CombinedSequence', 'CombinedList', 'namedtuple']
+__all__ = [
+    'LazyList', 'PrefetchingLazyList', 'CombinedSequence', 'CombinedList',
+    'namedtuple'
+]
@@ -6,10 +6,13 @@
     :copyright: 2010-2011 by Daniel Neuhäuser
     :license: BSD, see LICENSE.rst for details
 """
+from math import log, sqrt, frexp
+from array import array
 from functools import wraps
+from itertools import repeat
 
 from brownie.itools import chain
-from brownie.datastructures.mappings import OrderedDict
+from brownie.datastructures.mappings import OrderedDict, _hash64
 
 
 class OrderedSet(object):
@@ -173,4 +176,111 @@ class OrderedSet(object):
     del requires_set
 
 
-__all__ = ['OrderedSet']
+class HyperLogLog(object):
+    """
+    Estimates the number of distinct elements added to it using the
+    HyperLogLog algorithm, in a fixed amount of memory of ``2 ** precision``
+    bytes.
+
+    :param precision: A value between 4 and 16, the standard error of the
+                      estimate is :attr:`error`.
+    :param iterable: An iterable of elements to be added.
+
+    Instances with the same precision can be combined with :meth:`merge`,
+    the result estimates the number of elements in the union. As elements
+    are hashed with :func:`hash`, this requires the same hash values for
+    the elements of both.
+
+    >>> from brownie.datastructures import HyperLogLog
+    >>> hll = HyperLogLog(10, xrange(1000))
+    >>> abs(len(hll) - 1000) < 100
+    True
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, precision=14, iterable=None):
+        if not 4 <= precision <= 16:
+            raise ValueError(
+                'precision must be between 4 and 16: %r' % precision
+            )
+        #: The number of bits used to select a register.
+        self.precision = precision
+        self._registers = array('B', repeat(0, 1 << precision))
+        if iterable is not None:
+            self.update(iterable)
+
+    @property
+    def error(self):
+        """The relative standard error of the estimate."""
+        return 1.04 / sqrt(len(self._registers))
+
+    def add(self, element):
+        """
+        Adds the given `element`.
+        """
+        h = _hash64(element)
+        index = h & (len(self._registers) - 1)
+        h >>= self.precision
+        if h:
+            # the position of the lowest set bit, frexp is exact for powers
+            # of two
+            rank = frexp(h & -h)[1]
+        else:
+            rank = 65 - self.precision
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def update(self, iterable):
+        """
+        Adds the elements from the given `iterable`.
+        """
+        add = self.add
+        for element in iterable:
+            add(element)
+
+    def __len__(self):
+        """
+        Returns the estimated number of distinct elements.
+        """
+        registers = self._registers
+        m = len(registers)
+        if m == 16:
+            alpha = 0.673
+        elif m == 32:
+            alpha = 0.697
+        elif m == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum([2.0 ** -r for r in registers])
+        if estimate <= 2.5 * m:
+            zeros = registers.count(0)
+            if zeros:
+                # linear counting is more accurate for small cardinalities
+                estimate = m * log(float(m) / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        """
+        Adds the elements of the `other` instance to this one, raises a
+        :exc:`ValueError` if the precision differs.
+        """
+        if self.precision != other.precision:
+            raise ValueError('cannot merge with a different precision')
+        self._registers = array('B', map(
+            max, self._registers, other._registers
+        ))
+
+    def copy(self):
+        """
+        Returns a copy.
+        """
+        result = self.__class__(self.precision)
+        result._registers = array('B', self._registers)
+        return result
+
+    def __repr__(self):
+        return '%s(%d)' % (self.__class__.__name__, self.precision)
+
+
+__all__ = ['OrderedSet', 'HyperLogLog']
@@ -39,11 +39,11 @@ class chain(object):
         return self
 
     def next(self):
-        try:
-            return self.current_iterable.next()
-        except StopIteration:
-            self.current_iterable = iter(self.iterables.next())
-            return self.current_iterable.next()
+        while True:
+            try:
+                return self.current_iterable.next()
+            except StopIteration:
+                self.current_iterable = iter(self.iterables.next())
 
 
 def izip_longest(*iterables, **kwargs):
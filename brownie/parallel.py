@@ -11,7 +11,18 @@
 from __future__ import with_statement
 import os
 import sys
-from threading import Condition, Lock
+import mmap
+import time
+import random
+import tempfile
+from array import array
+from Queue import Queue
+from heapq import heappush, heappop
+from bisect import bisect_left
+from functools import wraps
+from itertools import count
+from collections import deque
+from threading import Condition, Lock, Thread, local, currentThread
 
 try:
     from multiprocessing import _get_cpu_count
@@ -61,6 +72,15 @@ class TimeoutError(Exception):
     """Exception raised in case of timeouts."""
 
 
+class CancelledError(Exception):
+    """
+    Exception raised if a result has been cancelled, either explicitly or
+    because its deadline has passed.
+
+    .. versionadded:: 0.6
+    """
+
+
 class AsyncResult(object):
     """
     Helper object for providing asynchronous results.
@@ -70,14 +90,69 @@ class AsyncResult(object):
 
     :param errback:
         Errback which is called if the result is an exception.
+
+    :param deadline:
+        Point in time, as returned by :func:`time.time`, after which nobody
+        is interested in the result anymore and it is considered cancelled.
+
+    .. versionadded:: 0.6
+       Added cancellation, deadlines and :meth:`then`.
     """
-    def __init__(self, callback=None, errback=None):
+    def __init__(self, callback=None, errback=None, deadline=None):
         self.callback = callback
         self.errback = errback
+        #: The point in time after which the result is cancelled or ``None``.
+        self.deadline = deadline
 
         self.condition = Condition(Lock())
         #: ``True`` if a result is available.
         self.ready = False
+        self._cancelled = False
+        self._children = []
+
+    @property
+    def remaining(self):
+        """
+        The number of seconds left until the :attr:`deadline` is reached or
+        ``None`` if there is no deadline.
+        """
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.time(), 0)
+
+    @property
+    def cancelled(self):
+        """
+        ``True`` if the result has been cancelled or the :attr:`deadline` has
+        passed before a result was set.
+
+        Producers should check this while they are working on a result, to
+        drop work nobody is waiting for anymore.
+        """
+        if not self._cancelled and not self.ready and self.remaining == 0:
+            self.cancel()
+        return self._cancelled
+
+    def cancel(self):
+        """
+        Cancels the result and every result derived from it using
+        :meth:`then`.
+
+        Returns ``True`` if the result has been cancelled, ``False`` if it was
+        already available.
+        """
+        with self.condition:
+            if self.ready:
+                return False
+            self._cancelled = True
+            self.value = CancelledError()
+            self.success = False
+            self.ready = True
+            self.condition.notifyAll()
+            children, self._children = self._children, []
+        for child, _, _ in children:
+            child.cancel()
+        return True
 
     def wait(self, timeout=None):
         """
@@ -95,10 +170,20 @@ class AsyncResult(object):
 
         If `timeout` is given this method raises a :exc:`TimeoutError`
         if the result is not available soon enough.
+
+        If the result has been cancelled or the :attr:`deadline` passes while
+        waiting a :exc:`CancelledError` is raised.
         """
-        self.wait(timeout)
+        wait_timeout = timeout
+        remaining = self.remaining
+        if remaining is not None and (timeout is None or remaining < timeout):
+            wait_timeout = remaining
+        self.wait(wait_timeout)
         if not self.ready:
-            raise TimeoutError(timeout)
+            if wait_timeout is timeout:
+                raise TimeoutError(timeout)
+            # the deadline has been reached before the timeout
+            self.cancel()
         if self.success:
             return self.value
         else:
@@ -108,16 +193,70 @@ class AsyncResult(object):
         """
         Sets the given `obj` as result, set `success` to ``False`` if `obj`
         is an exception.
+
+        If the result has been cancelled, `obj` is silently discarded.
         """
-        self.value = obj
-        self.success = success
+        with self.condition:
+            if self._cancelled:
+                return
+            self.value = obj
+            self.success = success
         if self.callback and success:
             self.callback(obj)
         if self.errback and not success:
             self.errback(obj)
         with self.condition:
+            if self._cancelled:
+                return
             self.ready = True
-            self.condition.notify()
+            self.condition.notifyAll()
+            children, self._children = self._children, []
+        for child in children:
+            self._resolve_child(*child)
+
+    def then(self, callback=None, errback=None, deadline=None):
+        """
+        Returns a new :class:`AsyncResult` which is set to the return value of
+        `callback` called with the value of this result, once it is available.
+
+        If this result is an exception `errback` is called with it instead, if
+        no `errback` is given the exception is passed on. Exceptions raised by
+        `callback` or `errback` are set on the returned result.
+
+        The returned result inherits the :attr:`deadline` of this one, unless
+        an earlier `deadline` is given, and it is cancelled if this one is.
+        Neither `callback` nor `errback` are called, if the returned result
+        has been cancelled in the meantime.
+        """
+        if self.deadline is not None:
+            if deadline is None:
+                deadline = self.deadline
+            else:
+                deadline = min(deadline, self.deadline)
+        child = self.__class__(deadline=deadline)
+        with self.condition:
+            if not self.ready:
+                self._children.append((child, callback, errback))
+                return child
+        self._resolve_child(child, callback, errback)
+        return child
+
+    def _resolve_child(self, child, callback, errback):
+        if self._cancelled:
+            child.cancel()
+            return
+        if child.cancelled:
+            return
+        function = callback if self.success else errback
+        if function is None:
+            child.set(self.value, success=self.success)
+            return
+        try:
+            result = function(self.value)
+        except Exception, exc:
+            child.set(exc, success=False)
+        else:
+            child.set(result)
 
     def __repr__(self):
         parts = []
@@ -125,10 +264,1843 @@ class AsyncResult(object):
             parts.append(('callback', self.callback))
         if self.errback is not None:
             parts.append(('errback', self.errback))
+        if self.deadline is not None:
+            parts.append(('deadline', self.deadline))
         return '%s(%s)' % (
             self.__class__.__name__,
             ', '.join('%s=%r' % part for part in parts)
         )
 
 
-__all__ = ['get_cpu_count', 'TimeoutError', 'AsyncResult']
+def _set_result(result, obj, success=True):
+    try:
+        result.set(obj, success)
+    except Exception:
+        # a broken callback or errback must not take down the thread setting
+        # the result
+        sys.excepthook(*sys.exc_info())
+
+
+class Batcher(object):
+    """
+    Collects items submitted from any number of threads and passes them in
+    batches to the given `function`, which is called on a background thread.
+
+    `function` is called with a :class:`list` of items and has to return a
+    sequence with a result for each of them, in the same order. Each call to
+    :meth:`submit` immediately returns an :class:`AsyncResult` which is set
+    to the corresponding result, if `function` raises an exception it is set
+    on every result of the batch.
+
+    :param max_batch:
+        The maximum number of items passed to `function` at once, a batch is
+        flushed as soon as this many items are pending.
+
+    :param max_delay:
+        The maximum number of milliseconds an item waits for a batch to fill
+        up, before the batch is flushed anyway.
+
+    Items whose results are cancelled before the batch is flushed are
+    dropped. A :class:`Batcher` can be used as a context manager which
+    calls :meth:`close` on exit.
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, function, max_batch=100, max_delay=10):
+        self.function = function
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self.condition = Condition(Lock())
+        self._pending = []
+        self._flush_requested = False
+        #: ``True`` if the batcher has been closed.
+        self.closed = False
+        self._flusher = Thread(target=self._run)
+        self._flusher.setDaemon(True)
+        self._flusher.start()
+
+    def submit(self, item, deadline=None):
+        """
+        Submits the given `item` and returns an :class:`AsyncResult` for the
+        result, `deadline` is passed to the :class:`AsyncResult`.
+
+        Raises :exc:`RuntimeError` if the batcher has been closed.
+        """
+        result = AsyncResult(deadline=deadline)
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('batcher is closed')
+            self._pending.append((item, result, time.time()))
+            if len(self._pending) == 1 or \
+                    len(self._pending) >= self.max_batch:
+                self.condition.notify()
+        return result
+
+    def flush(self):
+        """
+        Flushes all pending items without waiting for `max_batch` items or
+        `max_delay` to be reached.
+        """
+        with self.condition:
+            self._flush_requested = True
+            self.condition.notify()
+
+    def close(self, timeout=None):
+        """
+        Flushes all pending items and stops the background thread, blocks
+        until that has happened or the given `timeout` has been reached.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self._flusher.join(timeout)
+
+    def _next_batch(self):
+        with self.condition:
+            while True:
+                if not self._pending:
+                    self._flush_requested = False
+                    if self.closed:
+                        return None
+                    self.condition.wait()
+                    continue
+                if len(self._pending) >= self.max_batch or \
+                        self._flush_requested or self.closed:
+                    break
+                remaining = (
+                    self._pending[0][2] + self.max_delay / 1000.0 -
+                    time.time()
+                )
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            batch = [
+                (item, result) for item, result, _ in batch
+                if not result.cancelled
+            ]
+            if batch:
+                self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        try:
+            values = list(self.function([item for item, _ in batch]))
+            if len(values) != len(batch):
+                raise ValueError(
+                    'expected %d results, got %d' % (len(batch), len(values))
+                )
+        except Exception, exc:
+            for _, result in batch:
+                _set_result(result, exc, success=False)
+        else:
+            for (_, result), value in zip(batch, values):
+                _set_result(result, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return '%s(%r, max_batch=%r, max_delay=%r)' % (
+            self.__class__.__name__, self.function, self.max_batch,
+            self.max_delay
+        )
+
+
+# marks the end of the items in a pipeline queue
+_stop = object()
+
+
+class Stage(object):
+    """
+    A stage of a :class:`Pipeline`, calling `function` with each item on
+    `workers` threads which take the items from a queue holding at most
+    `maxsize` items.
+
+    If `flatten` is ``True``, `function` has to return an iterable, e.g. a
+    generator, and each of its items is passed on to the next stage. This
+    allows a stage to produce several items from one or to filter items.
+
+    The statistics exposed by a stage refer to the current or the most recent
+    run of the pipeline.
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, function, workers=1, maxsize=None, flatten=False,
+                 name=None):
+        self.function = function
+        self.workers = workers
+        #: The maximum number of items waiting for this stage.
+        self.maxsize = 2 * workers if maxsize is None else maxsize
+        self.flatten = flatten
+        self.name = getattr(function, '__name__', None) if name is None \
+            else name
+
+        self._lock = Lock()
+        self._queue = None
+        self._started = self._finished = None
+        #: The number of items processed by this stage.
+        self.processed = 0
+        #: The number of workers currently processing an item or waiting for
+        #: the next stage to accept one.
+        self.active = 0
+
+    @property
+    def queue_depth(self):
+        """
+        The number of items waiting to be processed by this stage.
+        """
+        if self._queue is None:
+            return 0
+        return self._queue.qsize()
+
+    @property
+    def throughput(self):
+        """
+        The average number of items processed per second.
+        """
+        if self._started is None:
+            return 0.0
+        end = time.time() if self._finished is None else self._finished
+        elapsed = end - self._started
+        if elapsed <= 0:
+            return 0.0
+        return self.processed / elapsed
+
+    def _reset(self, queue):
+        self._queue = queue
+        self._started = time.time()
+        self._finished = None
+        self.processed = self.active = 0
+
+    def _enter(self):
+        with self._lock:
+            self.active += 1
+
+    def _leave(self):
+        with self._lock:
+            self.active -= 1
+            self.processed += 1
+
+    def __repr__(self):
+        return '%s(%r, workers=%r, maxsize=%r)' % (
+            self.__class__.__name__, self.function, self.workers,
+            self.maxsize
+        )
+
+
+class _PipelineRun(object):
+    def __init__(self, stages, output):
+        self.result = AsyncResult()
+        self.lock = Lock()
+        self.queues = [Queue(stage.maxsize) for stage in stages]
+        self.queues.append(output)
+        self.remaining = [stage.workers for stage in stages]
+        self.count = 0
+        self.error = None
+
+    @property
+    def aborted(self):
+        return self.error is not None or self.result.ready
+
+    def fail(self, exc):
+        with self.lock:
+            if self.error is None:
+                self.error = exc
+
+
+class Pipeline(object):
+    """
+    Passes items through a number of :class:`Stage`\s, each running its own
+    number of worker threads.
+
+    The queue in front of each stage is bounded, so a stage which is slower
+    than the one before it slows the previous stages down instead of
+    accumulating items in memory::
+
+        pipeline = Pipeline()
+        pipeline.add_stage(read, workers=2, flatten=True)
+        pipeline.add_stage(parse, workers=4)
+        pipeline.add_stage(write, workers=1)
+        pipeline.run(filenames).get()
+
+    If a stage raises an exception the pipeline is aborted, the remaining
+    items are dropped and the exception is set on the :class:`AsyncResult`
+    returned by :meth:`run`. A pipeline processes one iterable at a time.
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, stages=None):
+        #: The list of :class:`Stage`\s items are passed through.
+        self.stages = [] if stages is None else list(stages)
+        self._running = False
+        self._running_lock = Lock()
+
+    def add_stage(self, function, workers=1, maxsize=None, flatten=False,
+                  name=None):
+        """
+        Adds a :class:`Stage` to the end of the pipeline and returns it.
+        """
+        stage = Stage(function, workers, maxsize, flatten, name)
+        self.stages.append(stage)
+        return stage
+
+    def run(self, iterable):
+        """
+        Passes the items from the given `iterable` through the pipeline and
+        returns an :class:`AsyncResult`, which is set to the number of items
+        leaving the last stage once every item has been processed.
+
+        Cancelling the returned result aborts the pipeline.
+        """
+        return self._start(iterable, None).result
+
+    def imap(self, iterable):
+        """
+        Like :meth:`run` but returns an iterator over the items leaving the
+        last stage, in the order in which they become available.
+
+        Exceptions raised by a stage are raised by the iterator after the
+        items that have been processed so far.
+        """
+        output = Queue(self.stages[-1].maxsize if self.stages else 0)
+        run = self._start(iterable, output)
+        item = None
+        try:
+            while True:
+                item = output.get()
+                if item is _stop:
+                    break
+                yield item
+        finally:
+            if item is not _stop:
+                run.result.cancel()
+                while item is not _stop:
+                    item = output.get()
+        run.result.get()
+
+    def _start(self, iterable, output):
+        if not self.stages:
+            raise RuntimeError('pipeline has no stages')
+        with self._running_lock:
+            if self._running:
+                raise RuntimeError('pipeline is already running')
+            self._running = True
+        run = _PipelineRun(self.stages, output)
+        for index, stage in enumerate(self.stages):
+            stage._reset(run.queues[index])
+            for _ in xrange(stage.workers):
+                self._spawn(self._work, index, run)
+        self._spawn(self._feed, iterable, run)
+        return run
+
+    def _spawn(self, function, *args):
+        thread = Thread(target=function, args=args)
+        thread.setDaemon(True)
+        thread.start()
+
+    def _feed(self, iterable, run):
+        queue = run.queues[0]
+        try:
+            for item in iterable:
+                if run.aborted:
+                    break
+                queue.put(item)
+        except Exception, exc:
+            run.fail(exc)
+        queue.put(_stop)
+
+    def _work(self, index, run):
+        stage = self.stages[index]
+        source, target = run.queues[index], run.queues[index + 1]
+        is_last = index == len(self.stages) - 1
+        while True:
+            item = source.get()
+            if item is _stop:
+                # let the other workers of this stage know as well
+                source.put(_stop)
+                break
+            if run.aborted:
+                # the pipeline has been aborted, drop the item
+                continue
+            stage._enter()
+            try:
+                values = stage.function(item)
+                if not stage.flatten:
+                    values = [values]
+                for value in values:
+                    if run.aborted:
+                        break
+                    if is_last:
+                        with run.lock:
+                            run.count += 1
+                    if target is not None:
+                        target.put(value)
+            except Exception, exc:
+                run.fail(exc)
+            stage._leave()
+        with run.lock:
+            run.remaining[index] -= 1
+            finished = run.remaining[index] == 0
+        if finished:
+            stage._queue = None
+            stage._finished = time.time()
+            if is_last:
+                with self._running_lock:
+                    self._running = False
+                if run.error is None:
+                    run.result.set(run.count)
+                else:
+                    run.result.set(run.error, success=False)
+            if target is not None:
+                target.put(_stop)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.stages)
+
+
+class Acquisition(object):
+    """
+    Context manager and decorator acquiring from a limiter, such as a
+    :class:`TokenBucket` or :class:`KeyedSemaphore`, on entry and releasing on
+    exit.
+
+    Instances are returned by the `limit` method of limiters, `args` are
+    passed to the `acquire` and `release` method of the `limiter`.
+
+    If `blocking` is ``False`` or a `timeout` is given and the limiter could
+    not be acquired a :exc:`TimeoutError` is raised.
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, limiter, args=(), blocking=True, timeout=None):
+        self.limiter = limiter
+        self.args = tuple(args)
+        self.blocking = blocking
+        self.timeout = timeout
+
+    def __enter__(self):
+        acquired = self.limiter.acquire(
+            *self.args + (self.blocking, self.timeout)
+        )
+        if not acquired:
+            raise TimeoutError(self.timeout)
+        return self.limiter
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.limiter.release(*self.args)
+
+    def __call__(self, function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with self:
+                return function(*args, **kwargs)
+        return wrapper
+
+    def __repr__(self):
+        return '%s(%r, %r, blocking=%r, timeout=%r)' % (
+            self.__class__.__name__, self.limiter, self.args, self.blocking,
+            self.timeout
+        )
+
+
+class TokenBucket(object):
+    """
+    Thread-safe rate limiter allowing on average `rate` acquisitions per
+    second and bursts of up to `capacity` acquisitions, which defaults to
+    `rate` but is at least 1.
+
+    A :class:`TokenBucket` can be used as a context manager or decorator
+    taking one token, use :meth:`limit` for more control::
+
+        bucket = TokenBucket(10)
+
+        @bucket
+        def request(url):
+            ...
+
+        with bucket.limit(blocking=False):
+            ...
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError('rate must be positive: %r' % rate)
+        #: The number of tokens added to the bucket per second.
+        self.rate = float(rate)
+        #: The maximum number of tokens in the bucket.
+        self.capacity = max(self.rate, 1) if capacity is None else capacity
+        self._tokens = self.capacity
+        self._last_refill = time.time()
+        self._lock = Lock()
+
+    def _refill(self, now):
+        elapsed = max(now - self._last_refill, 0)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._last_refill = now
+
+    @property
+    def tokens(self):
+        """
+        The number of tokens currently available.
+        """
+        with self._lock:
+            self._refill(time.time())
+            return self._tokens
+
+    def acquire(self, tokens=1, blocking=True, timeout=None):
+        """
+        Takes the given number of `tokens` from the bucket, blocking until
+        they are available.
+
+        Returns ``True`` if the tokens have been taken. If `blocking` is
+        ``False`` or the tokens do not become available within `timeout`
+        seconds ``False`` is returned instead of waiting.
+        """
+        if tokens > self.capacity:
+            raise ValueError(
+                'cannot acquire more than %r tokens' % self.capacity
+            )
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self._lock:
+                now = time.time()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                delay = (tokens - self._tokens) / self.rate
+            if not blocking:
+                return False
+            if deadline is not None and now + delay > deadline:
+                return False
+            time.sleep(delay)
+
+    def release(self, tokens=1):
+        """
+        Does nothing, tokens are refilled over time. This method exists so
+        that a :class:`TokenBucket` can be used like other limiters.
+        """
+
+    def limit(self, tokens=1, blocking=True, timeout=None):
+        """
+        Returns an :class:`Acquisition` taking the given number of `tokens`.
+        """
+        return Acquisition(self, (tokens, ), blocking, timeout)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def __call__(self, function):
+        return self.limit()(function)
+
+    def __repr__(self):
+        return '%s(%r, capacity=%r)' % (
+            self.__class__.__name__, self.rate, self.capacity
+        )
+
+
+class KeyedTokenBucket(object):
+    """
+    Thread-safe rate limiter maintaining a separate :class:`TokenBucket` with
+    the given `rate` and `capacity` for each key, e.g. for each host
+    requests are sent to.
+
+    Full buckets are no different from new ones, so they are discarded from
+    time to time and keys which are no longer used do not take up memory.
+
+    .. versionadded:: 0.6
+    """
+    #: The number of buckets above which full buckets are discarded.
+    prune_threshold = 64
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError('rate must be positive: %r' % rate)
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets = {}
+        self._lock = Lock()
+        self._prune_size = self.prune_threshold
+
+    def _prune(self):
+        for key, bucket in self._buckets.items():
+            if bucket.tokens >= bucket.capacity:
+                del self._buckets[key]
+        # pruning again only after the number of buckets doubled keeps the
+        # cost per created bucket constant
+        self._prune_size = max(self.prune_threshold, 2 * len(self._buckets))
+
+    def get_bucket(self, key):
+        """
+        Returns the :class:`TokenBucket` for the given `key`.
+        """
+        try:
+            return self._buckets[key]
+        except KeyError:
+            with self._lock:
+                if key not in self._buckets:
+                    if len(self._buckets) >= self._prune_size:
+                        self._prune()
+                    self._buckets[key] = TokenBucket(self.rate, self.capacity)
+                return self._buckets[key]
+
+    def acquire(self, key, tokens=1, blocking=True, timeout=None):
+        """
+        Like :meth:`TokenBucket.acquire` for the bucket of the given `key`.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            bucket = self.get_bucket(key)
+            if not bucket.acquire(tokens, blocking, timeout):
+                return False
+            if self._buckets.get(key) is bucket:
+                return True
+            # the bucket has been discarded in the meantime, so taking
+            # tokens from it had no effect; try again within the time left
+            if deadline is not None:
+                timeout = max(deadline - time.time(), 0)
+
+    def release(self, key, tokens=1):
+        """
+        Does nothing, see :meth:`TokenBucket.release`.
+        """
+
+    def limit(self, key, tokens=1, blocking=True, timeout=None):
+        """
+        Returns an :class:`Acquisition` taking the given number of `tokens`
+        from the bucket of the given `key`.
+        """
+        return Acquisition(self, (key, tokens), blocking, timeout)
+
+    def __repr__(self):
+        return '%s(%r, capacity=%r)' % (
+            self.__class__.__name__, self.rate, self.capacity
+        )
+
+
+class _KeyState(object):
+    __slots__ = 'count', 'waiting', 'condition'
+
+    def __init__(self, lock):
+        self.count = self.waiting = 0
+        self.condition = Condition(lock)
+
+
+class KeyedSemaphore(object):
+    """
+    Thread-safe semaphore allowing up to `value` concurrent acquisitions for
+    each key, e.g. to limit the number of in-flight requests to each host::
+
+        semaphore = KeyedSemaphore(4)
+
+        def request(host, path):
+            with semaphore.limit(host):
+                ...
+
+    Keys without acquisitions do not take up any memory.
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, value=1):
+        #: The maximum number of concurrent acquisitions per key.
+        self.value = value
+        self._lock = Lock()
+        self._states = {}
+
+    def acquire(self, key, blocking=True, timeout=None):
+        """
+        Acquires the semaphore for the given `key`, blocking until that is
+        possible.
+
+        Returns ``True`` if the semaphore has been acquired. If `blocking` is
+        ``False`` or the semaphore cannot be acquired within `timeout` seconds
+        ``False`` is returned instead of waiting.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = _KeyState(self._lock)
+            while state.count >= self.value:
+                if not blocking:
+                    return False
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                state.waiting += 1
+                try:
+                    state.condition.wait(remaining)
+                finally:
+                    state.waiting -= 1
+            state.count += 1
+            return True
+
+    def release(self, key):
+        """
+        Releases the semaphore for the given `key`.
+
+        Raises :exc:`ValueError` if the semaphore has not been acquired for
+        the `key`.
+        """
+        with self._lock:
+            state = self._states.get(key)
+            if state is None or state.count == 0:
+                raise ValueError('semaphore released too many times')
+            state.count -= 1
+            if state.waiting:
+                state.condition.notify()
+            elif state.count == 0:
+                del self._states[key]
+
+    def in_flight(self, key):
+        """
+        Returns the number of acquisitions for the given `key`.
+        """
+        state = self._states.get(key)
+        return 0 if state is None else state.count
+
+    def limit(self, key, blocking=True, timeout=None):
+        """
+        Returns an :class:`Acquisition` for the given `key`.
+        """
+        return Acquisition(self, (key, ), blocking, timeout)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.value)
+
+
+class _Timer(object):
+    """
+    Calls functions at given points in time on a single background thread.
+    """
+    def __init__(self):
+        self._condition = Condition(Lock())
+        self._heap = []
+        self._sequence = count().next
+        self._thread = None
+        self._closed = False
+
+    def call_at(self, when, function, *args):
+        entry = [when, self._sequence(), function, args]
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('timer is closed')
+            heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = Thread(target=self._run)
+                self._thread.setDaemon(True)
+                self._thread.start()
+            elif self._heap[0] is entry:
+                self._condition.notify()
+        return entry
+
+    def cancel(self, entry):
+        # the entry is skipped once it is due
+        entry[2] = None
+
+    def close(self):
+        # stops the thread and returns the entries which have not been due
+        with self._condition:
+            self._closed = True
+            entries, self._heap = self._heap, []
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None and thread is not currentThread():
+            thread.join()
+        return [entry for entry in entries if entry[2] is not None]
+
+    def _next_entry(self):
+        with self._condition:
+            while True:
+                if self._closed:
+                    return None
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                now = time.time()
+                if self._heap[0][0] <= now:
+                    return heappop(self._heap)
+                self._condition.wait(self._heap[0][0] - now)
+
+    def _run(self):
+        while True:
+            entry = self._next_entry()
+            if entry is None:
+                return
+            _, _, function, args = entry
+            if function is None:
+                continue
+            try:
+                function(*args)
+            except Exception:
+                # report the error but keep the timer running for everybody
+                # else
+                sys.excepthook(*sys.exc_info())
+
+
+_timer = _Timer()
+
+
+#: The number of worker threads of the pool shared by all :class:`Retry`
+#: policies without a `spawn` callable.
+RETRY_WORKERS = 8
+
+_retry_pool = None
+_retry_pool_lock = Lock()
+
+
+def _get_retry_pool():
+    global _retry_pool
+    if _retry_pool is None:
+        with _retry_pool_lock:
+            if _retry_pool is None:
+                _retry_pool = ThreadPool(RETRY_WORKERS)
+    return _retry_pool
+
+
+class RetryBudget(object):
+    """
+    Limits the number of retries in relation to the number of calls, in
+    order to prevent retries from overloading an already failing service.
+
+    Each call adds `ratio` retries to the budget, additionally the budget is
+    refilled with `minimum` retries per second so that rarely called
+    functions can be retried as well. At most `capacity` retries accumulate.
+
+    A budget can and usually should be shared between several :class:`Retry`
+    policies calling the same service.
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, ratio=0.2, minimum=1.0, capacity=100):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.capacity = capacity
+        self._lock = Lock()
+        self._retries = float(capacity)
+        self._last_refill = time.time()
+
+    def _refill(self):
+        now = time.time()
+        elapsed = max(now - self._last_refill, 0)
+        self._retries = min(
+            self.capacity, self._retries + elapsed * self.minimum
+        )
+        self._last_refill = now
+
+    @property
+    def retries(self):
+        """
+        The number of retries currently available.
+        """
+        with self._lock:
+            self._refill()
+            return self._retries
+
+    def deposit(self):
+        """
+        Records a call, adding `ratio` retries to the budget.
+        """
+        with self._lock:
+            self._refill()
+            self._retries = min(self.capacity, self._retries + self.ratio)
+
+    def withdraw(self):
+        """
+        Takes a retry from the budget, returns ``False`` if the budget is
+        exhausted.
+        """
+        with self._lock:
+            self._refill()
+            if self._retries < 1:
+                return False
+            self._retries -= 1
+            return True
+
+    def __repr__(self):
+        return '%s(ratio=%r, minimum=%r, capacity=%r)' % (
+            self.__class__.__name__, self.ratio, self.minimum, self.capacity
+        )
+
+
+class Retry(object):
+    """
+    Policy for retrying functions which fail with one of the given
+    `exceptions`, with exponential backoff and jitter.
+
+    Functions are called at most `attempts` times, after the `n`\-th failed
+    attempt the retry is delayed by up to ``backoff * multiplier ** n``
+    seconds but no longer than `max_backoff` seconds. `jitter` is the
+    fraction of the delay which is randomized, with ``1.0`` the delay is
+    chosen uniformly between zero and the maximum, with ``0.0`` the delay is
+    always the maximum.
+
+    If a :class:`RetryBudget` is given as `budget` a function is only retried
+    as long as the budget is not exhausted.
+
+    Attempts are never made by the calling thread, instead they are
+    submitted to a :class:`ThreadPool` with :data:`RETRY_WORKERS` workers,
+    which is shared by all policies and created on first use. Retries are
+    scheduled on a single timer thread shared by all policies, so no thread
+    sleeps while waiting for a retry. If a `spawn` callable is given, it is
+    called with a function and its arguments instead to run every attempt
+    elsewhere, e.g. ``spawn=pool.submit`` to use your own pool.
+
+    A :class:`Retry` instance can be used as a decorator, the decorated
+    function returns an :class:`AsyncResult`::
+
+        @Retry(attempts=5, exceptions=(IOError, ))
+        def fetch(url):
+            ...
+
+        fetch('http://example.com').get()
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, attempts=3, backoff=0.1, multiplier=2, max_backoff=60,
+                 jitter=1.0, exceptions=(Exception, ), budget=None,
+                 spawn=None):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.exceptions = tuple(exceptions)
+        self.budget = budget
+        self.spawn = spawn
+
+    def get_delay(self, attempt):
+        """
+        Returns the number of seconds to wait before retrying after the given
+        failed `attempt`, starting with 0.
+        """
+        delay = min(self.backoff * self.multiplier ** attempt, self.max_backoff)
+        return delay * (1 - self.jitter * random.random())
+
+    def call(self, function, *args, **kwargs):
+        """
+        Calls `function` with the given arguments and returns an
+        :class:`AsyncResult` which is set to the value returned by the first
+        successful attempt or to the exception raised by the last one.
+
+        Cancelling the result prevents further attempts.
+        """
+        result = AsyncResult()
+        if self.budget is not None:
+            self.budget.deposit()
+        self._spawn(self._attempt, result, 0, function, args, kwargs)
+        return result
+
+    def _spawn(self, function, *args):
+        if self.spawn is None:
+            _get_retry_pool().submit(function, *args)
+        else:
+            self.spawn(function, *args)
+
+    def _schedule(self, when, *args):
+        # the timer thread is shared, so it must not run the attempt itself
+        _timer.call_at(when, self._spawn, self._attempt, *args)
+
+    def _attempt(self, result, attempt, function, args, kwargs):
+        if result.cancelled:
+            return
+        try:
+            value = function(*args, **kwargs)
+        except self.exceptions, exc:
+            attempt += 1
+            if attempt >= self.attempts or result.cancelled:
+                result.set(exc, success=False)
+                return
+            when = time.time() + self.get_delay(attempt - 1)
+            if self.budget is not None and not self.budget.withdraw():
+                result.set(exc, success=False)
+                return
+            self._schedule(when, result, attempt, function, args, kwargs)
+        except Exception, exc:
+            result.set(exc, success=False)
+        else:
+            result.set(value)
+
+    def __call__(self, function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            return self.call(function, *args, **kwargs)
+        return wrapper
+
+    def __repr__(self):
+        return (
+            '%s(attempts=%r, backoff=%r, multiplier=%r, max_backoff=%r, '
+            'jitter=%r)'
+        ) % (
+            self.__class__.__name__, self.attempts, self.backoff,
+            self.multiplier, self.max_backoff, self.jitter
+        )
+
+
+class Histogram(object):
+    """
+    Thread-safe histogram counting values in buckets, each bucket counts the
+    values lower than or equal to its upper bound given in `bounds` and
+    greater than the previous bound. An additional bucket counts the values
+    greater than the last bound.
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, bounds):
+        #: The sorted upper bounds of the buckets.
+        self.bounds = sorted(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._lock = Lock()
+        #: The number of values.
+        self.count = 0
+        #: The sum of all values.
+        self.sum = 0
+        #: The smallest value or ``None``.
+        self.min = None
+        #: The greatest value or ``None``.
+        self.max = None
+
+    def add(self, value):
+        """
+        Adds the given `value` to the histogram.
+        """
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    @property
+    def mean(self):
+        """
+        The arithmetic mean of all values or ``None``.
+        """
+        if not self.count:
+            return None
+        return self.sum / float(self.count)
+
+    def buckets(self):
+        """
+        Returns a :class:`list` of ``(upper_bound, count)`` pairs, the upper
+        bound of the last bucket is infinity.
+        """
+        return zip(self.bounds + [float('inf')], self._counts)
+
+    def percentile(self, percent):
+        """
+        Returns the upper bound of the bucket containing the given `percent`\
+        ile, which is an approximation of the actual percentile.
+
+        If the percentile is in the last bucket the :attr:`max` is returned,
+        if there are no values ``None`` is returned.
+        """
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bound, count in zip(self.bounds, self._counts):
+            seen += count
+            if seen >= rank and seen:
+                return min(bound, self.max)
+        return self.max
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.bounds)
+
+
+#: Default bucket bounds in seconds used by :class:`PoolMetrics` for time
+#: histograms.
+TIME_BOUNDS = [
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60
+]
+
+#: Default bucket bounds used by :class:`PoolMetrics` for the queue depth
+#: histogram.
+DEPTH_BOUNDS = [0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+
+
+class TaskRecord(object):
+    """
+    Record of a function executed by a pool, passed to the `hook` of
+    :class:`PoolMetrics`.
+
+    .. versionadded:: 0.6
+    """
+    __slots__ = 'function', 'submitted', 'started', 'finished', 'error'
+
+    def __init__(self, function, submitted):
+        #: The executed function.
+        self.function = function
+        #: The point in time at which the function has been submitted.
+        self.submitted = submitted
+        #: The point in time at which a worker started the function.
+        self.started = None
+        #: The point in time at which the function finished or ``None``.
+        self.finished = None
+        #: The exception raised by the function or ``None``.
+        self.error = None
+
+    @property
+    def queue_wait(self):
+        """
+        The number of seconds the function has waited for a worker.
+        """
+        return self.started - self.submitted
+
+    @property
+    def run_time(self):
+        """
+        The number of seconds the function has been running.
+        """
+        return self.finished - self.started
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.function)
+
+
+class PoolMetrics(object):
+    """
+    Records statistics about the functions executed by a pool, pass an
+    instance as `metrics` to a :class:`ThreadPool` or
+    :class:`WorkStealingPool`.
+
+    If a `hook` is given, it is called with ``'start'`` or ``'end'`` and a
+    :class:`TaskRecord` whenever a worker starts or finishes executing a
+    function, e.g. to export measurements to a monitoring system.
+
+    `time_bounds` and `depth_bounds` are used as bucket bounds for the time
+    and queue depth histograms and default to :data:`TIME_BOUNDS` and
+    :data:`DEPTH_BOUNDS`.
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, hook=None, time_bounds=TIME_BOUNDS,
+                 depth_bounds=DEPTH_BOUNDS):
+        self.hook = hook
+        #: :class:`Histogram` of the seconds functions waited for a worker.
+        self.queue_wait = Histogram(time_bounds)
+        #: :class:`Histogram` of the seconds functions have been running.
+        self.run_time = Histogram(time_bounds)
+        #: :class:`Histogram` of the number of functions waiting for a worker,
+        #: sampled whenever a function is submitted.
+        self.queue_depth = Histogram(depth_bounds)
+        #: The number of workers of the pool.
+        self.workers = None
+        #: The number of submitted, completed, failed and cancelled
+        #: functions.
+        self.submitted = self.completed = self.errors = self.cancelled = 0
+        #: The number of workers currently executing a function.
+        self.busy = 0
+        self._busy_time = 0.0
+        self._created = time.time()
+        self._lock = Lock()
+
+    @property
+    def utilization(self):
+        """
+        The fraction of the time since the metrics have been created during
+        which workers have been executing functions, between 0 and 1.
+        """
+        elapsed = (time.time() - self._created) * (self.workers or 1)
+        if elapsed <= 0:
+            return 0.0
+        return min(self._busy_time / elapsed, 1.0)
+
+    def _call_hook(self, event, record):
+        if self.hook is None:
+            return
+        try:
+            self.hook(event, record)
+        except Exception:
+            # a broken hook must not take down the worker
+            sys.excepthook(*sys.exc_info())
+
+    def task_submitted(self, queue_depth):
+        """
+        Called by the pool when a function is submitted, with the number of
+        functions waiting for a worker at that point.
+        """
+        with self._lock:
+            self.submitted += 1
+        self.queue_depth.add(queue_depth)
+
+    def task_cancelled(self, record):
+        """
+        Called by the pool if a function is not executed because its result
+        has been cancelled.
+        """
+        with self._lock:
+            self.cancelled += 1
+
+    def task_started(self, record):
+        """
+        Called by the pool when a worker starts executing a function.
+        """
+        with self._lock:
+            self.busy += 1
+        self.queue_wait.add(record.queue_wait)
+        self._call_hook('start', record)
+
+    def task_finished(self, record):
+        """
+        Called by the pool when a worker has finished executing a function.
+        """
+        run_time = record.run_time
+        with self._lock:
+            self.busy -= 1
+            self.completed += 1
+            if record.error is not None:
+                self.errors += 1
+            self._busy_time += run_time
+        self.run_time.add(run_time)
+        self._call_hook('end', record)
+
+    def __repr__(self):
+        return '<%s submitted=%d completed=%d errors=%d>' % (
+            self.__class__.__name__, self.submitted, self.completed,
+            self.errors
+        )
+
+
+class ThreadPool(object):
+    """
+    Executes functions on `workers` threads, which take the functions from a
+    single queue shared by all of them. `workers` defaults to the number of
+    processors.
+
+    If :class:`PoolMetrics` are given as `metrics`, the pool records
+    statistics about the executed functions in them.
+
+    A pool can be used as a context manager, which closes and joins the pool
+    on exit.
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, workers=None, metrics=None):
+        #: The number of worker threads.
+        self.workers = get_cpu_count(1) if workers is None else workers
+        #: The :class:`PoolMetrics` or ``None``.
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.workers = self.workers
+        #: ``True`` if the pool has been closed.
+        self.closed = False
+        self._threads = []
+        self._setup()
+        for index in xrange(self.workers):
+            thread = Thread(target=self._work, args=(index, ))
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _setup(self):
+        self._queue = Queue()
+
+    @property
+    def queue_depth(self):
+        """
+        The number of functions waiting for a worker.
+        """
+        return self._queue.qsize()
+
+    def _put(self, task):
+        self._queue.put(task)
+
+    def _shutdown(self):
+        for _ in xrange(self.workers):
+            self._queue.put(None)
+
+    def _work(self, index):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            self._run_task(task)
+
+    def _run_task(self, task):
+        result, function, args, kwargs, submitted = task
+        if submitted is not None:
+            self._run_measured_task(task)
+            return
+        if result.cancelled:
+            return
+        try:
+            value = function(*args, **kwargs)
+        except Exception, exc:
+            _set_result(result, exc, success=False)
+        else:
+            _set_result(result, value)
+
+    def _run_measured_task(self, task):
+        result, function, args, kwargs, submitted = task
+        record = TaskRecord(function, submitted)
+        if result.cancelled:
+            self.metrics.task_cancelled(record)
+            return
+        record.started = time.time()
+        self.metrics.task_started(record)
+        try:
+            value = function(*args, **kwargs)
+        except Exception, exc:
+            record.finished = time.time()
+            record.error = exc
+            self.metrics.task_finished(record)
+            _set_result(result, exc, success=False)
+        else:
+            record.finished = time.time()
+            self.metrics.task_finished(record)
+            _set_result(result, value)
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Calls `function` with the given arguments on a worker thread and
+        returns an :class:`AsyncResult` for the return value.
+
+        If the result is cancelled before a worker takes up the function, the
+        function is not called. Raises :exc:`RuntimeError` if the pool has
+        been closed.
+        """
+        if self.closed:
+            raise RuntimeError('pool is closed')
+        result = AsyncResult()
+        if self.metrics is None:
+            self._put((result, function, args, kwargs, None))
+        else:
+            self.metrics.task_submitted(self.queue_depth)
+            self._put((result, function, args, kwargs, time.time()))
+        return result
+
+    def map(self, function, iterable):
+        """
+        Calls `function` with each item of the given `iterable` on the worker
+        threads and returns a :class:`list` of the results, in order.
+        """
+        results = [self.submit(function, item) for item in iterable]
+        return [result.get() for result in results]
+
+    def close(self):
+        """
+        Prevents further functions from being submitted, functions submitted
+        so far are still executed.
+        """
+        if not self.closed:
+            self.closed = True
+            self._shutdown()
+
+    def join(self, timeout=None):
+        """
+        Blocks until all worker threads have stopped, which happens once the
+        pool has been closed and all submitted functions have been executed.
+        """
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        self.join()
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.workers)
+
+
+class WorkStealingPool(ThreadPool):
+    """
+    A :class:`ThreadPool` whose workers each have their own double-ended
+    queue instead of sharing one.
+
+    Functions submitted from outside the pool are distributed among the
+    queues in turns, functions submitted by a worker are added to its own
+    queue. Workers take functions from the end of their own queue, which
+    keeps recently submitted - and likely cache-hot - functions local. If
+    their queue is empty they steal from the other end of another worker's
+    queue, so that workers which got slow functions do not hold up the rest
+    of the work. This makes :class:`WorkStealingPool` a better fit than a
+    :class:`ThreadPool` for functions whose durations vary wildly and for
+    functions submitting further functions.
+
+    .. versionadded:: 0.6
+    """
+    def _setup(self):
+        self._deques = [deque() for _ in xrange(self.workers)]
+        self._local = local()
+        self._next_deque = count().next
+        self._condition = Condition(Lock())
+        self._idle = 0
+
+    @property
+    def queue_depth(self):
+        """
+        The number of functions waiting for a worker.
+        """
+        return sum(map(len, self._deques))
+
+    def _put(self, task):
+        index = getattr(self._local, 'index', None)
+        if index is None:
+            index = self._next_deque() % self.workers
+        self._deques[index].append(task)
+        # only take the lock if there might be a worker to wake up
+        if self._idle:
+            with self._condition:
+                self._condition.notify()
+
+    def _shutdown(self):
+        with self._condition:
+            self._condition.notifyAll()
+
+    def _steal(self, index):
+        for offset in xrange(1, self.workers):
+            victim = self._deques[(index + offset) % self.workers]
+            if victim:
+                try:
+                    return victim.popleft()
+                except IndexError:
+                    # another worker emptied the queue in the meantime
+                    pass
+        return None
+
+    def _has_tasks(self):
+        for tasks in self._deques:
+            if tasks:
+                return True
+        return False
+
+    def _work(self, index):
+        self._local.index = index
+        tasks = self._deques[index]
+        while True:
+            task = None
+            if tasks:
+                try:
+                    task = tasks.pop()
+                except IndexError:
+                    # the task has been stolen
+                    pass
+            if task is None:
+                task = self._steal(index)
+            if task is not None:
+                self._run_task(task)
+                continue
+            with self._condition:
+                self._idle += 1
+                if not self._has_tasks():
+                    if self.closed:
+                        self._idle -= 1
+                        return
+                    self._condition.wait()
+                self._idle -= 1
+
+
+class _Job(object):
+    __slots__ = (
+        'result', 'function', 'args', 'kwargs', 'interval', 'fixed_rate',
+        'due'
+    )
+
+    def __init__(self, function, args, kwargs, due, interval=None,
+                 fixed_rate=False):
+        self.result = AsyncResult()
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.due = due
+        self.interval = interval
+        self.fixed_rate = fixed_rate
+
+
+class Scheduler(object):
+    """
+    Calls functions after a delay or repeatedly, using a single timer thread
+    which keeps the scheduled calls in a heap ordered by the time they are
+    due, no matter how many calls are scheduled.
+
+    Due functions are submitted to the given `pool`, e.g. a
+    :class:`ThreadPool`, so that long running functions do not delay others.
+    If no `pool` is given functions are called on the timer thread.
+
+    Every method scheduling a function returns an :class:`AsyncResult`,
+    cancelling it cancels the scheduled call or calls.
+
+    Call :meth:`close` or use the scheduler as a context manager to stop the
+    timer thread once the scheduler is no longer needed.
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, pool=None):
+        self.pool = pool
+        self._timer = _Timer()
+
+    def call_at(self, when, function, *args, **kwargs):
+        """
+        Calls `function` with the given arguments at the point in time
+        `when`, as returned by :func:`time.time`, and returns an
+        :class:`AsyncResult` for the return value.
+        """
+        return self._schedule(_Job(function, args, kwargs, when))
+
+    def call_later(self, delay, function, *args, **kwargs):
+        """
+        Calls `function` with the given arguments after `delay` seconds and
+        returns an :class:`AsyncResult` for the return value.
+        """
+        return self.call_at(time.time() + delay, function, *args, **kwargs)
+
+    def call_fixed_rate(self, interval, function, *args, **kwargs):
+        """
+        Calls `function` with the given arguments every `interval` seconds,
+        measured from the point in time at which the previous call was due.
+
+        Calls never overlap, if a call takes longer than `interval` the next
+        one is made as soon as it has finished and calls which would have
+        been due in the meantime are skipped.
+
+        The returned :class:`AsyncResult` is only set if `function` raises an
+        exception, which stops further calls.
+        """
+        job = _Job(
+            function, args, kwargs, time.time() + interval, interval, True
+        )
+        return self._schedule(job)
+
+    def call_fixed_delay(self, interval, function, *args, **kwargs):
+        """
+        Calls `function` with the given arguments repeatedly, waiting
+        `interval` seconds after a call has finished before making the next.
+
+        The returned :class:`AsyncResult` is only set if `function` raises an
+        exception, which stops further calls.
+        """
+        job = _Job(function, args, kwargs, time.time() + interval, interval)
+        return self._schedule(job)
+
+    @property
+    def closed(self):
+        """
+        ``True`` if the scheduler has been closed.
+        """
+        return self._timer._closed
+
+    def _schedule(self, job):
+        try:
+            self._timer.call_at(job.due, self._dispatch, job)
+        except RuntimeError:
+            raise RuntimeError('scheduler is closed')
+        return job.result
+
+    def close(self):
+        """
+        Stops the timer thread and cancels all calls which are not due yet.
+        Calls which are already running are finished but repeated calls are
+        not scheduled again.
+
+        Scheduling calls afterwards raises :exc:`RuntimeError`.
+        """
+        for entry in self._timer.close():
+            job = entry[3][0]
+            job.result.cancel()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _dispatch(self, job):
+        if job.result.cancelled:
+            return
+        if self.pool is None:
+            self._execute(job)
+            return
+        try:
+            self.pool.submit(self._execute, job)
+        except Exception, exc:
+            job.result.set(exc, success=False)
+
+    def _execute(self, job):
+        if job.result.cancelled:
+            return
+        try:
+            value = job.function(*job.args, **job.kwargs)
+        except Exception, exc:
+            job.result.set(exc, success=False)
+            return
+        if job.interval is None:
+            job.result.set(value)
+            return
+        now = time.time()
+        if job.fixed_rate:
+            job.due += job.interval
+            if job.due < now:
+                # skip the calls we have missed
+                missed = int((now - job.due) / job.interval) + 1
+                job.due += missed * job.interval
+        else:
+            job.due = now + job.interval
+        if not job.result.cancelled:
+            try:
+                self._schedule(job)
+            except RuntimeError:
+                job.result.cancel()
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.pool)
+
+
+try:
+    _buffer_types = (buffer, memoryview)
+except NameError:
+    # memoryview has been added with Python 2.7
+    _buffer_types = (buffer, )
+
+try:
+    _bytearray_types = (bytearray, )
+except NameError:
+    # bytearray has been added with Python 2.6
+    _bytearray_types = ()
+
+if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+    # a memory backed filesystem available on most linux systems
+    _shared_directory = '/dev/shm'
+else:
+    _shared_directory = None
+
+
+class SharedBuffer(object):
+    """
+    Picklable handle to the contents of a buffer residing in a memory mapped
+    temporary file.
+
+    Returning a :class:`SharedBuffer` instead of a large buffer from a
+    function executed in another process, e.g. by a
+    :class:`multiprocessing.Pool`, avoids pickling the buffer and copying it
+    through a pipe, only the small handle is transferred.
+
+    The temporary file is created in `directory`, which defaults to
+    :file:`/dev/shm` where available and otherwise to the default directory
+    of :mod:`tempfile`. The file is removed once the receiving process has
+    called :meth:`open`, :meth:`load` or :meth:`discard`.
+
+    .. versionadded:: 0.6
+    """
+    @classmethod
+    def allocate(cls, size, kind='bytes', typecode=None, directory=None):
+        """
+        Creates a temporary file of the given `size` and returns a tuple of
+        a :class:`SharedBuffer` for it and a writable :class:`mmap.mmap` of
+        the file.
+
+        Writing a result directly into the returned map avoids copying it at
+        all in the process creating it.
+
+        Raises :exc:`ValueError` if `size` is 0, as empty files cannot be
+        mapped.
+        """
+        if size <= 0:
+            raise ValueError('cannot share an empty buffer')
+        if directory is None:
+            directory = _shared_directory
+        fd, path = tempfile.mkstemp(prefix='brownie-', dir=directory)
+        file = os.fdopen(fd, 'w+b')
+        try:
+            try:
+                file.truncate(size)
+                mapping = mmap.mmap(file.fileno(), size)
+            except:
+                os.remove(path)
+                raise
+        finally:
+            file.close()
+        return cls(path, size, kind, typecode), mapping
+
+    @classmethod
+    def from_object(cls, obj, directory=None):
+        """
+        Writes the given :class:`str`, :class:`bytearray`,
+        :class:`array.array` or buffer `obj` to a temporary file and returns a
+        :class:`SharedBuffer` for it.
+
+        Raises :exc:`ValueError` if `obj` is empty, see :meth:`allocate`.
+        """
+        typecode = None
+        if isinstance(obj, str):
+            kind = 'bytes'
+        elif isinstance(obj, _bytearray_types):
+            kind = 'bytearray'
+        elif isinstance(obj, array):
+            kind = 'array'
+            typecode = obj.typecode
+        elif isinstance(obj, _buffer_types):
+            kind = 'bytes'
+            if not isinstance(obj, buffer):
+                obj = obj.tobytes()
+        else:
+            raise TypeError('expected a buffer, got %r' % obj)
+        size = len(obj)
+        if kind == 'array':
+            size *= obj.itemsize
+        shared, mapping = cls.allocate(size, kind, typecode, directory)
+        try:
+            mapping.write(buffer(obj))
+        finally:
+            mapping.close()
+        return shared
+
+    def __init__(self, path, size, kind='bytes', typecode=None):
+        #: The path to the temporary file.
+        self.path = path
+        #: The size of the buffer in bytes.
+        self.size = size
+        #: The type :meth:`load` returns, one of ``'bytes'``,
+        #: ``'bytearray'`` or ``'array'``.
+        self.kind = kind
+        #: The typecode of the :class:`array.array` :meth:`load` returns.
+        self.typecode = typecode
+
+    def open(self):
+        """
+        Returns a :class:`mmap.mmap` of the buffer and removes the temporary
+        file.
+
+        The buffer is not copied, changes to the returned map are private to
+        the calling process.
+        """
+        file = open(self.path, 'r+b')
+        try:
+            mapping = mmap.mmap(
+                file.fileno(), self.size, access=mmap.ACCESS_COPY
+            )
+        finally:
+            file.close()
+        self.discard()
+        return mapping
+
+    def load(self):
+        """
+        Returns a copy of the buffer as an object of the type the buffer has
+        been created from and removes the temporary file.
+        """
+        mapping = self.open()
+        try:
+            data = mapping[:]
+        finally:
+            mapping.close()
+        if self.kind == 'bytearray':
+            return bytearray(data)
+        elif self.kind == 'array':
+            result = array(self.typecode)
+            result.fromstring(data)
+            return result
+        return data
+
+    def discard(self):
+        """
+        Removes the temporary file without reading it.
+        """
+        try:
+            os.remove(self.path)
+        except OSError:
+            # already removed
+            pass
+
+    def __repr__(self):
+        return '%s(%r, %r, kind=%r, typecode=%r)' % (
+            self.__class__.__name__, self.path, self.size, self.kind,
+            self.typecode
+        )
+
+
+#: The size in bytes from which on :func:`share` puts buffers into shared
+#: memory.
+SHARE_THRESHOLD = 64 * 1024
+
+
+def share(obj, threshold=SHARE_THRESHOLD):
+    """
+    Returns a :class:`SharedBuffer` for `obj` if it is a :class:`str`,
+    :class:`bytearray`, :class:`array.array` or buffer of at least
+    `threshold` bytes, otherwise `obj` is returned unchanged. Empty objects
+    are never shared.
+
+    .. versionadded:: 0.6
+    """
+    if isinstance(obj, (str, array) + _bytearray_types + _buffer_types):
+        size = len(obj)
+        if isinstance(obj, array):
+            size *= obj.itemsize
+        if size and size >= threshold:
+            return SharedBuffer.from_object(obj)
+    return obj
+
+
+def unshare(obj):
+    """
+    Returns the object loaded from `obj` if it is a :class:`SharedBuffer`,
+    otherwise `obj` is returned unchanged.
+
+    .. versionadded:: 0.6
+    """
+    if isinstance(obj, SharedBuffer):
+        return obj.load()
+    return obj
+
+
+class SharedResult(object):
+    """
+    Wraps the given `function` so that large buffers it returns are passed
+    to :func:`share`.
+
+    Unlike a decorated function, instances can be pickled as long as
+    `function` can be pickled, so they can be passed to a process pool::
+
+        pool = multiprocessing.Pool()
+        data = unshare(pool.apply(SharedResult(render), (scene, )))
+
+    .. versionadded:: 0.6
+    """
+    def __init__(self, function, threshold=SHARE_THRESHOLD):
+        self.function = function
+        self.threshold = threshold
+
+    def __call__(self, *args, **kwargs):
+        return share(self.function(*args, **kwargs), self.threshold)
+
+    def __repr__(self):
+        return '%s(%r, threshold=%r)' % (
+            self.__class__.__name__, self.function, self.threshold
+        )
+
+
+__all__ = [
+    'get_cpu_count', 'TimeoutError', 'CancelledError', 'AsyncResult',
+    'Batcher', 'Stage', 'Pipeline', 'Acquisition', 'TokenBucket',
+    'KeyedTokenBucket', 'KeyedSemaphore', 'RetryBudget', 'Retry',
+    'RETRY_WORKERS', 'ThreadPool', 'WorkStealingPool', 'SharedBuffer',
+    'SHARE_THRESHOLD', 'share', 'unshare', 'SharedResult', 'Histogram',
+    'TIME_BOUNDS', 'DEPTH_BOUNDS', 'TaskRecord', 'PoolMetrics', 'Scheduler'
+]
@@ -9,9 +9,15 @@
     :license: BSD, see LICENSE.rst for details
 """
 from __future__ import with_statement
+import gc
 import time
-from Queue import Queue
-from threading import Thread, Event
+from weakref import ref
+try:
+    from Queue import Queue
+except ImportError:
+    # Python 3, needed for the contextvars tests
+    from queue import Queue
+from threading import Thread, Event, Lock, local
 
 from attest import Tests, TestBase, Assert, test, test_if
 
@@ -20,12 +26,27 @@ try:
 except ImportError:
     eventlet = None
 
+try:
+    import gevent
+except ImportError:
+    gevent = None
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
 from brownie.context import (
     ContextStackManagerBase, ContextStackManagerThreadMixin,
-    ContextStackManagerEventletMixin
+    ContextStackManagerEventletMixin, ContextStackManagerGeventMixin,
+    ContextStackManagerContextVarMixin, make_context_mixin
 )
 
 
+class Object(object):
+    pass
+
+
 class TestContextStackManagerBase(TestBase):
     @test
     def application_context(self):
@@ -40,6 +61,23 @@ class TestContextStackManagerBase(TestBase):
         with Assert.raises(RuntimeError):
             csm.pop_application()
 
+    @test
+    def concurrent_application_changes(self):
+        csm = ContextStackManagerBase()
+        csm.push_application('foo')
+
+        def push_pop(csm):
+            for _ in range(1000):
+                csm.push_application('bar')
+                csm.pop_application()
+
+        threads = [Thread(target=push_pop, args=(csm, )) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        Assert(list(csm.iter_current_stack())) == ['foo']
+
     @test_if(eventlet)
     def context_inheritance(self):
         class FooContextManager(
@@ -140,6 +178,75 @@ class TestContextStackManagerThreadMixin(TestBase):
         Assert(list(csm.iter_current_stack())) == ['bar', 'foo']
         Assert(csm.pop_thread()) == 'bar'
         Assert(list(csm.iter_current_stack())) == ['foo']
+        Assert(csm.pop_thread()) == 'foo'
+        with Assert.raises(RuntimeError):
+            csm.pop_thread()
+
+    @test
+    def cache_invalidation(self):
+        csm = ThreadContextStackManager()
+        csm.push_thread('foo')
+        Assert(list(csm.iter_current_stack())) == ['foo']
+        cached = csm._get_current_stack()
+
+        def foo(csm):
+            csm.push_thread('bar')
+            list(csm.iter_current_stack())
+            csm.pop_thread()
+
+        thread = Thread(target=foo, args=(csm, ))
+        thread.start()
+        thread.join()
+        Assert(list(csm.iter_current_stack())) == ['foo']
+        Assert(csm._get_current_stack()).is_(cached)
+
+        csm.push_application('bar')
+        Assert(list(csm.iter_current_stack())) == ['foo', 'bar']
+        Assert(csm.pop_application()) == 'bar'
+        Assert(list(csm.iter_current_stack())) == ['foo']
+
+    @test
+    def application_changes(self):
+        csm = ThreadContextStackManager()
+        csm.push_application('foo')
+        started = Event()
+        pushed = Event()
+
+        def foo(csm, queue):
+            csm.push_thread('bar')
+            queue.put(list(csm.iter_current_stack()))
+            started.set()
+            pushed.wait()
+            queue.put(list(csm.iter_current_stack()))
+
+        queue = Queue()
+        thread = Thread(target=foo, args=(csm, queue))
+        thread.start()
+        started.wait()
+        csm.push_application('baz')
+        pushed.set()
+        thread.join()
+        Assert(queue.get()) == ['bar', 'foo']
+        Assert(queue.get()) == ['bar', 'baz', 'foo']
+
+    @test
+    def thread_lifetime(self):
+        csm = ThreadContextStackManager()
+        csm.push_application('foo')
+        queue = Queue()
+
+        def foo(csm):
+            obj = Object()
+            queue.put(ref(obj))
+            csm.push_thread(obj)
+            list(csm.iter_current_stack())
+
+        thread = Thread(target=foo, args=(csm, ))
+        thread.start()
+        thread.join()
+        gc.collect()
+        Assert(queue.get()()).is_(None)
+        Assert(list(csm.iter_current_stack())) == ['foo']
 
 
 class EventletContextStackManager(
@@ -205,7 +312,195 @@ class TestContextStackManagerEventletMixin(TestBase):
                 EventletContextStackManager()
 
 
+class GeventContextStackManager(
+        ContextStackManagerGeventMixin,
+        ContextStackManagerThreadMixin,
+        ContextStackManagerBase
+    ):
+    pass
+
+
+class TestContextStackManagerGeventMixin(TestBase):
+    if gevent:
+        @test
+        def inherits_stacks(self):
+            csm = GeventContextStackManager()
+            csm.push_application('foo')
+            csm.push_thread('bar')
+
+            def foo(csm):
+                stacks = [list(csm.iter_current_stack())]
+                csm.push_greenlet('baz')
+                stacks.append(list(csm.iter_current_stack()))
+                return stacks
+
+            Assert(gevent.spawn(foo, csm).get()) == [
+                ['bar', 'foo'],
+                ['baz', 'bar', 'foo']
+            ]
+            Assert(list(csm.iter_current_stack())) == ['bar', 'foo']
+
+        @test
+        def multiple_greenlet_contexts(self):
+            csm = GeventContextStackManager()
+
+            def foo(csm, name):
+                csm.push_greenlet(name)
+                gevent.sleep(0)
+                return list(csm.iter_current_stack())
+
+            foo_greenlet = gevent.spawn(foo, csm, 'foo')
+            bar_greenlet = gevent.spawn(foo, csm, 'bar')
+            Assert(foo_greenlet.get()) == ['foo']
+            Assert(bar_greenlet.get()) == ['bar']
+
+        @test
+        def basics(self):
+            csm = GeventContextStackManager()
+            with Assert.raises(RuntimeError):
+                csm.pop_greenlet()
+            csm.push_greenlet('foo')
+            Assert(list(csm.iter_current_stack())) == ['foo']
+            Assert(csm.pop_greenlet()) == 'foo'
+            Assert(list(csm.iter_current_stack())) == []
+    else:
+        @test
+        def init(self):
+            with Assert.raises(RuntimeError):
+                GeventContextStackManager()
+
+
+class TestMakeContextMixin(TestBase):
+    @test
+    def basics(self):
+        mixin = make_context_mixin('request', local, Lock)
+        Assert(mixin.__name__) == 'ContextStackManagerRequestMixin'
+
+        class ContextStackManager(
+                mixin,
+                ContextStackManagerThreadMixin,
+                ContextStackManagerBase
+            ):
+            pass
+
+        csm = ContextStackManager()
+        with Assert.raises(RuntimeError):
+            csm.pop_request()
+        csm.push_application('foo')
+        csm.push_thread('bar')
+        csm.push_request('baz')
+        Assert(list(csm.iter_current_stack())) == ['baz', 'bar', 'foo']
+        csm.push_application('spam')
+        Assert(list(csm.iter_current_stack())) == [
+            'baz', 'bar', 'spam', 'foo'
+        ]
+        Assert(csm.pop_request()) == 'baz'
+        Assert(list(csm.iter_current_stack())) == ['bar', 'spam', 'foo']
+
+    @test
+    def multiple_contexts(self):
+        csm = type(
+            'ContextStackManager',
+            (make_context_mixin('request', local), ContextStackManagerBase),
+            {}
+        )()
+        csm.push_application('foo')
+
+        def foo(csm, queue):
+            csm.push_request('bar')
+            queue.put(list(csm.iter_current_stack()))
+
+        queue = Queue()
+        thread = Thread(target=foo, args=(csm, queue))
+        thread.start()
+        thread.join()
+        Assert(queue.get()) == ['bar', 'foo']
+        Assert(list(csm.iter_current_stack())) == ['foo']
+
+
+class ContextVarContextStackManager(
+        ContextStackManagerContextVarMixin,
+        ContextStackManagerThreadMixin,
+        ContextStackManagerBase
+    ):
+    pass
+
+
+class TestContextStackManagerContextVarMixin(TestBase):
+    if contextvars:
+        @test
+        def basics(self):
+            csm = ContextVarContextStackManager()
+            with Assert.raises(RuntimeError):
+                csm.pop_context()
+            csm.push_context('foo')
+            Assert(list(csm.iter_current_stack())) == ['foo']
+            csm.push_context('bar')
+            Assert(list(csm.iter_current_stack())) == ['bar', 'foo']
+            Assert(csm.pop_context()) == 'bar'
+            Assert(list(csm.iter_current_stack())) == ['foo']
+            Assert(csm.pop_context()) == 'foo'
+            Assert(list(csm.iter_current_stack())) == []
+
+        @test
+        def inherits_stacks(self):
+            csm = ContextVarContextStackManager()
+            csm.push_application('foo')
+            csm.push_thread('bar')
+            csm.push_context('baz')
+
+            def task():
+                stacks = [list(csm.iter_current_stack())]
+                csm.push_context('spam')
+                stacks.append(list(csm.iter_current_stack()))
+                return stacks
+
+            stacks = contextvars.copy_context().run(task)
+            Assert(stacks) == [
+                ['baz', 'bar', 'foo'],
+                ['spam', 'baz', 'bar', 'foo']
+            ]
+            Assert(list(csm.iter_current_stack())) == ['baz', 'bar', 'foo']
+
+        @test
+        def multiple_contexts(self):
+            csm = ContextVarContextStackManager()
+
+            def make_task(name):
+                def task():
+                    csm.push_context(name)
+                    return list(csm.iter_current_stack())
+                return task
+
+            foo_context = contextvars.copy_context()
+            bar_context = contextvars.copy_context()
+            Assert(foo_context.run(make_task('foo'))) == ['foo']
+            Assert(bar_context.run(make_task('bar'))) == ['bar']
+            Assert(list(foo_context.run(csm.iter_current_stack))) == ['foo']
+            Assert(list(csm.iter_current_stack())) == []
+
+        @test
+        def context_lifetime(self):
+            csm = ContextVarContextStackManager()
+
+            def task():
+                obj = Object()
+                csm.push_context(obj)
+                list(csm.iter_current_stack())
+                return ref(obj)
+
+            reference = contextvars.copy_context().run(task)
+            gc.collect()
+            Assert(reference()).is_(None)
+    else:
+        @test
+        def init(self):
+            with Assert.raises(RuntimeError):
+                ContextVarContextStackManager()
+
+
 tests = Tests([
     TestContextStackManagerBase, TestContextStackManagerThreadMixin,
-    TestContextStackManagerEventletMixin
+    TestContextStackManagerEventletMixin, TestContextStackManagerGeventMixin,
+    TestMakeContextMixin, TestContextStackManagerContextVarMixin
 ])
@@ -17,15 +17,21 @@ from attest import Tests, TestBase, test, test_if, Assert
 from brownie.datastructures import (
     ImmutableDict,
     CombinedDict,
+    LayeredDict,
     MultiDict,
+    FlatMultiDict,
     ImmutableMultiDict,
     CombinedMultiDict,
     OrderedDict,
+    CompactOrderedDict,
     OrderedMultiDict,
     ImmutableOrderedDict,
     ImmutableOrderedMultiDict,
     FixedDict,
-    Counter
+    PersistentDict,
+    Counter,
+    HeavyHittersCounter,
+    CountMinSketch
 )
 
 
@@ -234,7 +240,45 @@ class ImmutableDictTestMixin(DictTestMixin):
             d.clear()
 
 
-class TestImmutableDict(TestBase, ImmutableDictTestMixin):
+class CachedHashTestMixin(object):
+    @test
+    def cached_hash(self):
+        d = self.dict_class([(1, 2), (3, 4)])
+        calls = []
+        compute_hash = d._compute_hash
+        def counting_compute_hash():
+            calls.append(True)
+            return compute_hash()
+        d._compute_hash = counting_compute_hash
+        Assert(hash(d)) == hash(d)
+        Assert(len(calls)) == 1
+
+    @test
+    def equality_with_hash(self):
+        a = self.dict_class([(1, 2), (3, 4)])
+        b = self.dict_class([(1, 2), (3, 5)])
+        hash(a), hash(b)
+        Assert(a == b) == False
+        Assert(a != b) == True
+        c = self.dict_class(a)
+        hash(c)
+        Assert(a == c) == True
+        Assert(a != c) == False
+        Assert(a == a) == True
+
+    @test
+    def pickled_hash(self):
+        d = self.dict_class([(1, 2), (3, 4)])
+        hash(d)
+        for protocol in xrange(2):
+            unpickled = pickle.loads(pickle.dumps(d, protocol))
+            Assert(unpickled) == d
+            Assert('_hash' not in unpickled.__dict__) == True
+            Assert(hash(unpickled)) == hash(d)
+
+
+class TestImmutableDict(TestBase, ImmutableDictTestMixin,
+                        CachedHashTestMixin):
     dict_class = ImmutableDict
 
     @test_if(GE_PYTHON_26)
@@ -251,6 +295,11 @@ class TestImmutableDict(TestBase, ImmutableDictTestMixin):
             hash(ImmutableDict({1: []}))
 
 
+class IndexedCombinedDict(CombinedDict):
+    def __init__(self, dicts=None):
+        CombinedDict.__init__(self, dicts, indexed=True)
+
+
 class CombinedDictTestMixin(object):
     # .fromkeys() doesn't work here, so we don't need that test
     test_custom_new = None
@@ -317,6 +366,171 @@ class TestCombinedDict(TestBase, CombinedDictTestMixin, ImmutableDictTestMixin):
             hash(CombinedDict([{}]))
 
 
+class TestIndexedCombinedDict(TestBase, CombinedDictTestMixin,
+                              ImmutableDictTestMixin):
+    dict_class = IndexedCombinedDict
+
+    @test
+    def changes(self):
+        a, b = {1: 2}, {1: 3, 4: 5}
+        d = self.dict_class([a, b])
+        Assert(d.keys()) == [1, 4]
+        Assert(len(d)) == 2
+        Assert(d[1]) == 2
+
+        del a[1]
+        Assert(d[1]) == 3
+        a[6] = 7
+        Assert(d.keys()) == [6, 1, 4]
+        Assert(len(d)) == 3
+        b[4] = 8
+        Assert(d[4]) == 8
+
+        d.dicts.append({9: 10})
+        Assert(9 in d)
+        Assert(len(d)) == 4
+        d.dicts.pop(0)
+        Assert(6 not in d)
+        Assert(d.keys()) == [1, 4, 9]
+
+        b[11] = b.pop(4)
+        Assert(4 not in d)
+        Assert(d[11]) == 8
+        with Assert.raises(KeyError):
+            d[4]
+
+        b[9] = b.pop(11)
+        d.invalidate()
+        Assert(d[9]) == 8
+        Assert(d.keys()) == [1, 9]
+
+    @test
+    def replaced_keys(self):
+        a = {1: 'a'}
+        d = self.dict_class([a])
+        Assert(d.keys()) == [1]
+        del a[1]
+        a[2] = 'c'
+        Assert(1 not in d)
+        Assert(d.get(1)).is_(None)
+        Assert(2 in d)
+        Assert(d.get(2)) == 'c'
+        Assert(d.keys()) == [2]
+
+        a[3] = 'd'
+        Assert(d.keys()) == [2, 3]
+        del a[3]
+        a[4] = 'e'
+        d.invalidate()
+        Assert(d.keys()) == [2, 4]
+        Assert(d.items()) == [(2, 'c'), (4, 'e')]
+        Assert(len(d)) == 2
+
+
+class TestLayeredDict(TestBase):
+    @test
+    def init(self):
+        d = LayeredDict()
+        Assert(d.dicts) == [{}]
+        d[1] = 2
+        Assert(d.dicts) == [{1: 2}]
+
+    @test
+    def writes_to_top_layer(self):
+        defaults = ImmutableDict({1: 2, 3: 4})
+        d = LayeredDict([{}, defaults])
+        d[1] = 5
+        d.update({6: 7}, eight=9)
+        Assert(d[1]) == 5
+        Assert(d[3]) == 4
+        Assert(d.setdefault(3, 10)) == 4
+        Assert(d.setdefault(11, 12)) == 12
+        Assert(d.dicts[0]) == {1: 5, 6: 7, 'eight': 9, 11: 12}
+        Assert(defaults) == {1: 2, 3: 4}
+        Assert(len(d)) == 5
+
+    @test
+    def removal(self):
+        d = LayeredDict([{1: 2}, {1: 3, 4: 5}])
+        del d[1]
+        Assert(d[1]) == 3
+        with Assert.raises(KeyError):
+            del d[1]
+        with Assert.raises(KeyError):
+            d.pop(4)
+        Assert(d.pop(4, None)).is_(None)
+        d[6] = 7
+        Assert(d.pop(6)) == 7
+        d[6] = 7
+        Assert(d.popitem()) == (6, 7)
+        with Assert.raises(KeyError):
+            d.popitem()
+        d[6] = 7
+        d.clear()
+        Assert(d) == {1: 3, 4: 5}
+
+    @test
+    def new_child(self):
+        d = LayeredDict([{1: 2}, {3: 4}])
+        child = d.new_child()
+        child[1] = 5
+        Assert(child[1]) == 5
+        Assert(child[3]) == 4
+        Assert(d[1]) == 2
+        Assert(child.dicts[1:]) == d.dicts
+        Assert(child.dicts[1]).is_(d.dicts[0])
+        Assert(child.new_child({3: 6})[3]) == 6
+
+    @test
+    def parents(self):
+        d = LayeredDict([{1: 2}, {3: 4}])
+        Assert(d.parents.dicts) == [{3: 4}]
+        Assert(d.parents.parents.dicts) == [{}]
+
+    @test
+    def copy(self):
+        base = {3: 4}
+        d = LayeredDict([{1: 2}, base])
+        copy = d.copy()
+        copy[1] = 5
+        Assert(d[1]) == 2
+        Assert(copy.dicts[1]).is_(base)
+
+    @test
+    def indexed(self):
+        d = LayeredDict([{}, {1: 2}], indexed=True)
+        d[3] = 4
+        Assert(len(d)) == 2
+        del d[3]
+        d[5] = 6
+        Assert(d.keys()) == [5, 1]
+        Assert(3 not in d)
+        Assert(d.new_child().indexed) == True
+        Assert(d.parents.indexed) == True
+        Assert(d.copy().indexed) == True
+        Assert(LayeredDict().new_child().indexed) == False
+
+    @test
+    def equality(self):
+        d = LayeredDict([{1: 2}, {1: 3, 4: 5}])
+        Assert(d) == {1: 2, 4: 5}
+        Assert(d) == LayeredDict([{1: 2, 4: 5}])
+        Assert(d) != {1: 3, 4: 5}
+        Assert(d) == CombinedDict([{1: 2, 4: 5}])
+
+    @test
+    def hashability(self):
+        with Assert.raises(TypeError):
+            hash(LayeredDict())
+
+    @test
+    def picklability(self):
+        d = LayeredDict([{1: 2}, {3: 4}])
+        pickled = pickle.loads(pickle.dumps(d))
+        Assert(pickled) == d
+        Assert(pickled.dicts) == d.dicts
+
+
 class MultiDictTestMixin(object):
     dict_class = None
 
@@ -413,6 +627,51 @@ class MultiDictTestMixin(object):
         with Assert.raises(KeyError):
             d.popitemlist()
 
+    @test
+    def from_urlencoded(self):
+        d = self.dict_class.from_urlencoded(
+            'foo=bar&spam=eggs&foo=b%C3%A4z+qux&&flag&empty='
+        )
+        Assert(d.__class__).is_(self.dict_class)
+        Assert(d.getlist('foo')) == ['bar', 'b\xc3\xa4z qux']
+        Assert(d['spam']) == 'eggs'
+        Assert(d['flag']) == ''
+        Assert(d['empty']) == ''
+        Assert(len(d)) == 4
+
+        d = self.dict_class.from_urlencoded(
+            'f%C3%B6o=b%C3%A4r;spam=eggs', separator=';', charset='utf-8'
+        )
+        Assert(d[u'f\xf6o']) == u'b\xe4r'
+        Assert(d[u'spam']) == u'eggs'
+        with Assert.raises(UnicodeDecodeError):
+            self.dict_class.from_urlencoded('foo=%FF', charset='utf-8')
+
+    @test
+    def from_headers(self):
+        d = self.dict_class.from_headers(
+            'Host: example.com\r\n'
+            'Accept:text/html\r\n'
+            'Set-Cookie: foo=bar\r\n'
+            'Set-Cookie: spam=eggs\r\n'
+            'X-Folded: foo\r\n'
+            ' \tbar\r\n'
+            '\r\n'
+            'Ignored: body'
+        )
+        Assert(d.__class__).is_(self.dict_class)
+        Assert(d['Host']) == 'example.com'
+        Assert(d['Accept']) == 'text/html'
+        Assert(d.getlist('Set-Cookie')) == ['foo=bar', 'spam=eggs']
+        Assert(d['X-Folded']) == 'foo bar'
+        Assert(len(d)) == 4
+        Assert(len(self.dict_class.from_headers(''))) == 0
+
+        with Assert.raises(ValueError):
+            self.dict_class.from_headers('foo')
+        with Assert.raises(ValueError):
+            self.dict_class.from_headers(' foo')
+
     @test
     def repr(self):
         d = self.dict_class()
@@ -430,6 +689,67 @@ class TestMultiDict(TestBase, MultiDictTestMixin, DictTestMixin):
         Assert.isinstance(self.dict_class(), dict)
 
 
+class TestFlatMultiDict(TestBase, MultiDictTestMixin, DictTestMixin):
+    dict_class = FlatMultiDict
+
+    @test
+    def type_checking(self):
+        Assert.isinstance(self.dict_class(), dict)
+        Assert.isinstance(self.dict_class(), MultiDict)
+
+    @test
+    def storage(self):
+        d = self.dict_class([('foo', 'bar'), ('spam', 'eggs')])
+        Assert(dict.__getitem__(d, 'foo')) == 'bar'
+        d.add('spam', 'monty')
+        Assert(dict.__getitem__(d, 'foo')) == 'bar'
+        Assert(dict.__getitem__(d, 'spam')) == ['eggs', 'monty']
+        Assert(d.lists()) == MultiDict(d).lists()
+
+    @test
+    def equality(self):
+        items = [('foo', 'bar'), ('spam', 'eggs'), ('spam', 'monty')]
+        d = self.dict_class(items)
+        for other in [MultiDict(items), ImmutableMultiDict(items),
+                      OrderedMultiDict(items), self.dict_class(items)]:
+            Assert(d == other) == True
+            Assert(other == d) == True
+            Assert(d != other) == False
+            Assert(other != d) == False
+        Assert(d) == {'foo': ['bar'], 'spam': ['eggs', 'monty']}
+        Assert(d) != MultiDict(items[:-1])
+        Assert(MultiDict(items[:-1])) != d
+        Assert(d) != self.dict_class(items[:-1])
+        Assert(d == 1) == False
+        Assert(d != 1) == True
+
+    @test
+    def list_values(self):
+        d = self.dict_class()
+        d['foo'] = ['bar', 'baz']
+        Assert(d['foo']) == ['bar', 'baz']
+        Assert(d.getlist('foo')) == [['bar', 'baz']]
+        d.add('foo', 'spam')
+        Assert(d.getlist('foo')) == [['bar', 'baz'], 'spam']
+        Assert(d.poplist('foo')) == [['bar', 'baz'], 'spam']
+
+    @test
+    def getlist_copies(self):
+        d = self.dict_class({'foo': ['bar', 'baz']})
+        d.getlist('foo').append('spam')
+        Assert(d.getlist('foo')) == ['bar', 'baz']
+
+    @test
+    def copy(self):
+        d = self.dict_class({'foo': ['bar', 'baz'], 'spam': 'eggs'})
+        copy = d.copy()
+        Assert(copy.__class__).is_(self.dict_class)
+        copy.add('foo', 'qux')
+        Assert(d.getlist('foo')) == ['bar', 'baz']
+        Assert(copy.getlist('foo')) == ['bar', 'baz', 'qux']
+        Assert(copy['spam']) == 'eggs'
+
+
 class ImmutableMultiDictTestMixin(MultiDictTestMixin):
     @test
     def add(self):
@@ -473,7 +793,7 @@ class ImmutableMultiDictTestMixin(MultiDictTestMixin):
 
 
 class TestImmutableMultiDict(TestBase, ImmutableMultiDictTestMixin,
-                             ImmutableDictTestMixin):
+                             ImmutableDictTestMixin, CachedHashTestMixin):
     dict_class = ImmutableMultiDict
 
     @test_if(GE_PYTHON_26)
@@ -496,6 +816,16 @@ class TestCombinedMultiDict(TestBase, CombinedDictTestMixin,
                             ImmutableDictTestMixin):
     dict_class = CombinedMultiDict
 
+    @test
+    def from_urlencoded(self):
+        with Assert.raises(TypeError):
+            self.dict_class.from_urlencoded('foo=bar')
+
+    @test
+    def from_headers(self):
+        with Assert.raises(TypeError):
+            self.dict_class.from_headers('Foo: bar')
+
     # we don't need this special kind of initalization
     init_with_lists = None
 
@@ -638,6 +968,54 @@ class TestOrderedDict(TestBase, OrderedDictTestMixin, DictTestMixin):
         Assert.isinstance(d, dict)
 
 
+class TestCompactOrderedDict(TestBase, OrderedDictTestMixin, DictTestMixin):
+    dict_class = CompactOrderedDict
+
+    @test
+    def reversed(self):
+        d = self.dict_class([(1, 2), (3, 4), (5, 6)])
+        Assert(list(reversed(d))) == [5, 3, 1]
+        d.move_to_end(3, last=False)
+        del d[1]
+        Assert(list(reversed(d))) == [5, 3]
+
+    @test
+    def popitem_order(self):
+        d = self.dict_class.fromkeys(range(10))
+        d.move_to_end(5, last=False)
+        d.move_to_end(6, last=False)
+        Assert([d.popitem(last=False)[0] for _ in xrange(3)]) == [6, 5, 0]
+        Assert([d.popitem()[0] for _ in xrange(3)]) == [9, 8, 7]
+        Assert(d.keys()) == [1, 2, 3, 4]
+        d[10] = None
+        d.move_to_end(2)
+        Assert(d.keys()) == [1, 3, 4, 10, 2]
+
+    @test
+    def compaction(self):
+        d = self.dict_class.fromkeys(range(100))
+        for key in xrange(0, 100, 2):
+            del d[key]
+        for key in xrange(1, 50, 2):
+            d.move_to_end(key)
+        for key in xrange(99, 49, -2):
+            d.move_to_end(key, last=False)
+        expected = range(51, 100, 2) + range(1, 50, 2)
+        Assert(d.keys()) == expected
+        Assert(list(reversed(d))) == expected[::-1]
+        Assert(len(d._keys) + len(d._head)) <= 2 * len(d)
+        while d:
+            Assert(d.popitem(last=False)[0]) == expected.pop(0)
+
+    @test
+    def equality(self):
+        d = self.dict_class([(1, 2), (3, 4)])
+        Assert(d) == self.dict_class([(1, 2), (3, 4)])
+        Assert(d) != self.dict_class([(3, 4), (1, 2)])
+        Assert(d) != self.dict_class([(1, 2)])
+        Assert(d) == {1: 2, 3: 4}
+
+
 class ImmutableOrderedDictTextMixin(OrderedDictTestMixin):
     update_order = setitem_order = setdefault_order = \
         pop_does_not_keep_ordering = clear_does_not_keep_ordering = None
@@ -659,7 +1037,7 @@ class ImmutableOrderedDictTextMixin(OrderedDictTestMixin):
 
 
 class TestImmutableOrderedDict(TestBase, ImmutableOrderedDictTextMixin,
-                               ImmutableDictTestMixin):
+                               ImmutableDictTestMixin, CachedHashTestMixin):
     dict_class = ImmutableOrderedDict
 
 
@@ -690,6 +1068,18 @@ class TestOrderedMultiDict(TestBase, OrderedDictTestMixin, MultiDictTestMixin,
         for type in types:
             Assert.isinstance(d, type), type
 
+    @test
+    def from_urlencoded_order(self):
+        d = self.dict_class.from_urlencoded('c=1&a=2&b=3&a=4')
+        Assert(d.items(multi=True)) == [
+            ('c', '1'), ('a', '2'), ('a', '4'), ('b', '3')
+        ]
+
+    @test
+    def from_headers_order(self):
+        d = self.dict_class.from_headers('C: 1\nA: 2\nB: 3')
+        Assert(d.keys()) == ['C', 'A', 'B']
+
 
 class TestImmutableOrderedMultiDict(TestBase, ImmutableOrderedDictTextMixin,
                                     ImmutableMultiDictTestMixin,
@@ -783,10 +1173,50 @@ class TestCounter(TestBase):
         c = Counter('abc')
         Assert(c * 2) == c + c
 
+    @test
+    def update_mapping(self):
+        c = Counter()
+        c.update(Counter('aab'))
+        Assert(c) == Counter('aab')
+        c.update(MultiDict({'a': [2, 3]}))
+        Assert(c['a']) == 4
+        c = Counter()
+        c.update(MultiDict({'a': [2, 3]}))
+        Assert(c) == {'a': 2}
+
     @test
     def sub(self):
         c = Counter('aababc')
         assert not c - c
+        Assert(c - Counter('ab')) == Counter('aabc')
+        Assert(Counter('ab') - c) == Counter()
+        Assert(Counter('a') - Counter({'a': 1, 'b': -2})) == Counter(b=2)
+
+    @test
+    def inplace(self):
+        c = Counter('aab')
+        original = c
+        c += Counter('bc')
+        Assert(c) == Counter('aabbc')
+        c -= Counter('abb')
+        Assert(c) == Counter('ac')
+        c |= Counter('ccd')
+        Assert(c) == Counter('accd')
+        c &= Counter('ac')
+        Assert(c) == Counter('ac')
+        Assert(c).is_(original)
+        with Assert.raises(TypeError):
+            c += {}
+
+    @test
+    def negative_counts(self):
+        a = Counter({'a': -1, 'b': 2})
+        b = Counter({'a': 2, 'c': -1})
+        Assert(a + b) == Counter({'a': 1, 'b': 2})
+        Assert(a | b) == Counter({'a': 2, 'b': 2})
+        Assert(a & b) == Counter()
+        a += b
+        Assert(a) == Counter({'a': 1, 'b': 2})
 
     @test
     def or_and(self):
@@ -797,9 +1227,320 @@ class TestCounter(TestBase):
         Assert(new.values()) == [1] * 3
 
 
+class CollidingKey(object):
+    def __init__(self, value, hash):
+        self.value = value
+        self.hash = hash
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return isinstance(other, CollidingKey) and self.value == other.value
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+class TestPersistentDict(TestBase):
+    @test
+    def init(self):
+        Assert(len(PersistentDict())) == 0
+        d = PersistentDict({1: 2}, foo='bar')
+        Assert(sorted(d.items())) == [(1, 2), ('foo', 'bar')]
+        Assert(PersistentDict([(1, 2)])[1]) == 2
+        with Assert.raises(TypeError):
+            PersistentDict({}, {})
+
+    @test
+    def set(self):
+        a = PersistentDict()
+        b = a.set(1, 2)
+        c = b.set(1, 3)
+        Assert(len(a)) == 0
+        Assert(b) == {1: 2}
+        Assert(c) == {1: 3}
+        Assert(c.set(1, 3)).is_(c)
+
+    @test
+    def delete(self):
+        a = PersistentDict({1: 2, 3: 4})
+        b = a.delete(1)
+        Assert(a) == {1: 2, 3: 4}
+        Assert(b) == {3: 4}
+        Assert(b.delete(3)) == {}
+        with Assert.raises(KeyError):
+            b.delete(1)
+        with Assert.raises(KeyError):
+            PersistentDict().delete(1)
+
+    @test
+    def many_keys(self):
+        d = PersistentDict()
+        versions = []
+        for i in xrange(2000):
+            versions.append(d)
+            d = d.set(i, i * 2)
+        Assert(len(d)) == 2000
+        Assert(sorted(d.items())) == [(i, i * 2) for i in xrange(2000)]
+        for i, version in enumerate(versions):
+            Assert(len(version)) == i
+            Assert(i in version) == False
+        for i in xrange(0, 2000, 2):
+            d = d.delete(i)
+        Assert(sorted(d.keys())) == range(1, 2000, 2)
+        Assert(d.get(1)) == 2
+        Assert(d.get(2)).is_(None)
+
+    @test
+    def collisions(self):
+        keys = [CollidingKey(i, 42) for i in xrange(3)]
+        other = CollidingKey(3, 42 | 1 << 10)
+        d = PersistentDict()
+        for key in keys + [other]:
+            d = d.set(key, key.value)
+        Assert(len(d)) == 4
+        for key in keys + [other]:
+            Assert(d[key]) == key.value
+        Assert(d.set(keys[0], 5)[keys[0]]) == 5
+        e = d.delete(keys[1])
+        Assert(keys[1] in e) == False
+        Assert(e[keys[0]]) == 0
+        for key in keys:
+            d = d.delete(key)
+        Assert(d.items()) == [(other, 3)]
+
+    @test
+    def mapping_methods(self):
+        d = PersistentDict({1: 2})
+        Assert(d[1]) == 2
+        with Assert.raises(KeyError):
+            d[3]
+        Assert(d.get(3, 4)) == 4
+        Assert(1 in d) == True
+        Assert(list(d)) == [1]
+        Assert(d.keys()) == [1]
+        Assert(d.values()) == [2]
+        Assert(d.items()) == [(1, 2)]
+
+    @test
+    def update(self):
+        a = PersistentDict({1: 2})
+        b = a.update({3: 4}, foo='bar')
+        Assert(a) == {1: 2}
+        Assert(b) == {1: 2, 3: 4, 'foo': 'bar'}
+
+    @test
+    def evolver(self):
+        a = PersistentDict((i, i) for i in xrange(100))
+        evolver = a.evolver()
+        for i in xrange(50):
+            del evolver[i]
+        evolver[100] = 100
+        evolver.update({101: 101})
+        Assert(len(evolver)) == 52
+        Assert(evolver[100]) == 100
+        Assert(0 in evolver) == False
+        with Assert.raises(KeyError):
+            del evolver[0]
+        with Assert.raises(KeyError):
+            evolver[0]
+        b = evolver.persistent()
+        evolver[102] = 102
+        del evolver[50]
+        c = evolver.persistent()
+        Assert(len(a)) == 100
+        Assert(len(b)) == 52
+        Assert(102 in b) == False
+        Assert(50 in b) == True
+        Assert(len(c)) == 52
+        Assert(sorted(c.keys())) == range(51, 103)
+
+    @test
+    def equality(self):
+        a = PersistentDict({1: 2})
+        Assert(a) == PersistentDict({1: 2})
+        Assert(a) == {1: 2}
+        Assert(a) != {1: 3}
+        Assert(a) != PersistentDict()
+        Assert(a) != [1]
+
+    @test
+    def hashability(self):
+        a = PersistentDict({1: 2})
+        b = PersistentDict({1: 2})
+        Assert(hash(a)) == hash(b)
+        Assert(hash(a)) != hash(a.set(1, 3))
+        Assert(len(set([a, b]))) == 1
+
+    @test
+    def pickleable(self):
+        d = PersistentDict({1: 2, 3: 4})
+        for protocol in xrange(pickle.HIGHEST_PROTOCOL + 1):
+            Assert(pickle.loads(pickle.dumps(d, protocol))) == d
+
+    @test
+    def repr(self):
+        Assert(repr(PersistentDict())) == 'PersistentDict()'
+        Assert(repr(PersistentDict({1: 2}))) == 'PersistentDict({1: 2})'
+
+class TestHeavyHittersCounter(TestBase):
+    @test
+    def init(self):
+        c = HeavyHittersCounter(3, 'aab', c=2)
+        Assert(c.capacity) == 3
+        Assert(c.total) == 5
+        Assert(c['a']) == 2
+        Assert(c['c']) == 2
+        Assert(c['d']) == 0
+        with Assert.raises(ValueError):
+            HeavyHittersCounter(0)
+
+    @test
+    def add(self):
+        c = HeavyHittersCounter(2)
+        c.add('a')
+        c.add('a', 3)
+        c.add('b', 2)
+        Assert(c['a']) == 4
+        Assert(c['b']) == 2
+        Assert(len(c)) == 2
+        with Assert.raises(ValueError):
+            c.add('a', 0)
+
+    @test
+    def eviction(self):
+        c = HeavyHittersCounter(2, 'aaab')
+        c.add('c')
+        Assert('b' in c) == False
+        Assert(c['c']) == 2
+        Assert(c.bounds('c')) == (1, 2)
+        Assert(c.bounds('a')) == (3, 3)
+        Assert(c.bounds('b')) == (0, 2)
+        Assert(c.max_error) == 2
+        Assert(len(c)) == 2
+
+    @test
+    def max_error(self):
+        c = HeavyHittersCounter(2, 'ab')
+        Assert(c.max_error) == 1
+        Assert(HeavyHittersCounter(3, 'ab').max_error) == 0
+
+    @test
+    def bounds(self):
+        stream = ['a', 'b'] * 50 + list('cdefghij') * 3 + ['a'] * 10
+        c = HeavyHittersCounter(4, stream)
+        Assert(c.total) == len(stream)
+        for element in set(stream):
+            lower, upper = c.bounds(element)
+            assert lower <= stream.count(element) <= upper
+            assert upper - lower <= c.total // c.capacity
+        Assert(set(c)) >= set('ab')
+
+    @test
+    def most_common(self):
+        c = HeavyHittersCounter(5, 'aababc')
+        result = [('a', 3), ('b', 2), ('c', 1)]
+        Assert(c.most_common()) == result
+        Assert(c.most_common(2)) == result[:-1]
+        Assert(c.most_common(0)) == []
+        Assert(list(c)) == ['a', 'b', 'c']
+        Assert(list(c.iteritems())) == result
+
+    @test
+    def most_common_guaranteed(self):
+        c = HeavyHittersCounter(3, 'aaaaabbbbcde')
+        Assert(c.most_common()) == [('a', 5), ('b', 4), ('e', 3)]
+        Assert(c.most_common(2, guaranteed=True)) == [('a', 5), ('b', 4)]
+        Assert(c.most_common(3, guaranteed=True)) == [('a', 5), ('b', 4)]
+        Assert(c.most_common(1, guaranteed=True)) == [('a', 5)]
+
+    @test
+    def repr(self):
+        Assert(repr(HeavyHittersCounter(2, 'a'))) == \
+            "HeavyHittersCounter(2, {'a': 1})"
+
+
+class TestCountMinSketch(TestBase):
+    @test
+    def init(self):
+        sketch = CountMinSketch(100, 3, 'aab', c=2)
+        Assert(sketch.width) == 100
+        Assert(sketch.depth) == 3
+        Assert(sketch.total) == 5
+        Assert(sketch['a']) == 2
+        Assert(sketch['c']) == 2
+        with Assert.raises(ValueError):
+            CountMinSketch(0, 3)
+        with Assert.raises(ValueError):
+            CountMinSketch(100, 0)
+
+    @test
+    def from_error(self):
+        sketch = CountMinSketch.from_error(0.01, 0.01, 'abc')
+        Assert(sketch.width) == 272
+        Assert(sketch.depth) == 5
+        Assert(sketch['a']) == 1
+        assert sketch.error <= 0.01
+        with Assert.raises(ValueError):
+            CountMinSketch.from_error(0, 0.01)
+        with Assert.raises(ValueError):
+            CountMinSketch.from_error(0.01, 1)
+
+    @test
+    def add(self):
+        sketch = CountMinSketch(100, 3)
+        sketch.add('a')
+        sketch.add('a', 3)
+        Assert(sketch['a']) == 4
+        Assert(sketch.total) == 4
+        with Assert.raises(ValueError):
+            sketch.add('a', 0)
+
+    @test
+    def estimates(self):
+        stream = [i % 7 * i for i in xrange(5000)]
+        sketch = CountMinSketch(50, 4, stream)
+        counts = Counter(stream)
+        for element, count in counts.iteritems():
+            assert sketch[element] >= count
+        too_large = [
+            element for element, count in counts.iteritems()
+            if sketch[element] - count > sketch.error * sketch.total
+        ]
+        assert len(too_large) <= len(counts) * 0.05
+
+    @test
+    def merge(self):
+        a = CountMinSketch(100, 3, 'aab')
+        b = CountMinSketch(100, 3, 'abc')
+        c = a.copy()
+        c.merge(b)
+        Assert(a['a']) == 2
+        Assert(c['a']) == 3
+        Assert(c['b']) == 2
+        Assert(c['c']) == 1
+        Assert(c.total) == 6
+        with Assert.raises(ValueError):
+            a.merge(CountMinSketch(100, 4))
+
+    @test
+    def pickleable(self):
+        sketch = CountMinSketch(100, 3, 'aab')
+        Assert(pickle.loads(pickle.dumps(sketch))['a']) == 2
+
+    @test
+    def repr(self):
+        Assert(repr(CountMinSketch(100, 3))) == 'CountMinSketch(100, 3)'
+
+
 tests = Tests([
-    TestImmutableDict, TestCombinedDict, TestMultiDict, TestImmutableMultiDict,
-    TestCombinedMultiDict, TestOrderedDict, TestOrderedMultiDict,
+    TestImmutableDict, TestCombinedDict, TestIndexedCombinedDict,
+    TestLayeredDict, TestMultiDict, TestFlatMultiDict,
+    TestImmutableMultiDict,
+    TestCombinedMultiDict, TestOrderedDict, TestCompactOrderedDict,
+    TestOrderedMultiDict,
     TestImmutableOrderedDict, TestImmutableOrderedMultiDict, TestFixedDict,
-    TestCounter
+    TestPersistentDict, TestCounter, TestHeavyHittersCounter,
+    TestCountMinSketch
 ])
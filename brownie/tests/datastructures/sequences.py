@@ -10,16 +10,18 @@
 """
 from __future__ import with_statement
 import sys
+import time
 import pickle
 import random
 from StringIO import StringIO
 from itertools import repeat
+from threading import Thread
 from contextlib import contextmanager
 
 from attest import Tests, TestBase, test, Assert
 
 from brownie.datastructures import (LazyList, CombinedSequence, CombinedList,
-                                    namedtuple)
+                                    namedtuple, PrefetchingLazyList)
 
 
 @contextmanager
@@ -349,6 +351,99 @@ class TestLazyList(TestBase):
         Assert(pickled.__class__) == l.__class__
 
 
+class TestPrefetchingLazyList(TestBase):
+    @test
+    def prefetching(self):
+        def slow_range(n):
+            for i in xrange(n):
+                time.sleep(0.001)
+                yield i
+
+        l = PrefetchingLazyList(slow_range(100), window=10)
+        Assert(l[0]) == 0
+        time.sleep(0.1)
+        Assert(l.known_length) > 1
+        Assert(l.known_length) <= 12
+        Assert(l[50]) == 50
+        Assert(l) == range(100)
+        Assert(l.exhausted) == True
+
+    @test
+    def access(self):
+        l = PrefetchingLazyList(iter(range(10)), window=2)
+        Assert(list(l)) == range(10)
+        l = PrefetchingLazyList(iter(range(10)), window=2)
+        Assert(l[-1]) == 9
+        Assert(l[2:4]) == [2, 3]
+        Assert(len(l)) == 10
+
+        l = PrefetchingLazyList(range(3))
+        Assert(l) == [0, 1, 2]
+
+    @test
+    def extend(self):
+        l = PrefetchingLazyList(iter(range(10)), window=2)
+        l.extend(range(10, 20))
+        Assert(l) == range(20)
+        l.append(20)
+        Assert(l) == range(21)
+
+    @test
+    def errors(self):
+        def failing():
+            yield 1
+            raise ValueError()
+
+        l = PrefetchingLazyList(failing())
+        Assert(l[0]) == 1
+        with Assert.raises(ValueError):
+            l[1]
+
+    @test
+    def concurrent_access(self):
+        l = PrefetchingLazyList(iter(xrange(1000)), window=8)
+        results = []
+
+        def consume():
+            results.append(list(l))
+        threads = [Thread(target=consume) for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        Assert(results) == [range(1000)] * 4
+
+    @test
+    def mutation(self):
+        def slow_range(n):
+            for i in xrange(n):
+                time.sleep(0.0001)
+                yield i
+
+        l = PrefetchingLazyList(slow_range(200), window=200)
+        expected = range(200)
+        for i in xrange(0, 100, 10):
+            l.insert(i, 'foo')
+            expected.insert(i, 'foo')
+            del l[i + 1]
+            del expected[i + 1]
+            l[i + 2] = 'bar'
+            expected[i + 2] = 'bar'
+            Assert(l.pop(i + 3)) == expected.pop(i + 3)
+        l.remove(150)
+        expected.remove(150)
+        Assert(l) == expected
+        l.reverse()
+        l.sort()
+        expected.sort()
+        Assert(l) == expected
+
+    @test
+    def pickling(self):
+        l = PrefetchingLazyList(iter(range(10)))
+        Assert(pickle.loads(pickle.dumps(l))) == range(10)
+
+
 class CombinedSequenceTestMixin(object):
     sequence_cls = None
 
@@ -635,4 +730,7 @@ class TestNamedTuple(TestBase):
         Assert(namespace['foo']._fields) == ('spam', 'eggs')
 
 
-tests = Tests([TestLazyList, TestCombinedSequence, TestCombinedList, TestNamedTuple])
+tests = Tests([
+    TestLazyList, TestPrefetchingLazyList, TestCombinedSequence,
+    TestCombinedList, TestNamedTuple
+])
@@ -10,9 +10,11 @@
 """
 from __future__ import with_statement
 
+import pickle
+
 from attest import Tests, TestBase, test, Assert
 
-from brownie.datastructures import OrderedSet
+from brownie.datastructures import OrderedSet, HyperLogLog
 
 
 class TestOrderedSet(TestBase):
@@ -204,4 +206,58 @@ class TestOrderedSet(TestBase):
         Assert(repr(s)) == 'OrderedSet([1, 2, 3])'
 
 
-tests = Tests([TestOrderedSet])
+class TestHyperLogLog(TestBase):
+    @test
+    def init(self):
+        Assert(HyperLogLog().precision) == 14
+        Assert(len(HyperLogLog(10))) == 0
+        Assert(len(HyperLogLog(10, 'abc'))) == 3
+        with Assert.raises(ValueError):
+            HyperLogLog(3)
+        with Assert.raises(ValueError):
+            HyperLogLog(17)
+
+    @test
+    def add(self):
+        hll = HyperLogLog(10)
+        for _ in xrange(3):
+            hll.add('foo')
+        Assert(len(hll)) == 1
+        hll.add('bar')
+        Assert(len(hll)) == 2
+
+    @test
+    def estimate(self):
+        for precision in [8, 12]:
+            hll = HyperLogLog(precision)
+            for n in [100, 1000, 10000, 50000]:
+                hll.update(xrange(n))
+                assert abs(len(hll) - n) <= 4 * hll.error * n
+
+    @test
+    def error(self):
+        Assert(HyperLogLog(4).error) == 1.04 / 4
+        Assert(HyperLogLog(10).error) == 1.04 / 32
+
+    @test
+    def merge(self):
+        a = HyperLogLog(10, xrange(5000))
+        b = HyperLogLog(10, xrange(2500, 7500))
+        c = a.copy()
+        c.merge(b)
+        Assert(len(a)) == len(HyperLogLog(10, xrange(5000)))
+        Assert(len(c)) == len(HyperLogLog(10, xrange(7500)))
+        with Assert.raises(ValueError):
+            a.merge(HyperLogLog(11))
+
+    @test
+    def pickleable(self):
+        hll = HyperLogLog(8, xrange(1000))
+        Assert(len(pickle.loads(pickle.dumps(hll)))) == len(hll)
+
+    @test
+    def repr(self):
+        Assert(repr(HyperLogLog(10))) == 'HyperLogLog(10)'
+
+
+tests = Tests([TestOrderedSet, TestHyperLogLog])
@@ -32,6 +32,7 @@ tests = Tests()
 def test_chain():
     Assert(list(chain([1, 2], [3, 4]))) == [1, 2, 3, 4]
     Assert(list(chain.from_iterable([[1, 2], [3, 4]]))) == [1, 2, 3, 4]
+    Assert(list(chain([], [1], [], [], [2]))) == [1, 2]
 
 
 @tests.test
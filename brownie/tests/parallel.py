@@ -9,12 +9,26 @@
     :license: BSD, see LICENSE.rst for details
 """
 from __future__ import with_statement
+import os
+import sys
 import time
-from threading import Thread
+import pickle
+from array import array
+from threading import Thread, Event, currentThread, activeCount
 
-from attest import Tests, Assert, TestBase, test
+from attest import Tests, Assert, TestBase, test, test_if
 
-from brownie.parallel import get_cpu_count, AsyncResult, TimeoutError
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+from brownie.parallel import (
+    get_cpu_count, AsyncResult, TimeoutError, CancelledError, Batcher, Stage,
+    Pipeline, TokenBucket, KeyedTokenBucket, KeyedSemaphore, RetryBudget,
+    Retry, ThreadPool, WorkStealingPool, SharedBuffer, share, unshare,
+    SharedResult, Histogram, PoolMetrics, Scheduler
+)
 
 
 tests = Tests()
@@ -79,6 +93,95 @@ class TestAsyncResult(TestBase):
             Assert(len(l)) == 1
             Assert(l[0]) == 'foo'
 
+    @test
+    def cancel(self):
+        aresult = AsyncResult()
+        assert not aresult.cancelled
+        Assert(aresult.cancel()) == True
+        assert aresult.cancelled
+        assert aresult.ready
+        with Assert.raises(CancelledError):
+            aresult.get()
+
+        aresult.set('foo')
+        with Assert.raises(CancelledError):
+            aresult.get()
+
+        aresult = AsyncResult()
+        aresult.set('foo')
+        Assert(aresult.cancel()) == False
+        assert not aresult.cancelled
+        Assert(aresult.get()) == 'foo'
+
+    @test
+    def deadline(self):
+        aresult = AsyncResult(deadline=time.time() + 0.1)
+        assert not aresult.cancelled
+        Assert(aresult.remaining) > 0
+        with Assert.raises(TimeoutError):
+            aresult.get(0.01)
+        with Assert.raises(CancelledError):
+            aresult.get()
+        assert aresult.cancelled
+        Assert(aresult.remaining) == 0
+
+        aresult = AsyncResult(deadline=time.time() - 1)
+        assert aresult.cancelled
+
+        Assert(AsyncResult().remaining) == None
+
+    @test
+    def then(self):
+        aresult = AsyncResult()
+        child = aresult.then(lambda obj: obj * 2)
+        grandchild = child.then(lambda obj: obj + 1)
+        assert not child.ready
+        aresult.set(1)
+        Assert(child.get()) == 2
+        Assert(grandchild.get()) == 3
+
+        Assert(aresult.then(lambda obj: obj * 3).get()) == 3
+
+        aresult = AsyncResult()
+        child = aresult.then(lambda obj: obj)
+        recovered = aresult.then(errback=lambda exc: 'recovered')
+        aresult.set(ValueError(), success=False)
+        with Assert.raises(ValueError):
+            child.get()
+        Assert(recovered.get()) == 'recovered'
+
+        aresult = AsyncResult()
+        child = aresult.then(lambda obj: 1 / obj)
+        aresult.set(0)
+        with Assert.raises(ZeroDivisionError):
+            child.get()
+
+    @test
+    def then_propagates_cancellation(self):
+        aresult = AsyncResult()
+        child = aresult.then()
+        grandchild = child.then()
+        aresult.cancel()
+        assert child.cancelled
+        assert grandchild.cancelled
+
+        called = []
+        aresult = AsyncResult()
+        child = aresult.then(called.append)
+        child.cancel()
+        assert not aresult.cancelled
+        aresult.set('foo')
+        Assert(called) == []
+
+    @test
+    def then_propagates_deadline(self):
+        deadline = time.time() + 60
+        aresult = AsyncResult(deadline=deadline)
+        Assert(aresult.then().deadline) == deadline
+        Assert(aresult.then(deadline=deadline - 1).deadline) == deadline - 1
+        Assert(aresult.then(deadline=deadline + 1).deadline) == deadline
+        Assert(AsyncResult().then(deadline=deadline).deadline) == deadline
+
     @test
     def repr(self):
         aresult = AsyncResult()
@@ -93,4 +196,879 @@ class TestAsyncResult(TestBase):
         aresult = AsyncResult(callback=1, errback=2)
         Assert(repr(aresult)) == 'AsyncResult(callback=1, errback=2)'
 
+        aresult = AsyncResult(deadline=1)
+        Assert(repr(aresult)) == 'AsyncResult(deadline=1)'
+
 tests.register(TestAsyncResult)
+
+
+class TestBatcher(TestBase):
+    @test
+    def max_batch(self):
+        batches = []
+
+        def function(items):
+            batches.append(items)
+            return [item * 2 for item in items]
+
+        with Batcher(function, max_batch=5, max_delay=10000) as batcher:
+            results = [batcher.submit(i) for i in xrange(10)]
+            Assert([result.get(1) for result in results]) == range(0, 20, 2)
+        Assert(batches) == [range(5), range(5, 10)]
+
+    @test
+    def max_delay(self):
+        batcher = Batcher(lambda items: items, max_batch=100, max_delay=50)
+        with Assert.not_raising(TimeoutError):
+            Assert(batcher.submit('foo').get(1)) == 'foo'
+        batcher.close()
+
+    @test
+    def failing_callback(self):
+        def callback(value):
+            raise ValueError(value)
+
+        errors = []
+        excepthook = sys.excepthook
+        sys.excepthook = lambda *exc_info: errors.append(exc_info[0])
+        try:
+            batcher = Batcher(lambda items: items, max_delay=10000)
+            broken = batcher.submit('foo')
+            broken.callback = callback
+            result = batcher.submit('bar')
+            batcher.flush()
+            Assert(result.get(1)) == 'bar'
+            later = batcher.submit('baz')
+            batcher.flush()
+            Assert(later.get(1)) == 'baz'
+            batcher.close()
+        finally:
+            sys.excepthook = excepthook
+        Assert(errors) == [ValueError]
+
+    @test
+    def flush(self):
+        batcher = Batcher(lambda items: items, max_batch=100, max_delay=10000)
+        result = batcher.submit('foo')
+        batcher.flush()
+        with Assert.not_raising(TimeoutError):
+            Assert(result.get(1)) == 'foo'
+        batcher.close()
+
+    @test
+    def close(self):
+        batcher = Batcher(lambda items: items, max_batch=100, max_delay=10000)
+        result = batcher.submit('foo')
+        batcher.close()
+        assert batcher.closed
+        Assert(result.get(0)) == 'foo'
+        with Assert.raises(RuntimeError):
+            batcher.submit('bar')
+
+    @test
+    def errors(self):
+        def function(items):
+            raise ValueError()
+
+        with Batcher(function, max_batch=2) as batcher:
+            results = [batcher.submit(i) for i in xrange(2)]
+            for result in results:
+                with Assert.raises(ValueError):
+                    result.get(1)
+
+        with Batcher(lambda items: [], max_batch=1) as batcher:
+            with Assert.raises(ValueError):
+                batcher.submit('foo').get(1)
+
+    @test
+    def drops_cancelled(self):
+        batches = []
+
+        def function(items):
+            batches.append(items)
+            return items
+
+        with Batcher(function, max_batch=100, max_delay=10000) as batcher:
+            batcher.submit('foo').cancel()
+            result = batcher.submit('bar')
+        Assert(result.get(0)) == 'bar'
+        Assert(batches) == [['bar']]
+
+    @test
+    def repr(self):
+        batcher = Batcher(list, max_batch=1, max_delay=2)
+        Assert(repr(batcher)) == 'Batcher(%r, max_batch=1, max_delay=2)' % list
+        batcher.close()
+
+tests.register(TestBatcher)
+
+
+class TestPipeline(TestBase):
+    @test
+    def run(self):
+        pipeline = Pipeline()
+        pipeline.add_stage(lambda item: item * 2, workers=4)
+        pipeline.add_stage(lambda item: item + 1, workers=2)
+        Assert(pipeline.run(xrange(100)).get(5)) == 100
+
+    @test
+    def imap(self):
+        pipeline = Pipeline()
+        pipeline.add_stage(lambda item: item * 2, workers=4)
+        pipeline.add_stage(lambda item: item + 1, workers=2)
+        Assert(sorted(pipeline.imap(xrange(10)))) == range(1, 20, 2)
+
+        iterator = pipeline.imap(xrange(100))
+        iterator.next()
+        iterator.close()
+        Assert(sorted(pipeline.imap(xrange(3)))) == [1, 3, 5]
+
+    @test
+    def flatten(self):
+        pipeline = Pipeline()
+        pipeline.add_stage(lambda item: xrange(item), flatten=True)
+        pipeline.add_stage(lambda item: item * 2, workers=2)
+        Assert(sorted(pipeline.imap([1, 2, 3]))) == [0, 0, 0, 2, 2, 4]
+
+    @test
+    def errors(self):
+        def fail(item):
+            if item == 5:
+                raise ValueError(item)
+            return item
+
+        pipeline = Pipeline()
+        pipeline.add_stage(fail, workers=2)
+        pipeline.add_stage(lambda item: item)
+        with Assert.raises(ValueError):
+            pipeline.run(xrange(100)).get(5)
+        with Assert.raises(ValueError):
+            list(pipeline.imap(xrange(100)))
+
+        def iterable():
+            yield 1
+            raise ValueError()
+
+        with Assert.raises(ValueError):
+            pipeline.run(iterable()).get(5)
+
+    @test
+    def backpressure(self):
+        depths = []
+        pipeline = Pipeline()
+        pipeline.add_stage(lambda item: item, workers=4)
+
+        def slow(item):
+            depths.append(pipeline.stages[1].queue_depth)
+            time.sleep(0.001)
+            return item
+        pipeline.add_stage(slow, maxsize=2)
+        Assert(pipeline.run(xrange(100)).get(5)) == 100
+        Assert(max(depths)) <= 2
+
+    @test
+    def statistics(self):
+        pipeline = Pipeline()
+        first = pipeline.add_stage(lambda item: item, workers=2)
+        second = pipeline.add_stage(lambda item: item)
+        Assert(first.throughput) == 0
+        Assert(first.queue_depth) == 0
+        pipeline.run(xrange(100)).get(5)
+        for stage in [first, second]:
+            Assert(stage.processed) == 100
+            Assert(stage.active) == 0
+            Assert(stage.queue_depth) == 0
+            Assert(stage.throughput) > 0
+
+    @test
+    def running(self):
+        pipeline = Pipeline()
+        with Assert.raises(RuntimeError):
+            pipeline.run([])
+        pipeline.add_stage(lambda item: time.sleep(0.1))
+        result = pipeline.run([1])
+        with Assert.raises(RuntimeError):
+            pipeline.run([])
+        result.get(5)
+        Assert(pipeline.run([]).get(5)) == 0
+
+    @test
+    def cancel(self):
+        pipeline = Pipeline()
+        stage = pipeline.add_stage(lambda item: time.sleep(0.01))
+        result = pipeline.run(xrange(1000))
+        result.cancel()
+        with Assert.raises(CancelledError):
+            result.get()
+        Assert(stage.processed) < 1000
+
+    @test
+    def repr(self):
+        stage = Stage(list, workers=2)
+        Assert(repr(stage)) == 'Stage(%r, workers=2, maxsize=4)' % list
+        Assert(repr(Pipeline([stage]))) == 'Pipeline([%r])' % stage
+
+tests.register(TestPipeline)
+
+
+class TestTokenBucket(TestBase):
+    @test
+    def acquire(self):
+        bucket = TokenBucket(100, capacity=2)
+        assert bucket.acquire(blocking=False)
+        assert bucket.acquire(blocking=False)
+        assert not bucket.acquire(blocking=False)
+        assert not bucket.acquire(timeout=0.001)
+        start = time.time()
+        assert bucket.acquire()
+        Assert(time.time() - start) >= 0.005
+        with Assert.raises(ValueError):
+            bucket.acquire(3)
+
+    @test
+    def default_capacity(self):
+        Assert(TokenBucket(10).capacity) == 10
+        bucket = TokenBucket(0.5)
+        Assert(bucket.capacity) == 1
+        assert bucket.acquire(blocking=False)
+        with Assert.raises(ValueError):
+            TokenBucket(0)
+        with Assert.raises(ValueError):
+            TokenBucket(-1)
+
+    @test
+    def refill(self):
+        bucket = TokenBucket(100, capacity=2)
+        bucket.acquire(2)
+        Assert(bucket.tokens) < 1
+        time.sleep(0.05)
+        Assert(bucket.tokens) == 2
+
+    @test
+    def context_manager(self):
+        bucket = TokenBucket(1)
+        with bucket:
+            pass
+        with Assert.raises(TimeoutError):
+            with bucket.limit(blocking=False):
+                pass
+
+    @test
+    def decorator(self):
+        bucket = TokenBucket(1)
+
+        @bucket
+        def foo():
+            return 'foo'
+        Assert(foo.__name__) == 'foo'
+        Assert(foo()) == 'foo'
+        Assert(bucket.tokens) < 1
+
+    @test
+    def repr(self):
+        Assert(repr(TokenBucket(1, 2))) == 'TokenBucket(1.0, capacity=2)'
+
+tests.register(TestTokenBucket)
+
+
+class TestKeyedTokenBucket(TestBase):
+    @test
+    def acquire(self):
+        buckets = KeyedTokenBucket(1)
+        assert buckets.acquire('foo', blocking=False)
+        assert not buckets.acquire('foo', blocking=False)
+        assert buckets.acquire('bar', blocking=False)
+        Assert(buckets.get_bucket('foo')).is_(buckets.get_bucket('foo'))
+        with Assert.raises(TimeoutError):
+            with buckets.limit('bar', blocking=False):
+                pass
+        with Assert.raises(ValueError):
+            KeyedTokenBucket(0)
+
+    @test
+    def prune(self):
+        # buckets refilling this fast are full again immediately
+        buckets = KeyedTokenBucket(10 ** 9)
+        for key in xrange(buckets.prune_threshold * 10):
+            buckets.acquire(key)
+        Assert(len(buckets._buckets)) <= buckets.prune_threshold
+        assert buckets.acquire('bar', blocking=False)
+        used = KeyedTokenBucket(1, capacity=2)
+        used.acquire('foo')
+        for key in xrange(used.prune_threshold * 2):
+            used.acquire(key)
+        Assert(used.get_bucket('foo').tokens) < 2
+
+    @test
+    def timeout_with_discarded_buckets(self):
+        buckets = KeyedTokenBucket(10, capacity=1)
+
+        def get_discarded_bucket(key):
+            # an empty bucket which is never kept, as if it were pruned right
+            # after it has been returned
+            bucket = TokenBucket(10, capacity=1)
+            bucket.acquire()
+            return bucket
+        buckets.get_bucket = get_discarded_bucket
+        start = time.time()
+        assert not buckets.acquire('foo', timeout=0.15)
+        Assert(time.time() - start) < 0.3
+
+tests.register(TestKeyedTokenBucket)
+
+
+class TestKeyedSemaphore(TestBase):
+    @test
+    def acquire_release(self):
+        semaphore = KeyedSemaphore(2)
+        assert semaphore.acquire('foo')
+        assert semaphore.acquire('foo')
+        assert not semaphore.acquire('foo', blocking=False)
+        assert not semaphore.acquire('foo', timeout=0.01)
+        assert semaphore.acquire('bar', blocking=False)
+        Assert(semaphore.in_flight('foo')) == 2
+        semaphore.release('foo')
+        Assert(semaphore.in_flight('foo')) == 1
+        semaphore.release('foo')
+        semaphore.release('bar')
+        Assert(semaphore.in_flight('foo')) == 0
+        with Assert.raises(ValueError):
+            semaphore.release('foo')
+
+    @test
+    def blocking(self):
+        semaphore = KeyedSemaphore()
+        semaphore.acquire('foo')
+        acquired = []
+
+        def acquire():
+            acquired.append(semaphore.acquire('foo', timeout=5))
+        thread = Thread(target=acquire)
+        thread.start()
+        time.sleep(0.05)
+        Assert(acquired) == []
+        semaphore.release('foo')
+        thread.join()
+        Assert(acquired) == [True]
+
+    @test
+    def context_manager(self):
+        semaphore = KeyedSemaphore()
+        with semaphore.limit('foo'):
+            Assert(semaphore.in_flight('foo')) == 1
+            with Assert.raises(TimeoutError):
+                with semaphore.limit('foo', blocking=False):
+                    pass
+        Assert(semaphore.in_flight('foo')) == 0
+
+    @test
+    def decorator(self):
+        semaphore = KeyedSemaphore()
+
+        @semaphore.limit('foo')
+        def foo():
+            return semaphore.in_flight('foo')
+        Assert(foo()) == 1
+        Assert(semaphore.in_flight('foo')) == 0
+
+    @test
+    def repr(self):
+        Assert(repr(KeyedSemaphore(2))) == 'KeyedSemaphore(2)'
+
+tests.register(TestKeyedSemaphore)
+
+
+class TestRetry(TestBase):
+    @test
+    def call(self):
+        calls = []
+
+        def flaky(a, b=None):
+            calls.append((a, b))
+            if len(calls) < 3:
+                raise IOError()
+            return 'foo'
+
+        retry = Retry(attempts=3, backoff=0.001)
+        Assert(retry.call(flaky, 1, b=2).get(1)) == 'foo'
+        Assert(calls) == [(1, 2)] * 3
+
+        del calls[:]
+        retry = Retry(attempts=2, backoff=0.001)
+        with Assert.raises(IOError):
+            retry.call(flaky, 1).get(1)
+        Assert(len(calls)) == 2
+
+    @test
+    def exceptions(self):
+        calls = []
+
+        def fail():
+            calls.append(1)
+            raise ValueError()
+
+        retry = Retry(attempts=3, backoff=0.001, exceptions=(IOError, ))
+        with Assert.raises(ValueError):
+            retry.call(fail).get(1)
+        Assert(len(calls)) == 1
+
+    @test
+    def get_delay(self):
+        retry = Retry(backoff=1, multiplier=2, max_backoff=5, jitter=0)
+        Assert([retry.get_delay(n) for n in xrange(4)]) == [1, 2, 4, 5]
+        retry = Retry(backoff=1, multiplier=2, max_backoff=5, jitter=0.5)
+        for n in xrange(100):
+            Assert(retry.get_delay(2)) <= 4
+            Assert(retry.get_delay(2)) >= 2
+
+    @test
+    def budget(self):
+        calls = []
+
+        def fail():
+            calls.append(1)
+            raise IOError()
+
+        budget = RetryBudget(ratio=0, minimum=0, capacity=1)
+        retry = Retry(attempts=10, backoff=0.001, budget=budget)
+        with Assert.raises(IOError):
+            retry.call(fail).get(1)
+        Assert(len(calls)) == 2
+        Assert(budget.retries) == 0
+        assert not budget.withdraw()
+        budget.ratio = 1
+        budget.deposit()
+        assert budget.withdraw()
+
+    @test
+    def cancel(self):
+        calls = []
+
+        def fail():
+            calls.append(1)
+            raise IOError()
+
+        retry = Retry(attempts=10, backoff=0.05, jitter=0)
+        result = retry.call(fail)
+        time.sleep(0.01)
+        result.cancel()
+        time.sleep(0.1)
+        Assert(len(calls)) == 1
+
+    @test
+    def spawn(self):
+        threads = []
+
+        def spawn(function, *args):
+            thread = Thread(target=function, args=args)
+            threads.append(thread)
+            thread.start()
+
+        retry = Retry(spawn=spawn)
+        Assert(retry.call(lambda: 'foo').get(1)) == 'foo'
+        Assert(len(threads)) == 1
+
+    @test
+    def concurrent_retries(self):
+        def slow_retry(calls):
+            calls.append(1)
+            if len(calls) == 1:
+                raise IOError()
+            time.sleep(0.2)
+            return 'foo'
+
+        retry = Retry(backoff=0.001)
+        start = time.time()
+        # the retries would take a second if they were run one after another
+        results = [retry.call(slow_retry, []) for _ in xrange(5)]
+        for result in results:
+            Assert(result.get(2)) == 'foo'
+        Assert(time.time() - start) < 0.6
+
+    @test
+    def call_does_not_block(self):
+        event = Event()
+        result = Retry().call(event.wait, 1)
+        Assert(result.ready) == False
+        event.set()
+        result.get(1)
+
+    @test
+    def bounded_threads(self):
+        def fail():
+            raise IOError()
+
+        retry = Retry(attempts=5, backoff=0.001)
+        # starts the timer thread and the pool
+        with Assert.raises(IOError):
+            retry.call(fail).get(1)
+        before = activeCount()
+        results = [retry.call(fail) for _ in xrange(50)]
+        for result in results:
+            with Assert.raises(IOError):
+                result.get(2)
+        Assert(activeCount()) <= before
+
+    @test
+    def decorator(self):
+        @Retry()
+        def foo():
+            return 'foo'
+        Assert(foo.__name__) == 'foo'
+        Assert(foo().get(1)) == 'foo'
+
+tests.register(TestRetry)
+
+
+class PoolTestMixin(object):
+    pool_class = None
+
+    @test
+    def submit(self):
+        with self.pool_class(2) as pool:
+            Assert(pool.submit(lambda a, b=1: a + b, 1, b=2).get(1)) == 3
+            with Assert.raises(ZeroDivisionError):
+                pool.submit(lambda: 1 / 0).get(1)
+        with Assert.raises(RuntimeError):
+            pool.submit(lambda: None)
+
+    @test
+    def failing_callback(self):
+        def callback(value):
+            raise ValueError(value)
+
+        errors = []
+        excepthook = sys.excepthook
+        sys.excepthook = lambda *exc_info: errors.append(exc_info[0])
+        try:
+            with self.pool_class(1) as pool:
+                event = Event()
+                pool.submit(event.wait, 1)
+                pool.submit(lambda: 'foo').callback = callback
+                pool.submit(lambda: 1 / 0).errback = callback
+                event.set()
+                Assert(pool.submit(lambda: 'bar').get(1)) == 'bar'
+        finally:
+            sys.excepthook = excepthook
+        Assert(errors) == [ValueError, ValueError]
+
+    @test
+    def map(self):
+        with self.pool_class(4) as pool:
+            Assert(pool.map(lambda x: x * 2, xrange(100))) == range(0, 200, 2)
+
+    @test
+    def close(self):
+        pool = self.pool_class(2)
+        results = [pool.submit(time.sleep, 0.01) for _ in xrange(10)]
+        pool.close()
+        pool.join()
+        for result in results:
+            assert result.ready
+
+    @test
+    def cancel(self):
+        called = []
+        with self.pool_class(1) as pool:
+            pool.submit(time.sleep, 0.05)
+            result = pool.submit(called.append, 1)
+            result.cancel()
+        Assert(called) == []
+
+    @test
+    def metrics(self):
+        events = []
+        metrics = PoolMetrics(hook=lambda *args: events.append(args))
+        with self.pool_class(2, metrics=metrics) as pool:
+            Assert(metrics.workers) == 2
+            pool.submit(time.sleep, 0.01)
+            with Assert.raises(ZeroDivisionError):
+                pool.submit(lambda: 1 / 0).get(1)
+        Assert(metrics.submitted) == 2
+        Assert(metrics.completed) == 2
+        Assert(metrics.errors) == 1
+        Assert(metrics.busy) == 0
+        Assert(metrics.queue_wait.count) == 2
+        Assert(metrics.run_time.count) == 2
+        Assert(metrics.run_time.max) >= 0.01
+        Assert(metrics.queue_depth.count) == 2
+        Assert(metrics.utilization) > 0
+        Assert(metrics.utilization) <= 1
+        Assert(sorted(event for event, _ in events)) == [
+            'end', 'end', 'start', 'start'
+        ]
+        for event, record in events:
+            Assert(record.queue_wait) >= 0
+            if event == 'end':
+                Assert(record.run_time) >= 0
+
+    @test
+    def repr(self):
+        with self.pool_class(2) as pool:
+            Assert(repr(pool)) == '%s(2)' % self.pool_class.__name__
+
+
+class TestHistogram(TestBase):
+    @test
+    def add(self):
+        histogram = Histogram([1, 2, 4])
+        Assert(histogram.mean) == None
+        Assert(histogram.percentile(50)) == None
+        for value in [0, 1, 1.5, 3, 4, 10]:
+            histogram.add(value)
+        Assert(histogram.count) == 6
+        Assert(histogram.min) == 0
+        Assert(histogram.max) == 10
+        Assert(histogram.mean) == 19.5 / 6
+        Assert(histogram.buckets()) == [
+            (1, 2), (2, 1), (4, 2), (float('inf'), 1)
+        ]
+
+    @test
+    def percentile(self):
+        histogram = Histogram([1, 2, 4])
+        for value in [0.5] * 50 + [1.5] * 40 + [3] * 9 + [100]:
+            histogram.add(value)
+        Assert(histogram.percentile(50)) == 1
+        Assert(histogram.percentile(90)) == 2
+        Assert(histogram.percentile(99)) == 4
+        Assert(histogram.percentile(100)) == 100
+
+    @test
+    def repr(self):
+        Assert(repr(Histogram([2, 1]))) == 'Histogram([1, 2])'
+
+tests.register(TestHistogram)
+
+
+class TestThreadPool(TestBase, PoolTestMixin):
+    pool_class = ThreadPool
+
+tests.register(TestThreadPool)
+
+
+class TestWorkStealingPool(TestBase, PoolTestMixin):
+    pool_class = WorkStealingPool
+
+    @test
+    def nested(self):
+        def fib(pool, n):
+            if n < 2:
+                return n
+            a = pool.submit(fib, pool, n - 1)
+            b = pool.submit(fib, pool, n - 2)
+            return a, b
+
+        def resolve(value):
+            if isinstance(value, tuple):
+                return sum(resolve(result.get(5)) for result in value)
+            return value
+
+        with WorkStealingPool(4) as pool:
+            Assert(resolve(pool.submit(fib, pool, 10).get(5))) == 55
+
+    @test
+    def stealing(self):
+        threads = set()
+
+        def task():
+            threads.add(currentThread())
+            time.sleep(0.01)
+
+        def spawn(pool):
+            # tasks submitted by a worker end up in its own queue
+            return [pool.submit(task) for _ in xrange(8)]
+
+        with WorkStealingPool(4) as pool:
+            for result in pool.submit(spawn, pool).get(5):
+                result.get(5)
+        Assert(len(threads)) > 1
+
+tests.register(TestWorkStealingPool)
+
+
+class TestScheduler(TestBase):
+    @test
+    def call_later(self):
+        scheduler = Scheduler()
+        start = time.time()
+        result = scheduler.call_later(0.05, lambda a, b=None: (a, b), 1, b=2)
+        Assert(result.get(1)) == (1, 2)
+        Assert(time.time() - start) >= 0.05
+
+        result = scheduler.call_at(time.time() + 0.01, lambda: 1 / 0)
+        with Assert.raises(ZeroDivisionError):
+            result.get(1)
+
+    @test
+    def order(self):
+        scheduler = Scheduler()
+        calls = []
+        results = [
+            scheduler.call_later(delay, calls.append, delay)
+            for delay in [0.03, 0.01, 0.02]
+        ]
+        for result in results:
+            result.get(1)
+        Assert(calls) == [0.01, 0.02, 0.03]
+
+    @test
+    def cancel(self):
+        scheduler = Scheduler()
+        calls = []
+        scheduler.call_later(0.01, calls.append, 1).cancel()
+        scheduler.call_later(0.02, calls.append, 2).get(1)
+        Assert(calls) == [2]
+
+    @test
+    def single_thread(self):
+        scheduler = Scheduler()
+        threads = activeCount()
+        results = [
+            scheduler.call_later(0.01, lambda: None) for _ in xrange(1000)
+        ]
+        Assert(activeCount()) <= threads + 1
+        for result in results:
+            result.get(1)
+
+    @test
+    def close(self):
+        threads = activeCount()
+        scheduler = Scheduler()
+        calls = []
+        scheduler.call_later(0.01, calls.append, 1).get(1)
+        Assert(activeCount()) == threads + 1
+        pending = scheduler.call_later(10, calls.append, 2)
+        repeated = scheduler.call_fixed_delay(10, calls.append, 3)
+        assert not scheduler.closed
+        scheduler.close()
+        assert scheduler.closed
+        Assert(activeCount()) == threads
+        assert pending.cancelled
+        assert repeated.cancelled
+        with Assert.raises(RuntimeError):
+            scheduler.call_later(0.01, calls.append, 4)
+        Assert(calls) == [1]
+
+        with Scheduler() as scheduler:
+            Assert(scheduler.call_later(0.01, lambda: 1).get(1)) == 1
+        assert scheduler.closed
+
+    @test
+    def call_fixed_rate(self):
+        scheduler = Scheduler()
+        calls = []
+        result = scheduler.call_fixed_rate(0.01, lambda: calls.append(1))
+        time.sleep(0.1)
+        result.cancel()
+        Assert(len(calls)) >= 3
+        Assert(len(calls)) <= 10
+        count = len(calls)
+        time.sleep(0.05)
+        Assert(len(calls)) == count
+
+    @test
+    def call_fixed_delay(self):
+        scheduler = Scheduler()
+        calls = []
+
+        def function():
+            calls.append(time.time())
+            if len(calls) == 3:
+                raise ValueError()
+        result = scheduler.call_fixed_delay(0.01, function)
+        with Assert.raises(ValueError):
+            result.get(1)
+        Assert(len(calls)) == 3
+        Assert(calls[2] - calls[1]) >= 0.01
+
+    @test
+    def pool(self):
+        threads = []
+        with ThreadPool(1) as pool:
+            scheduler = Scheduler(pool)
+            result = scheduler.call_later(
+                0, lambda: threads.append(currentThread())
+            )
+            result.get(1)
+        Assert(threads) == pool._threads
+
+tests.register(TestScheduler)
+
+
+def _make_data(size):
+    return 'x' * size
+
+
+class TestSharedBuffer(TestBase):
+    @test
+    def from_object(self):
+        objects = [
+            ('foo' * 100, 'foo' * 100),
+            (bytearray('foo' * 100), bytearray('foo' * 100)),
+            (array('i', range(100)), array('i', range(100))),
+            (buffer('foo' * 100), 'foo' * 100)
+        ]
+        for obj, expected in objects:
+            shared = SharedBuffer.from_object(obj)
+            assert os.path.exists(shared.path)
+            loaded = shared.load()
+            Assert(loaded) == expected
+            Assert(type(loaded)).is_(type(expected))
+            assert not os.path.exists(shared.path)
+
+        with Assert.raises(TypeError):
+            SharedBuffer.from_object(object())
+        for empty in ['', bytearray(), array('i')]:
+            with Assert.raises(ValueError):
+                SharedBuffer.from_object(empty)
+
+    @test
+    def allocate(self):
+        shared, mapping = SharedBuffer.allocate(6)
+        mapping.write('foobar')
+        mapping.close()
+        mapping = shared.open()
+        assert not os.path.exists(shared.path)
+        Assert(mapping[:3]) == 'foo'
+        mapping.close()
+        with Assert.raises(ValueError):
+            SharedBuffer.allocate(0)
+
+    @test
+    def pickle(self):
+        shared = SharedBuffer.from_object(array('d', [1.0, 2.0]))
+        unpickled = pickle.loads(pickle.dumps(shared))
+        Assert(unpickled.load()) == array('d', [1.0, 2.0])
+
+    @test
+    def discard(self):
+        shared = SharedBuffer.from_object('foo')
+        shared.discard()
+        assert not os.path.exists(shared.path)
+        shared.discard()
+
+    @test
+    def share_unshare(self):
+        Assert(share('foo', threshold=4)) == 'foo'
+        Assert(share(1, threshold=0)) == 1
+        Assert(share('', threshold=0)) == ''
+        Assert(share(array('i'), threshold=0)) == array('i')
+        shared = share('foo', threshold=3)
+        Assert.isinstance(shared, SharedBuffer)
+        Assert(unshare(shared)) == 'foo'
+        Assert(unshare('foo')) == 'foo'
+
+    @test_if(multiprocessing)
+    def shared_result(self):
+        pool = multiprocessing.Pool(1)
+        try:
+            function = SharedResult(_make_data, threshold=1024)
+            shared = pool.apply(function, (4096, ))
+            Assert.isinstance(shared, SharedBuffer)
+            Assert(unshare(shared)) == 'x' * 4096
+            Assert(pool.apply(function, (10, ))) == 'x' * 10
+        finally:
+            pool.terminate()
+
+tests.register(TestSharedBuffer)